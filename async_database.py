@@ -0,0 +1,102 @@
+import asyncio
+import contextvars
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterator
+
+from database import Database
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()  # Конец генератора в run_steps
+
+class AsyncDatabase:
+    """Асинхронная обертка над Database.
+    
+    Все запросы выполняются в выделенных потоках БД, поэтому медленный
+    fsync не блокирует event loop. Методы повторяют API Database,
+    но возвращают корутины: `user = await db.get_user(user_id)`.
+    """
+    
+    def __init__(self, db: Database, max_pending: int = 1000, workers: int = 1):
+        self.db = db
+        self.max_pending = max_pending
+        # Каждый поток — свой однопоточный пул. Для одного файла достаточно
+        # одного: SQLite все равно пропускает одного писателя. Шардированной
+        # базе — поток на шард: запросы пользователя идут в поток его шарда
+        # (db.executor_index), и ставки на разных шардах пишутся параллельно.
+        # Операции по всем шардам (settle_round, refund_open_bets,
+        # settle_jackpot, archive_steps и т. п.) идут в поток 0 со своими
+        # подключениями к каждому шарду: их записи конкурируют с потоком
+        # шарда за блокировку файла и ждут на busy_timeout. Они редкие и
+        # пишут по шарду короткими транзакциями, поэтому ожидание короткое.
+        self._executors = [
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"db{index}")
+            for index in range(workers)
+        ]
+        self._executor_index = getattr(db, "executor_index", None)
+        # Ограничение очереди: при переполнении вызывающие ждут, а не копят задачи
+        self._pending = asyncio.Semaphore(max_pending)
+    
+    async def _submit(self, executor: ThreadPoolExecutor, func: Callable, *args, **kwargs) -> Any:
+        async with self._pending:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                executor,
+                functools.partial(contextvars.copy_context().run, func, *args, **kwargs)
+            )
+    
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """Выполнить функцию в потоке БД (с contextvars вызывающего, как asyncio.to_thread)"""
+        return await self._submit(self._executors[0], func, *args, **kwargs)
+    
+    async def run_steps(self, steps: Iterator) -> Any:
+        """Выполнить генератор в потоке БД по шагам и вернуть последний шаг.
+        
+        Каждый шаг — отдельная задача пула, поэтому длинная фоновая работа
+        (архивация) не занимает поток БД целиком: между шагами выполняются
+        обычные запросы.
+        """
+        last = None
+        while True:
+            step = await self.run(next, steps, _DONE)
+            if step is _DONE:
+                return last
+            last = step
+    
+    def __getattr__(self, name: str):
+        attr = getattr(self.db, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+        
+        if self._executor_index is None or len(self._executors) == 1:
+            @functools.wraps(attr)
+            async def method(*args, **kwargs):
+                return await self._submit(self._executors[0], attr, *args, **kwargs)
+        else:
+            @functools.wraps(attr)
+            async def method(*args, **kwargs):
+                index = self._executor_index(name, args) % len(self._executors)
+                return await self._submit(self._executors[index], attr, *args, **kwargs)
+        
+        # Кэшируем обертку, чтобы __getattr__ не вызывался повторно
+        setattr(self, name, method)
+        return method
+    
+    async def close(self):
+        """Дождаться запросов в очереди и закрыть подключения"""
+        # Занять всю очередь: запросы во всех потоках, в том числе в потоках
+        # шардов, к этому моменту закончены, и db.close не закроет
+        # подключения у них на ходу
+        for _ in range(self.max_pending):
+            await self._pending.acquire()
+        try:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self._executors[0], self.db.close)
+            for executor in self._executors:
+                executor.shutdown(wait=True)
+        finally:
+            for _ in range(self.max_pending):
+                self._pending.release()
+        logger.info("✅ Поток базы данных остановлен")
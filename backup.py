@@ -0,0 +1,212 @@
+import argparse
+import glob
+import gzip
+import logging
+import os
+import shutil
+import sqlite3
+import time
+from datetime import datetime
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+COPY_CHUNK = 1024 * 1024  # Размер блока при сжатии/распаковке
+
+def backup_file(db_path: str, dest_path: str, pages: int = 1024, pause: float = 0.005) -> int:
+    """Снимок базы через sqlite3 backup API, не блокируя писателей.
+    
+    Копирование идет шагами по `pages` страниц с паузой между шагами.
+    Исходное подключение держит одну транзакцию чтения: в режиме WAL
+    писатели продолжают работу, а копия соответствует моменту начала
+    (без перезапусков копирования при каждой записи). Возвращает число страниц.
+    """
+    source = sqlite3.connect(db_path)
+    target = sqlite3.connect(dest_path)
+    try:
+        source.execute("BEGIN")
+        source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()  # Фиксируем снимок
+        total = source.execute("PRAGMA page_count").fetchone()[0]
+        source.backup(target, pages=pages, sleep=pause)
+        source.rollback()
+        return total
+    finally:
+        target.close()
+        source.close()
+
+def _remove(path: str):
+    """Удалить недописанный файл, если он есть"""
+    if os.path.exists(path):
+        os.remove(path)
+
+def _compress(path: str) -> str:
+    """Сжать файл gzip и удалить исходный"""
+    gz_path = f"{path}.gz"
+    tmp_path = f"{gz_path}.tmp"
+    try:
+        with open(path, "rb") as src, gzip.open(tmp_path, "wb", compresslevel=6) as dst:
+            shutil.copyfileobj(src, dst, COPY_CHUNK)
+        os.replace(tmp_path, gz_path)
+    except Exception:
+        _remove(tmp_path)
+        raise
+    os.remove(path)
+    return gz_path
+
+def backup_name(db_path: str, backup_dir: str, stamp: str) -> str:
+    """Имя файла копии: <база>_<YYYYmmdd_HHMMSS>.db"""
+    base = os.path.splitext(os.path.basename(db_path))[0]
+    return os.path.join(backup_dir, f"{base}_{stamp}.db")
+
+def create_backup(db_path: str, backup_dir: str, compress: bool = True,
+                  pages: int = 1024, pause: float = 0.005, stamp: str = None) -> str:
+    """Сделать копию одного файла базы в backup_dir, вернуть путь"""
+    os.makedirs(backup_dir, exist_ok=True)
+    stamp = stamp or datetime.now().strftime("%Y%m%d_%H%M%S")
+    path = backup_name(db_path, backup_dir, stamp)
+    tmp_path = f"{path}.tmp"
+    
+    started = time.perf_counter()
+    try:
+        total = backup_file(db_path, tmp_path, pages, pause)
+        os.replace(tmp_path, path)  # Незаконченная копия никогда не выглядит готовой
+    except Exception:
+        _remove(tmp_path)
+        raise
+    if compress:
+        path = _compress(path)
+    
+    logger.info(
+        f"💾 Резервная копия {path}: {total} страниц, "
+        f"{os.path.getsize(path) / 1024 / 1024:.1f} МБ за {time.perf_counter() - started:.1f} сек"
+    )
+    return path
+
+def list_backups(db_path: str, backup_dir: str) -> List[str]:
+    """Копии базы, от новых к старым"""
+    base = os.path.splitext(os.path.basename(db_path))[0]
+    paths = glob.glob(os.path.join(backup_dir, f"{base}_*.db")) + \
+        glob.glob(os.path.join(backup_dir, f"{base}_*.db.gz"))
+    return sorted(paths, reverse=True)  # Метка времени в имени сортируется как строка
+
+def rotate_backups(db_path: str, backup_dir: str, keep: int) -> List[str]:
+    """Удалить старые копии, оставив keep последних"""
+    removed = list_backups(db_path, backup_dir)[keep:]
+    for path in removed:
+        os.remove(path)
+        logger.info(f"🗑 Удалена старая копия {path}")
+    return removed
+
+def backup_archives(db_path: str, backup_dir: str, archive_dir: str = None, compress: bool = True,
+                    pages: int = 1024, pause: float = 0.005) -> List[str]:
+    """Копии архивов журнала (<база>_archive_<месяц>.db) в backup_dir/archive.
+    
+    Перенесенные транзакции есть только в архивах, поэтому их копии не
+    ротируются: на месяц одна копия, и она обновляется, только если архив
+    менялся после нее (дозапись месяца при следующей архивации). archive_dir —
+    как в Database.archive_steps, по умолчанию папка базы. Восстановление:
+    python backup.py restore <копия> --db <архив>. Возвращает обновленные копии.
+    """
+    base = os.path.splitext(os.path.basename(db_path))[0]
+    directory = archive_dir or os.path.dirname(os.path.abspath(db_path))
+    target_dir = os.path.join(backup_dir, "archive")
+    paths = []
+    for archive_path in sorted(glob.glob(os.path.join(directory, f"{base}_archive_*.db"))):
+        path = os.path.join(target_dir, os.path.basename(archive_path))
+        copy = f"{path}.gz" if compress else path
+        if os.path.exists(copy) and os.path.getmtime(copy) >= os.path.getmtime(archive_path):
+            continue
+        
+        os.makedirs(target_dir, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        try:
+            backup_file(archive_path, tmp_path, pages, pause)
+            os.replace(tmp_path, path)
+        except Exception:
+            _remove(tmp_path)
+            raise
+        paths.append(_compress(path) if compress else path)
+        logger.info(f"💾 Копия архива {paths[-1]}")
+    return paths
+
+def backup_database(db, backup_dir: str, keep: int = 7, compress: bool = True,
+                    pages: int = 1024, pause: float = 0.005, archive_dir: str = None) -> List[str]:
+    """Копия всех файлов базы (Database или ShardedDatabase) с ротацией и их архивов"""
+    db.flush_transactions()  # Журнал из буфера отложенной записи тоже попадает в копию
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    paths = []
+    for shard in getattr(db, "shards", [db]):
+        paths.append(create_backup(shard.db_path, backup_dir, compress, pages, pause, stamp))
+        rotate_backups(shard.db_path, backup_dir, keep)
+        paths.extend(backup_archives(shard.db_path, backup_dir, archive_dir, compress, pages, pause))
+    return paths
+
+def restore_backup(backup_path: str, db_path: str) -> bool:
+    """Восстановить базу из копии (бот должен быть остановлен).
+    
+    Копия распаковывается рядом с базой и проверяется через
+    PRAGMA integrity_check, только потом заменяет файл базы.
+    Текущая база сохраняется как <db>.before_restore.
+    """
+    tmp_path = f"{db_path}.restore"
+    try:
+        if backup_path.endswith(".gz"):
+            with gzip.open(backup_path, "rb") as src, open(tmp_path, "wb") as dst:
+                shutil.copyfileobj(src, dst, COPY_CHUNK)
+        else:
+            shutil.copyfile(backup_path, tmp_path)
+        
+        conn = sqlite3.connect(tmp_path)
+        try:
+            result = conn.execute("PRAGMA integrity_check").fetchone()[0]
+        finally:
+            conn.close()
+        if result != "ok":
+            logger.error(f"❌ Копия {backup_path} повреждена: {result}")
+            os.remove(tmp_path)
+            return False
+        
+        if os.path.exists(db_path):
+            os.replace(db_path, f"{db_path}.before_restore")
+        for suffix in ("-wal", "-shm"):
+            # WAL старой базы не должен примениться к восстановленной
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+        os.replace(tmp_path, db_path)
+        logger.info(f"✅ База {db_path} восстановлена из {backup_path}")
+        return True
+    except Exception as e:
+        logger.error(f"❌ Ошибка восстановления из {backup_path}: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
+
+def latest_backup(db_path: str, backup_dir: str) -> Optional[str]:
+    """Последняя копия базы или None"""
+    backups = list_backups(db_path, backup_dir)
+    return backups[0] if backups else None
+
+if __name__ == "__main__":
+    # python backup.py backup | python backup.py restore <файл> [--db monkey_stars.db]
+    from config import Config
+    
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Резервные копии базы Monkey Stars")
+    parser.add_argument("action", choices=["backup", "restore", "list"])
+    parser.add_argument("path", nargs="?", help="Файл копии для restore (по умолчанию последняя)")
+    parser.add_argument("--db", default="monkey_stars.db")
+    parser.add_argument("--dir", default=Config.BACKUP_DIR)
+    args = parser.parse_args()
+    
+    if args.action == "backup":
+        create_backup(args.db, args.dir, Config.BACKUP_COMPRESS,
+                      Config.BACKUP_PAGES_PER_STEP, Config.BACKUP_STEP_PAUSE_MS / 1000)
+        backup_archives(args.db, args.dir, Config.ARCHIVE_DIR, Config.BACKUP_COMPRESS,
+                        Config.BACKUP_PAGES_PER_STEP, Config.BACKUP_STEP_PAUSE_MS / 1000)
+    elif args.action == "list":
+        for path in list_backups(args.db, args.dir):
+            print(path)
+    else:
+        path = args.path or latest_backup(args.db, args.dir)
+        if not path or not restore_backup(path, args.db):
+            raise SystemExit(1)
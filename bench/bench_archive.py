@@ -0,0 +1,82 @@
+"""Архивация журнала под нагрузкой: скорость переноса и задержка ставок.
+
+    python bench/bench_archive.py --rows 50000000 --compact incremental full
+
+Журнал заполняется rows строками старше срока архивации, затем архивация
+идет через AsyncDatabase.run_steps, пока игроки делают ставки (settle_bet).
+Печатает строк/с архивации и задержку ставок p50/p99/max.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from async_database import AsyncDatabase
+from database import Database
+
+USERS = 1000
+
+def fill(db: Database, rows: int, chunk: int = 100_000):
+    for user_id in range(1, USERS + 1):
+        db.create_user(user_id, f"u{user_id}")
+        db.update_balance(user_id, 1_000_000)
+    old = int(time.time()) - 400 * 86400
+    rng = random.Random(1)
+    for offset in range(0, rows, chunk):
+        with db.get_connection() as conn:
+            conn.executemany(
+                "INSERT INTO transactions (user_id, amount, type, description, created_at) VALUES (?, ?, ?, ?, ?)",
+                ((rng.randrange(1, USERS + 1), 1.0, "click", "Кликер", old + (offset + i) // 20)
+                 for i in range(min(chunk, rows - offset)))
+            )
+
+async def run(rows: int, compact: str, batch_size: int, vacuum_pages: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        raw = Database(os.path.join(tmp, "bench.db"))
+        fill(raw, rows)
+        db = AsyncDatabase(raw)
+        latencies = []
+        
+        async def player():
+            rng = random.Random()
+            while not archive.done():
+                started = time.perf_counter()
+                await db.settle_bet(rng.randrange(1, USERS + 1), "dice", 1.0, 0.0)
+                latencies.append(time.perf_counter() - started)
+                await asyncio.sleep(0.005)
+        
+        started = time.perf_counter()
+        archive = asyncio.ensure_future(db.run_steps(
+            raw.archive_steps(90, os.path.join(tmp, "archive"), batch_size, compact, vacuum_pages)
+        ))
+        await asyncio.gather(archive, *(player() for _ in range(8)))
+        elapsed = time.perf_counter() - started
+        await db.close()
+    
+    latencies.sort()
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000 if latencies else 0.0
+    moved = sum((archive.result() or {}).values())
+    print(f"{compact or 'none':12s} строк: {moved:>10d}  {moved / elapsed:8.0f} строк/с  "
+          f"ставки p50 {percentile(0.5):6.1f} мс  p99 {percentile(0.99):7.1f} мс  max {latencies[-1] * 1000 if latencies else 0:8.1f} мс")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=50_000_000)
+    parser.add_argument("--compact", nargs="+", default=["incremental", "full"])
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--vacuum-pages", type=int, default=1000)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    
+    for compact in args.compact:
+        asyncio.run(run(args.rows, "" if compact == "none" else compact, args.batch_size, args.vacuum_pages))
+
+if __name__ == "__main__":
+    main()
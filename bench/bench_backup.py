@@ -0,0 +1,120 @@
+"""Горячая резервная копия под нагрузкой: время копии и задержка ставок.
+
+    python bench/bench_backup.py --size-mb 2000
+
+База заполняется журналом до size_mb мегабайт, затем игроки делают ставки
+(settle_bet) сначала без копии, потом во время backup_database. Печатает
+задержку ставок p50/p99/max в обоих режимах, время копии и сверяет копию:
+integrity_check и сумму балансов со счетчиком stats в самой копии (в
+согласованном снимке они равны).
+"""
+import argparse
+import asyncio
+import gzip
+import logging
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from async_database import AsyncDatabase
+from backup import backup_database
+from database import Database
+
+USERS = 1000
+ROW_BYTES = 250  # Примерный размер строки журнала на диске
+
+def fill(db: Database, size_mb: int, chunk: int = 100_000):
+    for user_id in range(1, USERS + 1):
+        db.create_user(user_id, f"u{user_id}")
+        db.update_balance(user_id, 1_000_000)
+    rows = size_mb * 1024 * 1024 // ROW_BYTES
+    rng = random.Random(1)
+    now = int(time.time())
+    for offset in range(0, rows, chunk):
+        with db.get_connection() as conn:
+            conn.executemany(
+                "INSERT INTO transactions (user_id, amount, type, description, created_at) VALUES (?, ?, ?, ?, ?)",
+                ((rng.randrange(1, USERS + 1), 1.0, "click", "Кликер " + "x" * 150, now - i)
+                 for i in range(min(chunk, rows - offset)))
+            )
+
+def percentiles(latencies):
+    latencies = sorted(latencies)
+    def at(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000 if latencies else 0.0
+    return at(0.5), at(0.99), latencies[-1] * 1000 if latencies else 0.0
+
+async def play(db: AsyncDatabase, until) -> list:
+    """Ставки из 8 задач, пока until() не вернет True"""
+    latencies = []
+    
+    async def player():
+        rng = random.Random()
+        while not until():
+            started = time.perf_counter()
+            await db.settle_bet(rng.randrange(1, USERS + 1), "dice", 1.0, 0.0)
+            latencies.append(time.perf_counter() - started)
+            await asyncio.sleep(0.005)
+    
+    await asyncio.gather(*(player() for _ in range(8)))
+    return latencies
+
+async def run(size_mb: int, idle_seconds: float, pages: int, pause: float, compress: bool):
+    with tempfile.TemporaryDirectory() as tmp:
+        raw = Database(os.path.join(tmp, "bench.db"))
+        fill(raw, size_mb)
+        db = AsyncDatabase(raw)
+        print(f"База: {os.path.getsize(raw.db_path) / 1024 / 1024:.0f} МБ")
+        
+        deadline = time.monotonic() + idle_seconds
+        idle = await play(db, lambda: time.monotonic() >= deadline)
+        
+        started = time.perf_counter()
+        backup = asyncio.ensure_future(asyncio.to_thread(
+            backup_database, raw, os.path.join(tmp, "backups"),
+            compress=compress, pages=pages, pause=pause
+        ))
+        during = await play(db, backup.done)
+        elapsed = time.perf_counter() - started
+        await db.close()
+        
+        path = backup.result()[0]
+        if path.endswith(".gz"):
+            with gzip.open(path, "rb") as src, open(path[:-3], "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            path = path[:-3]
+        conn = sqlite3.connect(path)
+        try:
+            integrity = conn.execute("PRAGMA integrity_check").fetchone()[0]
+            balance = conn.execute("SELECT SUM(balance) FROM users").fetchone()[0]
+            stored = conn.execute("SELECT value FROM stats WHERE key = 'total_balance'").fetchone()[0]
+        finally:
+            conn.close()
+    
+    for name, latencies in (("без копии", idle), ("во время копии", during)):
+        p50, p99, worst = percentiles(latencies)
+        print(f"{name:16s} ставок: {len(latencies):>7d}  p50 {p50:6.1f} мс  p99 {p99:7.1f} мс  max {worst:8.1f} мс")
+    print(f"Копия за {elapsed:.1f} сек, integrity_check: {integrity}, "
+          f"SUM(balance) {'совпадает' if abs(stored - balance) < 1e-6 else 'НЕ совпадает'} со stats "
+          f"({balance:.2f} / {stored:.2f})")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-mb", type=int, default=2000)
+    parser.add_argument("--idle-seconds", type=float, default=5)
+    parser.add_argument("--pages", type=int, default=1024)
+    parser.add_argument("--pause-ms", type=float, default=5)
+    parser.add_argument("--no-compress", action="store_true")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    
+    asyncio.run(run(args.size_mb, args.idle_seconds, args.pages, args.pause_ms / 1000, not args.no_compress))
+
+if __name__ == "__main__":
+    main()
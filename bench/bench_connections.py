@@ -0,0 +1,62 @@
+"""Подключение на вызов против долгоживущих подключений Database.
+
+    python bench/bench_connections.py -n 5000
+
+"До" — sqlite3.connect() на каждый вызов с настройками SQLite по
+умолчанию (журнал DELETE, synchronous=FULL), как было до постоянных
+подключений. "После" — Database как есть. Кэш пользователей отключен,
+чтобы get_user каждый раз ходил в базу.
+"""
+import argparse
+import logging
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+
+class PerCallDatabase(Database):
+    """Новое подключение на каждый вызов"""
+    
+    def get_connection(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+def run(cls, path: str, n: int):
+    db = cls(path, user_cache_size=0)
+    users = 100
+    for user_id in range(1, users + 1):
+        db.create_user(user_id, f"u{user_id}")
+    
+    result = {}
+    for name, call in (
+        ("get_user", lambda i: db.get_user(i % users + 1)),
+        ("update_balance", lambda i: db.update_balance(i % users + 1, 1.0)),
+        ("add_transaction", lambda i: db.add_transaction(i % users + 1, 1.0, "click", "Кликер")),
+    ):
+        started = time.perf_counter()
+        for i in range(n):
+            call(i)
+        result[name] = n / (time.perf_counter() - started)
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-n", "--ops", type=int, default=5000)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        before = run(PerCallDatabase, os.path.join(tmp, "before.db"), args.ops)
+        after = run(Database, os.path.join(tmp, "after.db"), args.ops)
+    for name in before:
+        print(f"{name:16s} до {before[name]:9.0f} оп/с   после {after[name]:9.0f} оп/с   "
+              f"x{after[name] / before[name]:.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Нагрузка на общий раунд Banana Crash.
+
+    python bench/bench_crash_round.py --players 5000 --rounds 3
+
+players игроков одновременно входят в раунд (списание ставки в базе),
+во время роста множителя часть из них забирает выигрыш, после краша
+ставки рассчитываются одной транзакцией. Telegram заменен заглушкой,
+которая считает правки. Каждый раунд пересчитывается по раскрытому зерну.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from async_database import AsyncDatabase
+from crash_round import CrashRoundScheduler
+from database import Database
+from fair_rng import SeedChainPool
+
+class FakeBot:
+    def __init__(self):
+        self.edits = 0
+    
+    async def edit_message_text(self, *args, **kwargs):
+        self.edits += 1
+
+async def run(players: int, rounds: int, edit_rate: float):
+    with tempfile.TemporaryDirectory() as tmp:
+        raw = Database(os.path.join(tmp, "bench.db"))
+        for user_id in range(1, players + 1):
+            raw.create_user(user_id, f"u{user_id}")
+            raw.update_balance(user_id, 1000)
+        db = AsyncDatabase(raw)
+        bot = FakeBot()
+        pool = SeedChainPool(chain_length=100)
+        scheduler = CrashRoundScheduler(bot, db, betting_time=2, growth=1.0, tick=0.1,
+                                        pause=0.5, edit_rate=edit_rate, seeds=pool)
+        await scheduler.start()
+        rng = random.Random(1)
+        
+        for _ in range(rounds):
+            while not scheduler.accepting_bets:
+                await asyncio.sleep(0.01)
+            round_ = scheduler.round
+            started = time.perf_counter()
+            joined = await asyncio.gather(*(
+                scheduler.join(user_id, 1.0, user_id, user_id) for user_id in range(1, players + 1)
+            ))
+            join_time = time.perf_counter() - started
+            
+            # Каждый тик часть игроков забирает выигрыш
+            while round_.phase != "running" or round_.started_at is None:
+                await asyncio.sleep(0.01)
+            while round_.phase == "running":
+                for user_id in rng.sample(range(1, players + 1), players // 20):
+                    scheduler.cash_out(user_id)
+                await asyncio.sleep(0.05)
+            
+            verified = scheduler.round_crash_point(round_.server_seed, round_.id) == round_.crash_point
+            print(f"раунд {round_.id}: вошли {sum(b is not None for b in joined)} за {join_time:.2f} с "
+                  f"({players / join_time:.0f}/с), краш x{round_.crash_point:.2f}, "
+                  f"забрали {len(round_.cashouts)}, правок всего {bot.edits}, зерно {'✅' if verified else '❌'}")
+        
+        await scheduler.shutdown()
+        pool.close()
+        await db.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--players", type=int, default=5000)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--edit-rate", type=float, default=20)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    asyncio.run(run(args.players, args.rounds, args.edit_rate))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""Журнал транзакций: commit на строку против отложенной записи пачками.
+
+    python bench/bench_ledger.py -n 50000
+
+Пишет n строк через Database.add_transaction в обоих режимах; время
+отложенной записи включает close(), то есть запись остатка на диск.
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+
+def run(path: str, n: int, write_behind: bool):
+    db = Database(path, ledger_write_behind=write_behind)
+    db.create_user(1, "bench")
+    started = time.perf_counter()
+    for _ in range(n):
+        db.add_transaction(1, 1.0, "click", "Кликер")
+    db.close()
+    elapsed = time.perf_counter() - started
+    metrics = db.get_ledger_metrics() if write_behind else {}
+    
+    check = Database(path)
+    rows = check.get_connection().execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+    check.close()
+    return n / elapsed, rows, metrics
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-n", "--rows", type=int, default=50_000)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        for write_behind in (False, True):
+            rate, rows, metrics = run(os.path.join(tmp, f"ledger{int(write_behind)}.db"), args.rows, write_behind)
+            mode = "пачками" if write_behind else "по строке"
+            print(f"{mode:10s} {rate:9.0f} строк/с, записано {rows}" + (
+                f", пачек {metrics['flushes']:.0f}, наибольшая {metrics['max_flush_size']:.0f}, "
+                f"наибольшая очередь {metrics['max_queue_depth']:.0f}" if metrics else ""
+            ))
+
+if __name__ == "__main__":
+    main()
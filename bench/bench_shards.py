@@ -0,0 +1,61 @@
+"""Пропускная способность ставок: один файл против шардов.
+
+    python bench/bench_shards.py --bets 20000 --shards 1 2 4
+
+Ставки (settle_bet) идут из concurrency задач через AsyncDatabase так же,
+как в боте: один поток для одного файла, поток на шард для шардов.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from async_database import AsyncDatabase
+from database import Database
+from sharding import ShardedDatabase
+
+async def run(shards: int, bets: int, users: int, concurrency: int) -> float:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        if shards > 1:
+            db = AsyncDatabase(ShardedDatabase(path, shards=shards), workers=shards)
+        else:
+            db = AsyncDatabase(Database(path))
+        for user_id in range(1, users + 1):
+            await db.create_user(user_id, f"u{user_id}")
+            await db.update_balance(user_id, 1_000_000)
+        
+        rng = random.Random(1)
+        queue = [rng.randrange(1, users + 1) for _ in range(bets)]
+        
+        async def player(offset: int):
+            for user_id in queue[offset::concurrency]:
+                await db.settle_bet(user_id, "dice", 1.0, rng.choice((0.0, 2.0)))
+        
+        started = time.perf_counter()
+        await asyncio.gather(*(player(offset) for offset in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        await db.close()
+        return bets / elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--bets", type=int, default=20_000)
+    parser.add_argument("--users", type=int, default=1_000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 4])
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    
+    for shards in args.shards:
+        rate = asyncio.run(run(shards, args.bets, args.users, args.concurrency))
+        print(f"шардов: {shards:2d}  ставок/с: {rate:8.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,36 @@
 import asyncio
+import csv
 import logging
+import os
+import tempfile
 from datetime import datetime
-from typing import Optional
+from typing import Dict, Optional
 
 from aiogram import Bot, Dispatcher, F
 from aiogram.filters import Command
 from aiogram.types import (
     Message, CallbackQuery, InlineKeyboardMarkup,
-    InlineKeyboardButton, ReplyKeyboardRemove
+    InlineKeyboardButton, ReplyKeyboardRemove, FSInputFile
 )
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.fsm.storage.memory import MemoryStorage
 
 from config import Config
 from database import Database
+from async_database import AsyncDatabase
+from fsm_storage import SQLiteStorage
+from sharding import ShardedDatabase
+from broadcast import Broadcaster
+from crash_round import CrashRoundScheduler
+from jackpot_pool import JackpotPool
+from fair_rng import ProvablyFair, SeedChainPool, hash_seed, verify
+from backup import backup_database
 from games import GameEngine
+from game_registry import GAMES, GAMES_LINES, GAMES_MARKUP, Game
+from user_locks import UserLocks, UserLockMiddleware
+from rate_limit import ThrottlingMiddleware
+from user_context import UserContextMiddleware
+from webhook import WebhookServer
 
 # Настройка логирования
 logging.basicConfig(
@@ -29,9 +44,77 @@ Config.validate()
 
 # Инициализация
 bot = Bot(token=Config.BOT_TOKEN)
-storage = MemoryStorage()
+db_options = dict(
+    ledger_write_behind=Config.LEDGER_WRITE_BEHIND,
+    ledger_flush_interval_ms=Config.LEDGER_FLUSH_INTERVAL_MS,
+    ledger_flush_max_rows=Config.LEDGER_FLUSH_MAX_ROWS,
+    subscription_cache_ttl=Config.SUBSCRIPTION_CACHE_TTL,
+    user_cache_size=Config.USER_CACHE_SIZE,
+    user_cache_ttl=Config.USER_CACHE_TTL
+)
+if Config.DB_SHARDS > 1:
+    db = AsyncDatabase(ShardedDatabase(shards=Config.DB_SHARDS, **db_options), workers=Config.DB_SHARDS)
+else:
+    db = AsyncDatabase(Database(**db_options))
+storage = SQLiteStorage(
+    db,
+    ttl=Config.FSM_STATE_TTL,
+    flush_interval=Config.FSM_FLUSH_INTERVAL_MS / 1000,
+    cache_size=Config.FSM_CACHE_SIZE,
+    cache_ttl=Config.FSM_CACHE_TTL
+)
 dp = Dispatcher(storage=storage)
-db = Database()
+# Сначала лимит частоты (без обращения к базе), затем очередь апдейтов
+# пользователя: разные пользователи обрабатываются параллельно, один — по очереди
+throttling = ThrottlingMiddleware(Config.THROTTLE_RATES)
+dp.update.outer_middleware(throttling)
+user_locks = UserLocks()
+dp.update.outer_middleware(UserLockMiddleware(user_locks))
+broadcaster = Broadcaster(
+    bot, db,
+    rate=Config.BROADCAST_RATE,
+    chunk_size=Config.BROADCAST_CHUNK_SIZE,
+    concurrency=Config.BROADCAST_CONCURRENCY
+)
+seed_pool = SeedChainPool(Config.FAIR_CHAIN_LENGTH)
+crash_rounds = CrashRoundScheduler(
+    bot, db,
+    betting_time=Config.CRASH_ROUND_BETTING_TIME,
+    growth=Config.CRASH_ROUND_GROWTH,
+    house_edge=Config.CRASH_ROUND_HOUSE_EDGE,
+    max_multiplier=Config.CRASH_ROUND_MAX_MULTIPLIER,
+    tick=Config.CRASH_ROUND_TICK,
+    pause=Config.CRASH_ROUND_PAUSE,
+    edit_rate=Config.CRASH_ROUND_EDIT_RATE,
+    seeds=seed_pool
+)
+
+async def notify_jackpot_winners(result: dict):
+    """Сообщить победителям общего джекпота"""
+    for user_id, payout in result['payouts'].items():
+        try:
+            await bot.send_message(
+                user_id,
+                f"🏆 *Вы выиграли в общем джекпоте #{result['round_id']}!*\n\n"
+                f"💰 Выигрыш: *{format_balance(payout)} STAR*",
+                parse_mode="Markdown"
+            )
+        except Exception as e:
+            logger.error(f"Не удалось уведомить победителя {user_id}: {e}")
+
+fair = ProvablyFair(
+    db, seed_pool,
+    nonce_block=Config.FAIR_NONCE_BLOCK,
+    cache_size=Config.FAIR_CACHE_SIZE
+)
+jackpot_pool = JackpotPool(
+    db,
+    ticket_price=Config.JACKPOT_POOL_TICKET_PRICE,
+    pool_share=Config.JACKPOT_POOL_SHARE,
+    prizes=Config.JACKPOT_POOL_PRIZES,
+    draw_interval=Config.JACKPOT_POOL_DRAW_INTERVAL,
+    on_draw=notify_jackpot_winners
+)
 
 # Состояния для FSM
 class GameStates(StatesGroup):
@@ -62,6 +145,10 @@ def format_time(seconds: int) -> str:
         minutes = (seconds % 3600) // 60
         return f"{hours} ч {minutes} мин"
 
+def fair_line(rng) -> str:
+    """Строка с номером ставки для проверки через /fair"""
+    return f"🔐 Ставка `{rng.tag}` (проверка: /fair)"
+
 def create_main_menu(user_id: int) -> InlineKeyboardMarkup:
     keyboard = [
         [InlineKeyboardButton(text="🐵 Заработать звезды", callback_data="earn")],
@@ -76,23 +163,12 @@ def create_main_menu(user_id: int) -> InlineKeyboardMarkup:
     
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
-async def check_subscriptions(user_id: int) -> bool:
-    """Проверить подписки"""
-    sponsors_status = db.get_user_sponsors_status(user_id)
-    if not sponsors_status:  # Если нет спонсоров
-        return True
-    
-    for sponsor in sponsors_status:
-        if not sponsor.get('is_subscribed', False):
-            return False
-    return True
-
-async def show_sponsors_message(message: Message, user_id: int):
+async def show_sponsors_message(message: Message, user: Dict):
     """Показать спонсоров"""
-    sponsors = db.get_sponsors()
+    sponsors = await db.get_sponsors()
     
     if not sponsors:
-        await show_main_menu(message)
+        await show_main_menu(message, user)
         return
     
     keyboard = []
@@ -115,54 +191,45 @@ async def show_sponsors_message(message: Message, user_id: int):
         parse_mode="Markdown"
     )
 
-async def show_main_menu(message: Message, text: str = None):
+async def show_main_menu(message: Message, user: Dict, text: str = None):
     """Показать главное меню"""
-    user_id = message.from_user.id
-    user = db.get_user(user_id)
-    
-    balance = user['balance'] if user else 0.0
-    
     welcome_text = text or (
         "🐵 *Monkey Stars*\n\n"
-        f"💰 Баланс: *{format_balance(balance)} STAR*\n\n"
+        f"💰 Баланс: *{format_balance(user['balance'])} STAR*\n\n"
         "Выберите действие:"
     )
     
     await message.answer(
         welcome_text,
-        reply_markup=create_main_menu(user_id),
+        reply_markup=create_main_menu(user['user_id']),
         parse_mode="Markdown"
     )
 
+async def on_unsubscribed(event, user: Dict):
+    """Ответ неподписанному пользователю вместо обработчика"""
+    if isinstance(event, CallbackQuery):
+        await event.answer("❌ Сначала подпишитесь на спонсоров!", show_alert=True)
+        await show_sponsors_message(event.message, user)
+    else:
+        await show_sponsors_message(event, user)
+
+# Пользователь и статус подписок загружаются один раз на апдейт и
+# передаются обработчикам аргументами user и subscribed
+user_context = UserContextMiddleware(db, on_unsubscribed, admin_id=Config.ADMIN_ID)
+dp.message.outer_middleware(user_context)
+dp.callback_query.outer_middleware(user_context)
+
 # ========== ОСНОВНЫЕ КОМАНДЫ ==========
 
 @dp.message(Command("start"))
-async def cmd_start(message: Message):
-    """Команда /start"""
-    user_id = message.from_user.id
-    username = message.from_user.username or message.from_user.first_name
-    
-    logger.info(f"User {user_id} ({username}) started bot")
-    
-    # Обработка реферальной ссылки
-    referrer_id = None
-    if len(message.text.split()) > 1:
-        try:
-            referrer_id = int(message.text.split()[1])
-            if referrer_id == user_id:
-                referrer_id = None
-        except:
-            pass
-    
-    # Создаем пользователя
-    db.create_user(user_id, username, referrer_id)
-    
-    # Проверяем подписки
-    if not await check_subscriptions(user_id):
-        await show_sponsors_message(message, user_id)
-        return
-    
-    await show_main_menu(message)
+async def cmd_start(message: Message, user: Dict):
+    """Команда /start.
+    
+    Пользователя (с реферером из ссылки) создает UserContextMiddleware,
+    неподписанным он же показывает спонсоров.
+    """
+    logger.info(f"User {user['user_id']} ({user['username']}) started bot")
+    await show_main_menu(message, user)
 
 @dp.message(Command("help"))
 async def cmd_help(message: Message):
@@ -191,49 +258,35 @@ async def cmd_help(message: Message):
     await message.answer(help_text, parse_mode="Markdown")
 
 @dp.message(Command("balance"))
-async def cmd_balance(message: Message):
+async def cmd_balance(message: Message, user: Dict):
     """Проверка баланса"""
-    user_id = message.from_user.id
-    user = db.get_user(user_id)
-    
-    if user:
-        balance = user['balance']
-        await message.answer(f"💰 Ваш баланс: *{format_balance(balance)} STAR*", parse_mode="Markdown")
-    else:
-        await message.answer("❌ Пользователь не найден. Используйте /start")
+    await message.answer(f"💰 Ваш баланс: *{format_balance(user['balance'])} STAR*", parse_mode="Markdown")
 
 # ========== CALLBACK ОБРАБОТЧИКИ ==========
 
 @dp.callback_query(F.data == "check_subscriptions")
-async def handle_check_subscriptions(callback: CallbackQuery):
+async def handle_check_subscriptions(callback: CallbackQuery, user: Dict):
     """Проверка подписок"""
     user_id = callback.from_user.id
     
     # Имитация успешной подписки
-    sponsors = db.get_sponsors()
+    sponsors = await db.get_sponsors()
     for sponsor in sponsors:
-        db.update_user_sponsor_status(user_id, sponsor['id'], True)
+        await db.update_user_sponsor_status(user_id, sponsor['id'], True)
     
     await callback.answer("✅ Отлично! Доступ открыт!")
     await callback.message.delete()
-    await show_main_menu(callback.message)
+    await show_main_menu(callback.message, user)
 
 @dp.callback_query(F.data == "main_menu")
-async def handle_main_menu(callback: CallbackQuery):
+async def handle_main_menu(callback: CallbackQuery, user: Dict):
     """Главное меню"""
     await callback.message.delete()
-    await show_main_menu(callback.message)
+    await show_main_menu(callback.message, user)
 
 @dp.callback_query(F.data == "earn")
 async def handle_earn(callback: CallbackQuery):
     """Заработок"""
-    user_id = callback.from_user.id
-    
-    if not await check_subscriptions(user_id):
-        await callback.answer("❌ Сначала подпишитесь на спонсоров!", show_alert=True)
-        await show_sponsors_message(callback.message, user_id)
-        return
-    
     keyboard = [
         [InlineKeyboardButton(text="🎯 Кликнуть (+0.2 STAR)", callback_data="click")],
         [InlineKeyboardButton(text="💸 Вывод средств", callback_data="withdraw_menu")],
@@ -248,51 +301,29 @@ async def handle_earn(callback: CallbackQuery):
     )
 
 @dp.callback_query(F.data == "click")
-async def handle_click(callback: CallbackQuery):
+async def handle_click(callback: CallbackQuery, user: Dict):
     """Кликер"""
     user_id = callback.from_user.id
     
-    if not await check_subscriptions(user_id):
-        await callback.answer("❌ Сначала подпишитесь на спонсоров!", show_alert=True)
-        return
-    
-    user = db.get_user(user_id)
-    if not user:
-        await callback.answer("❌ Ошибка")
-        return
-    
-    current_time = int(datetime.now().timestamp())
-    last_click = user.get('last_click')
-    
-    # Проверка кулдауна
-    if last_click and (current_time - last_click) < Config.CLICK_COOLDOWN:
-        remaining = Config.CLICK_COOLDOWN - (current_time - last_click)
-        await callback.answer(f"⏳ Подождите {format_time(remaining)}")
-        return
-    
-    # Начисление
+    # Начисление и бонус реферера: кулдаун проверяется в том же UPDATE
     reward = Config.CLICK_REWARD
-    db.update_balance(user_id, reward)
-    db.update_last_click(user_id)
-    db.add_transaction(user_id, reward, "click", "Кликер")
-    
-    # Реферальный бонус
-    referrer_id = user.get('referrer_id')
-    if referrer_id:
-        referral_bonus = reward * (Config.CLICK_REFERRAL_PERCENT / 100)
-        db.update_balance(referrer_id, referral_bonus)
-        db.add_transaction(
-            referrer_id,
-            referral_bonus,
-            "referral_income",
-            f"10% от клика пользователя {callback.from_user.username or user_id}"
-        )
+    claimed = await db.claim_click(
+        user_id,
+        reward,
+        Config.CLICK_COOLDOWN,
+        reward * (Config.CLICK_REFERRAL_PERCENT / 100),
+        f"10% от клика пользователя {callback.from_user.username or user_id}"
+    )
+    if not claimed:
+        current_time = int(datetime.now().timestamp())
+        remaining = Config.CLICK_COOLDOWN - (current_time - (user.get('last_click') or current_time))
+        await callback.answer(f"⏳ Подождите {format_time(max(remaining, 1))}")
+        return
     
     # Обновляем сообщение
-    user = db.get_user(user_id)
     await callback.message.edit_text(
         f"✅ *Вы получили {reward} STAR!*\n\n"
-        f"💰 Баланс: *{format_balance(user['balance'])} STAR*\n\n"
+        f"💰 Баланс: *{format_balance(claimed['balance'])} STAR*\n\n"
         f"⏰ Следующий клик через 1 час",
         parse_mode="Markdown",
         reply_markup=callback.message.reply_markup
@@ -303,12 +334,6 @@ async def handle_click(callback: CallbackQuery):
 @dp.callback_query(F.data == "withdraw_menu")
 async def handle_withdraw_menu(callback: CallbackQuery):
     """Вывод средств"""
-    user_id = callback.from_user.id
-    
-    if not await check_subscriptions(user_id):
-        await callback.answer("❌ Сначала подпишитесь на спонсоров!", show_alert=True)
-        return
-    
     keyboard = []
     for amount in Config.WITHDRAWAL_AMOUNTS:
         keyboard.append([InlineKeyboardButton(text=f"{amount} STAR", callback_data=f"withdraw_{amount}")])
@@ -326,7 +351,7 @@ async def handle_withdraw_menu(callback: CallbackQuery):
     )
 
 @dp.callback_query(F.data.startswith("withdraw_"))
-async def handle_withdraw(callback: CallbackQuery):
+async def handle_withdraw(callback: CallbackQuery, user: Dict):
     """Обработка вывода"""
     user_id = callback.from_user.id
     
@@ -335,9 +360,7 @@ async def handle_withdraw(callback: CallbackQuery):
     except:
         await callback.answer("❌ Ошибка")
         return
-    
-    user = db.get_user(user_id)
-    if not user:
+    if amount not in Config.WITHDRAWAL_AMOUNTS:
         await callback.answer("❌ Ошибка")
         return
     
@@ -347,21 +370,17 @@ async def handle_withdraw(callback: CallbackQuery):
         return
     
     # Проверка рефералов
-    total_ref, active_ref = db.get_user_referrals(user_id)
+    total_ref, active_ref = await db.get_user_referrals(user_id)
     if active_ref < 3:
         await callback.answer(f"❌ Нужно 3 активных реферала. У вас: {active_ref}")
         return
     
-    # Создаем заявку
-    withdrawal = db.create_withdrawal(user_id, amount)
+    # Создаем заявку и списываем сумму; баланс перепроверяется в том же UPDATE
+    withdrawal = await db.create_withdrawal(user_id, amount)
     if not withdrawal:
-        await callback.answer("❌ Ошибка")
+        await callback.answer(f"❌ Недостаточно STAR. Баланс: {format_balance(user['balance'])}")
         return
     
-    # Списание
-    db.update_balance(user_id, -amount)
-    db.add_transaction(user_id, -amount, "withdrawal", f"Вывод #{withdrawal['id']}")
-    
     await callback.message.edit_text(
         f"✅ *Заявка на вывод одобрена!*\n\n"
         f"💰 Сумма: *{amount} STAR*\n"
@@ -374,102 +393,84 @@ async def handle_withdraw(callback: CallbackQuery):
 # ========== ИГРЫ ==========
 
 @dp.callback_query(F.data == "play_games")
-async def handle_play_games(callback: CallbackQuery):
+async def handle_play_games(callback: CallbackQuery, user: Dict):
     """Выбор игры"""
-    user_id = callback.from_user.id
-    
-    if not await check_subscriptions(user_id):
-        await callback.answer("❌ Сначала подпишитесь на спонсоров!", show_alert=True)
-        return
-    
-    keyboard = [
-        [InlineKeyboardButton(text=Config.GAMES['flip']['name'], callback_data="game_flip")],
-        [InlineKeyboardButton(text=Config.GAMES['crash']['name'], callback_data="game_crash")],
-        [InlineKeyboardButton(text=Config.GAMES['slot']['name'], callback_data="game_slot")],
-        [InlineKeyboardButton(text=Config.GAMES['dice']['name'], callback_data="game_dice")],
-        [InlineKeyboardButton(text=Config.GAMES['jackpot']['name'], callback_data="game_jackpot")],
-        [InlineKeyboardButton(text="◀️ Назад", callback_data="main_menu")]
-    ]
-    
-    user = db.get_user(user_id)
-    balance = user['balance'] if user else 0.0
-    
     await callback.message.edit_text(
         f"🎮 *Выберите игру:*\n\n"
-        f"💰 Ваш баланс: *{format_balance(balance)} STAR*\n\n"
-        f"🎯 *Monkey Flip* - Подбрось банан (x2.0)\n"
-        f"🚀 *Banana Crash* - Краш-игра\n"
-        f"🎰 *Банановый слот* - 3 барабана\n"
-        f"🎲 *Банановые кости* - Угадай число (x3.0)\n"
-        f"💰 *Джекпот* - Шанс x100",
-        reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard),
+        f"💰 Ваш баланс: *{format_balance(user['balance'])} STAR*\n\n"
+        f"{GAMES_LINES}",
+        reply_markup=GAMES_MARKUP,
         parse_mode="Markdown"
     )
 
-@dp.callback_query(F.data == "game_flip")
-async def handle_game_flip(callback: CallbackQuery):
-    """Monkey Flip"""
-    user_id = callback.from_user.id
-    user = db.get_user(user_id)
+async def play_round(user_id: int, game: Game, bet: float, choice: str = None) -> Optional[str]:
+    """Сыграть раунд и рассчитать ставку одной транзакцией.
+    
+    Общий путь для всех игр реестра. Возвращает сообщение с итогом
+    или None, если баланса недостаточно.
+    """
+    rng = await fair.rng(user_id)
+    win, amount, details = game.play(bet, rng, choice)
+    balance = await db.settle_bet(
+        user_id, game.key, bet, amount,
+        f"{game.bet_description(win, amount, bet)} [{rng.tag}]"
+    )
+    if balance is None:
+        return None
+    return game.result(bet, details, format_balance(balance), fair_line(rng))
+
+@dp.callback_query(F.data.startswith("game_"))
+async def handle_game_menu(callback: CallbackQuery, user: Dict):
+    """Меню игры из реестра"""
+    game = GAMES.get(callback.data[len("game_"):])
     
-    if not user:
+    if game is None:
         await callback.answer("❌ Ошибка")
         return
     
-    keyboard = [
-        [InlineKeyboardButton(text="🍌 Banana", callback_data="flip_heads")],
-        [InlineKeyboardButton(text="🐵 Monkey", callback_data="flip_tails")],
-        [InlineKeyboardButton(text="◀️ Назад", callback_data="play_games")]
-    ]
-    
     await callback.message.edit_text(
-        f"🎯 *Monkey Flip*\n\n"
-        f"💰 Ваш баланс: *{format_balance(user['balance'])} STAR*\n"
-        f"📈 Шанс выигрыша: *49%*\n"
-        f"🎲 Множитель: *x2.0*\n"
-        f"💰 Мин. ставка: *{Config.GAMES['flip']['min_bet']} STAR*\n\n"
-        f"Выберите сторону:",
-        reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard),
+        game.menu(format_balance(user['balance'])),
+        reply_markup=game.menu_markup,
         parse_mode="Markdown"
     )
 
-@dp.callback_query(F.data.startswith("flip_"))
-async def handle_flip_choice(callback: CallbackQuery, state: FSMContext):
-    """Выбор в Flip"""
-    user_id = callback.from_user.id
-    choice = callback.data.split("_")[1]
+@dp.callback_query(F.data.startswith("pick_"))
+async def handle_game_pick(callback: CallbackQuery, state: FSMContext):
+    """Выбор до ставки (сторона во Flip, число в костях)"""
+    _, key, choice = callback.data.split("_", 2)
+    game = GAMES.get(key)
     
-    await state.update_data(game_type="flip", flip_choice=choice)
+    if game is None or choice not in game.choices:
+        await callback.answer("❌ Ошибка")
+        return
+    
+    await state.update_data(game_type=key, choice=choice)
     await state.set_state(GameStates.choosing_bet)
     
     await callback.message.edit_text(
-        f"🎯 Вы выбрали: {'🍌 Banana' if choice == 'heads' else '🐵 Monkey'}\n\n"
-        f"💰 Введите сумму ставки (мин. {Config.GAMES['flip']['min_bet']} STAR):",
-        reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="◀️ Отмена", callback_data="game_flip")]
-        ])
+        f"{game.icon} Ваш выбор: *{game.choices[choice]}*\n\n"
+        f"💰 Выберите ставку или введите сумму (мин. {game.min_bet} STAR):",
+        reply_markup=game.choice_markups[choice],
+        parse_mode="Markdown"
     )
 
 @dp.message(GameStates.choosing_bet)
-async def handle_bet_input(message: Message, state: FSMContext):
+async def handle_bet_input(message: Message, state: FSMContext, user: Dict):
     """Ввод ставки"""
     user_id = message.from_user.id
-    user = db.get_user(user_id)
-    
-    if not user:
-        await message.answer("❌ Ошибка")
-        await state.clear()
-        return
     
     try:
         bet = float(message.text)
         data = await state.get_data()
-        game_type = data.get('game_type')
+        game = GAMES.get(data.get('game_type'))
+        if game is None:
+            await message.answer("❌ Ошибка")
+            await state.clear()
+            return
         
-        # Проверка минимальной ставки
-        min_bet = Config.GAMES[game_type]['min_bet']
-        if bet < min_bet:
-            await message.answer(f"❌ Минимальная ставка: {min_bet} STAR")
+        # Проверка минимальной ставки (NaN не проходит сравнение)
+        if not bet >= game.min_bet:
+            await message.answer(f"❌ Минимальная ставка: {game.min_bet} STAR")
             return
         
         # Проверка баланса
@@ -477,39 +478,13 @@ async def handle_bet_input(message: Message, state: FSMContext):
             await message.answer(f"❌ Недостаточно STAR. Баланс: {format_balance(user['balance'])}")
             return
         
-        # Играем
-        if game_type == "flip":
-            choice = data.get('flip_choice')
-            win, amount, emoji, result_text = GameEngine.play_flip(bet, choice)
-            
-            # Обновляем баланс
-            if win:
-                db.update_balance(user_id, amount - bet)
-                db.add_transaction(user_id, amount - bet, "game_win", "Monkey Flip выигрыш")
-                db.update_game_stats(user_id, bet, True)
-            else:
-                db.update_balance(user_id, -bet)
-                db.add_transaction(user_id, -bet, "game_lose", "Monkey Flip проигрыш")
-                db.update_game_stats(user_id, bet, False)
-            
-            # Получаем новый баланс
-            user = db.get_user(user_id)
-            
-            await message.answer(
-                f"🎯 *Monkey Flip*\n\n"
-                f"💰 Ставка: *{bet} STAR*\n"
-                f"{emoji} {result_text}\n\n"
-                f"💰 Новый баланс: *{format_balance(user['balance'])} STAR*\n\n"
-                f"🎮 Сыграть ещё?",
-                reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                    [InlineKeyboardButton(text="🎯 Играть снова", callback_data="game_flip")],
-                    [InlineKeyboardButton(text="🎮 Все игры", callback_data="play_games")],
-                    [InlineKeyboardButton(text="🐵 Главное меню", callback_data="main_menu")]
-                ]),
-                parse_mode="Markdown"
-            )
-        
         await state.clear()
+        text = await play_round(user_id, game, bet, data.get('choice'))
+        if text is None:
+            await message.answer("❌ Недостаточно STAR")
+            return
+        
+        await message.answer(text, reply_markup=game.again_markup, parse_mode="Markdown")
         
     except ValueError:
         await message.answer("❌ Введите число!")
@@ -518,77 +493,171 @@ async def handle_bet_input(message: Message, state: FSMContext):
         await message.answer("❌ Ошибка")
         await state.clear()
 
-@dp.callback_query(F.data == "game_crash")
-async def handle_game_crash(callback: CallbackQuery):
-    """Banana Crash"""
+@dp.callback_query(F.data.startswith("bet_"))
+async def handle_game_bet(callback: CallbackQuery, state: FSMContext, user: Dict):
+    """Ставка кнопкой: bet_<игра>_<сумма>[_<выбор>]"""
     user_id = callback.from_user.id
-    user = db.get_user(user_id)
     
-    if not user:
+    try:
+        parts = callback.data.split("_")
+        game = GAMES.get(parts[1])
+        bet = float(parts[2])
+        choice = parts[3] if len(parts) > 3 else None
+        if game is None or bet not in game.bets or (choice in game.choices) != bool(game.choices):
+            await callback.answer("❌ Ошибка")
+            return
+        
+        # Проверка баланса
+        if user['balance'] < bet:
+            await callback.answer(f"❌ Недостаточно STAR. Баланс: {format_balance(user['balance'])}")
+            return
+        
+        await state.clear()
+        text = await play_round(user_id, game, bet, choice)
+        if text is None:
+            await callback.answer("❌ Недостаточно STAR")
+            return
+        
+        await callback.message.edit_text(text, reply_markup=game.again_markup, parse_mode="Markdown")
+        
+    except Exception as e:
+        logger.error(f"Error: {e}")
         await callback.answer("❌ Ошибка")
-        return
+
+@dp.callback_query(F.data == "crash_round")
+async def handle_crash_round(callback: CallbackQuery, user: Dict):
+    """Общий раунд Banana Crash: выбор ставки"""
+    if crash_rounds.accepting_bets:
+        status = f"⏳ Прием ставок: старт через {crash_rounds.seconds_to_start()} сек"
+    else:
+        status = "🚀 Раунд уже идет, ставка попадет в следующий"
     
     keyboard = [
-        [InlineKeyboardButton(text="🚀 Играть (1 STAR)", callback_data="crash_play_1")],
-        [InlineKeyboardButton(text="🚀 Играть (5 STAR)", callback_data="crash_play_5")],
-        [InlineKeyboardButton(text="🚀 Играть (10 STAR)", callback_data="crash_play_10")],
-        [InlineKeyboardButton(text="◀️ Назад", callback_data="play_games")]
+        [
+            InlineKeyboardButton(text=f"🚀 {bet} STAR", callback_data=f"crash_join_{bet}")
+            for bet in Config.CRASH_ROUND_BETS
+        ],
+        [InlineKeyboardButton(text="◀️ Назад", callback_data="game_crash")]
     ]
     
     await callback.message.edit_text(
-        f"🚀 *Banana Crash*\n\n"
+        f"👥 *Banana Crash: общий раунд*\n\n"
         f"💰 Ваш баланс: *{format_balance(user['balance'])} STAR*\n"
-        f"📈 Множитель растет от x1.00\n"
-        f"💥 60% шанс мгновенного краша\n"
-        f"🎰 2% шанс на высокий множитель\n\n"
+        f"📈 Множитель растет у всех игроков одновременно\n"
+        f"💰 Нажмите «Забрать», пока не случился краш\n\n"
+        f"{status}\n\n"
         f"Выберите ставку:",
         reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard),
         parse_mode="Markdown"
     )
 
-@dp.callback_query(F.data.startswith("crash_play_"))
-async def handle_crash_play(callback: CallbackQuery):
-    """Игра в Crash"""
+@dp.callback_query(F.data.startswith("crash_join_"))
+async def handle_crash_join(callback: CallbackQuery):
+    """Вход в общий раунд"""
     user_id = callback.from_user.id
-    user = db.get_user(user_id)
     
-    if not user:
+    try:
+        bet = float(callback.data.split("_")[2])
+        if bet not in Config.CRASH_ROUND_BETS:
+            await callback.answer("❌ Ошибка")
+            return
+        
+        if crash_rounds.in_round(user_id):
+            await callback.answer("✅ Вы уже в этом раунде")
+            return
+        if not crash_rounds.accepting_bets:
+            await callback.answer("⏳ Раунд уже идет, дождитесь следующего")
+            return
+        
+        balance = await crash_rounds.join(
+            user_id, bet, callback.message.chat.id, callback.message.message_id
+        )
+        if balance is None:
+            await callback.answer("❌ Недостаточно STAR или прием ставок закрыт")
+            return
+        
+        await callback.message.edit_text(
+            f"🚀 *Banana Crash: общий раунд*\n\n"
+            f"✅ Ставка *{bet} STAR* принята\n"
+            f"💰 Баланс: *{format_balance(balance)} STAR*\n\n"
+            f"⏳ Старт через {crash_rounds.seconds_to_start()} сек\n"
+            f"🔐 Хеш зерна раунда: `{crash_rounds.round.server_hash}`",
+            parse_mode="Markdown"
+        )
+        
+    except Exception as e:
+        logger.error(f"Error: {e}")
         await callback.answer("❌ Ошибка")
+
+@dp.callback_query(F.data == "crash_cashout")
+async def handle_crash_cashout(callback: CallbackQuery):
+    """Забрать выигрыш в общем раунде"""
+    multiplier = crash_rounds.cash_out(callback.from_user.id)
+    if multiplier is None:
+        await callback.answer("💥 Поздно: раунд уже закончился")
         return
     
+    bet = crash_rounds.round.bets[callback.from_user.id]
+    await callback.answer(f"✅ Забрали на x{multiplier:.2f}: +{bet * multiplier:.2f} STAR")
+
+AUTOPLAY_STOP_REASONS = {
+    "rounds": "все раунды сыграны",
+    "balance": "закончился баланс",
+    "stop_loss": "сработал стоп-лосс",
+    "stop_win": "сработал стоп-профит",
+}
+
+@dp.callback_query(F.data.startswith("autoplay_"))
+async def handle_autoplay(callback: CallbackQuery, user: Dict):
+    """Автоигра: серия раундов, один расчет и одно сообщение"""
+    user_id = callback.from_user.id
+    
     try:
-        bet = float(callback.data.split("_")[2])
+        _, key, rounds, bet = callback.data.split("_")
+        game = GAMES.get(key)
+        rounds, bet = int(rounds), float(bet)
+        if game is None or not game.autoplay or rounds not in Config.AUTOPLAY_ROUNDS or bet not in Config.AUTOPLAY_BETS:
+            await callback.answer("❌ Ошибка")
+            return
         
         # Проверка баланса
         if user['balance'] < bet:
             await callback.answer(f"❌ Недостаточно STAR. Баланс: {format_balance(user['balance'])}")
             return
         
-        # Играем
-        win, amount, emoji, result_text = GameEngine.play_crash(bet)
-        
-        # Обновляем баланс
-        if win:
-            db.update_balance(user_id, amount - bet)
-            db.add_transaction(user_id, amount - bet, "game_win", f"Banana Crash выигрыш x{amount/bet:.2f}")
-            db.update_game_stats(user_id, bet, True)
-        else:
-            db.update_balance(user_id, -bet)
-            db.add_transaction(user_id, -bet, "game_lose", "Banana Crash проигрыш")
-            db.update_game_stats(user_id, bet, False)
+        # Играем всю серию: у каждого раунда свой nonce
+        rngs = await fair.rngs(user_id, rounds)
+        result = GameEngine.play_batch(
+            game.engine, bet, rounds, user['balance'],
+            stop_loss=bet * Config.AUTOPLAY_STOP_LOSS,
+            stop_win=bet * Config.AUTOPLAY_STOP_WIN,
+            config=game.config,
+            rngs=rngs
+        )
         
-        # Новый баланс
-        user = db.get_user(user_id)
+        # Рассчитываем серию одной транзакцией
+        name = game.name
+        tag = f"{rngs[0].tag}-{rngs[result['rounds'] - 1].nonce}" if result['rounds'] > 1 else rngs[0].tag
+        balance = await db.settle_batch(
+            user_id, game.key, result['wagered'], result['payout'], result['rounds'],
+            result['wins'], result['required_balance'],
+            f"{name} автоигра: {result['rounds']} раундов [{tag}]"
+        )
+        if balance is None:
+            await callback.answer("❌ Недостаточно STAR")
+            return
         
+        net = result['net']
         await callback.message.edit_text(
-            f"🚀 *Banana Crash*\n\n"
-            f"💰 Ставка: *{bet} STAR*\n"
-            f"{emoji} {result_text}\n\n"
-            f"💰 Новый баланс: *{format_balance(user['balance'])} STAR*\n\n"
-            f"🎮 Сыграть ещё?",
+            f"🔁 *{name}: автоигра*\n\n"
+            f"🎮 Раундов: *{result['rounds']}* из {result['requested']} ({AUTOPLAY_STOP_REASONS[result['stop_reason']]})\n"
+            f"💰 Ставка: *{bet} STAR* × {result['rounds']} = {format_balance(result['wagered'])} STAR\n"
+            f"🏆 Выигрышей: *{result['wins']}*, лучший x{result['best_multiplier']:.2f}\n"
+            f"{'📈' if net >= 0 else '📉'} Итог: *{'+' if net >= 0 else ''}{format_balance(net)} STAR*\n\n"
+            f"💰 Новый баланс: *{format_balance(balance)} STAR*",
             reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="🚀 Играть снова", callback_data="game_crash")],
-                [InlineKeyboardButton(text="🎮 Все игры", callback_data="play_games")],
+                [InlineKeyboardButton(text="🔁 Еще серия", callback_data=callback.data)],
+                [InlineKeyboardButton(text="◀️ Назад", callback_data=f"game_{game.key}")],
                 [InlineKeyboardButton(text="🐵 Главное меню", callback_data="main_menu")]
             ]),
             parse_mode="Markdown"
@@ -598,83 +667,49 @@ async def handle_crash_play(callback: CallbackQuery):
         logger.error(f"Error: {e}")
         await callback.answer("❌ Ошибка")
 
-@dp.callback_query(F.data == "game_slot")
-async def handle_game_slot(callback: CallbackQuery):
-    """Слоты"""
-    user_id = callback.from_user.id
-    user = db.get_user(user_id)
-    
-    if not user:
-        await callback.answer("❌ Ошибка")
-        return
-    
+@dp.callback_query(F.data == "jackpot_pool")
+async def handle_jackpot_pool(callback: CallbackQuery, user: Dict):
+    """Общий прогрессивный джекпот"""
+    price = Config.JACKPOT_POOL_TICKET_PRICE
     keyboard = [
-        [InlineKeyboardButton(text="🎰 Крутить (1 STAR)", callback_data="slot_play_1")],
-        [InlineKeyboardButton(text="🎰 Крутить (5 STAR)", callback_data="slot_play_5")],
-        [InlineKeyboardButton(text="🎰 Крутить (10 STAR)", callback_data="slot_play_10")],
-        [InlineKeyboardButton(text="◀️ Назад", callback_data="play_games")]
+        [
+            InlineKeyboardButton(text=f"🎟 {count} ({count * price:g} STAR)", callback_data=f"jackpot_buy_{count}")
+            for count in Config.JACKPOT_POOL_TICKETS
+        ],
+        [InlineKeyboardButton(text="◀️ Назад", callback_data="game_jackpot")]
     ]
+    prizes = ", ".join(f"{share * 100:.0f}%" for share in Config.JACKPOT_POOL_PRIZES)
     
     await callback.message.edit_text(
-        f"🎰 *Банановый слот*\n\n"
+        f"🏆 *Общий джекпот #{jackpot_pool.round['id']}*\n\n"
+        f"💰 Пул: *{format_balance(jackpot_pool.pool)} STAR*\n"
+        f"🎟 Продано билетов: *{jackpot_pool.tickets}*\n"
+        f"⏳ Розыгрыш через *{format_time(jackpot_pool.seconds_to_draw())}*\n"
+        f"🏅 Призы: {prizes} пула\n\n"
         f"💰 Ваш баланс: *{format_balance(user['balance'])} STAR*\n"
-        f"🎯 3 одинаковых = x20\n"
-        f"🍌 3 банана = ДЖЕКПОТ x50!\n"
-        f"🎲 2 одинаковых = x1.5\n\n"
-        f"Выберите ставку:",
+        f"Шанс выигрыша пропорционален числу билетов:",
         reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard),
         parse_mode="Markdown"
     )
 
-@dp.callback_query(F.data.startswith("slot_play_"))
-async def handle_slot_play(callback: CallbackQuery):
-    """Игра в слоты"""
-    user_id = callback.from_user.id
-    user = db.get_user(user_id)
-    
-    if not user:
-        await callback.answer("❌ Ошибка")
-        return
-    
+@dp.callback_query(F.data.startswith("jackpot_buy_"))
+async def handle_jackpot_buy(callback: CallbackQuery):
+    """Покупка билетов общего джекпота"""
     try:
-        bet = float(callback.data.split("_")[2])
-        
-        # Проверка баланса
-        if user['balance'] < bet:
-            await callback.answer(f"❌ Недостаточно STAR. Баланс: {format_balance(user['balance'])}")
+        tickets = int(callback.data.split("_")[2])
+        if tickets not in Config.JACKPOT_POOL_TICKETS:
+            await callback.answer("❌ Ошибка")
             return
         
-        # Играем
-        win, amount, result_text, reels = GameEngine.play_slot(bet)
-        
-        # Обновляем баланс
-        if win:
-            db.update_balance(user_id, amount - bet)
-            db.add_transaction(user_id, amount - bet, "game_win", f"Слоты выигрыш x{amount/bet:.2f}")
-            db.update_game_stats(user_id, bet, True)
-        else:
-            db.update_balance(user_id, -bet)
-            db.add_transaction(user_id, -bet, "game_lose", "Слоты проигрыш")
-            db.update_game_stats(user_id, bet, False)
-        
-        # Новый баланс
-        user = db.get_user(user_id)
+        balance = await jackpot_pool.buy(callback.from_user.id, tickets)
+        if balance is None:
+            await callback.answer("❌ Недостаточно STAR или идет розыгрыш")
+            return
         
-        await callback.message.edit_text(
-            f"🎰 *Банановый слот*\n\n"
-            f"💰 Ставка: *{bet} STAR*\n"
-            f"🎰 Результат: {' '.join(reels)}\n"
-            f"{result_text}\n\n"
-            f"💰 Новый баланс: *{format_balance(user['balance'])} STAR*\n\n"
-            f"🎮 Сыграть ещё?",
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="🎰 Крутить снова", callback_data="game_slot")],
-                [InlineKeyboardButton(text="🎮 Все игры", callback_data="play_games")],
-                [InlineKeyboardButton(text="🐵 Главное меню", callback_data="main_menu")]
-            ]),
-            parse_mode="Markdown"
+        await callback.answer(
+            f"✅ Куплено билетов: {tickets}. Пул: {format_balance(jackpot_pool.pool)} STAR, "
+            f"баланс: {format_balance(balance)} STAR"
         )
-        
     except Exception as e:
         logger.error(f"Error: {e}")
         await callback.answer("❌ Ошибка")
@@ -682,20 +717,10 @@ async def handle_slot_play(callback: CallbackQuery):
 # ПРОФИЛЬ И РЕФЕРАЛКА
 
 @dp.callback_query(F.data == "profile")
-async def handle_profile(callback: CallbackQuery):
+async def handle_profile(callback: CallbackQuery, user: Dict):
     """Профиль"""
     user_id = callback.from_user.id
-    
-    if not await check_subscriptions(user_id):
-        await callback.answer("❌ Сначала подпишитесь на спонсоров!", show_alert=True)
-        return
-    
-    user = db.get_user(user_id)
-    if not user:
-        await callback.answer("❌ Ошибка")
-        return
-    
-    total_ref, active_ref = db.get_user_referrals(user_id)
+    total_ref, active_ref = await db.get_user_referrals(user_id)
     
     # Статистика игр
     games_played = user.get('games_played', 0)
@@ -744,12 +769,7 @@ async def handle_profile(callback: CallbackQuery):
 async def handle_referral(callback: CallbackQuery):
     """Рефералка"""
     user_id = callback.from_user.id
-    
-    if not await check_subscriptions(user_id):
-        await callback.answer("❌ Сначала подпишитесь на спонсоров!", show_alert=True)
-        return
-    
-    total_ref, active_ref = db.get_user_referrals(user_id)
+    total_ref, active_ref = await db.get_user_referrals(user_id)
     
     text = (
         f"👥 *Реферальная система*\n\n"
@@ -772,6 +792,88 @@ async def handle_referral(callback: CallbackQuery):
         parse_mode="Markdown"
     )
 
+# ЧЕСТНАЯ ИГРА
+@dp.message(Command("fair"))
+async def cmd_fair(message: Message):
+    """Зерна честной игры"""
+    user_id = message.from_user.id
+    info = await fair.info(user_id)
+    history = await db.get_fair_seed_history(user_id, 3)
+    
+    lines = [
+        f"• #{seed['id']}: `{seed['server_seed']}`, клиент `{seed['client_seed']}`, ставки 0–{seed['nonce'] - 1}"
+        for seed in history
+    ]
+    await message.answer(
+        f"🔐 *Честная игра*\n\n"
+        f"Исход ставки = HMAC-SHA256(зерно сервера, «зерно клиента:nonce»).\n\n"
+        f"🆔 Зерно: *#{info['seed_id']}*\n"
+        f"🔒 SHA-256 зерна сервера:\n`{info['server_hash']}`\n"
+        f"🎲 Зерно клиента: `{info['client_seed']}`\n"
+        f"🔢 Следующий nonce: *{info['nonce']}*\n\n"
+        f"🔄 /fair\\_rotate `[зерно клиента]` — раскрыть зерно сервера и получить новое\n"
+        f"✅ /fair\\_verify `игра зерно_сервера зерно_клиента nonce ставка [выбор]` — проверить ставку\n"
+        f"💥 /fair\\_verify `round зерно_раунда номер_раунда` — проверить общий раунд Banana Crash"
+        + ("\n\n📜 *Раскрытые зерна:*\n" + "\n".join(lines) if lines else ""),
+        parse_mode="Markdown"
+    )
+
+@dp.message(Command("fair_rotate"))
+async def cmd_fair_rotate(message: Message):
+    """Раскрыть зерно сервера и выдать новое"""
+    parts = message.text.split()
+    # Только буквы и цифры: зерно выводится в Markdown
+    client_seed = "".join(ch for ch in parts[1] if ch.isalnum())[:64] if len(parts) > 1 else None
+    
+    revealed = await fair.rotate(message.from_user.id, client_seed)
+    if revealed is None:
+        await message.answer("❌ Ошибка")
+        return
+    
+    info = await fair.info(message.from_user.id)
+    await message.answer(
+        f"🔓 *Зерно #{revealed['id']} раскрыто*\n"
+        f"Сервер: `{revealed['server_seed']}`\n"
+        f"Клиент: `{revealed['client_seed']}`\n"
+        f"Ставки: nonce 0–{revealed['nonce'] - 1}\n\n"
+        f"🔒 Новое зерно #{info['seed_id']}, SHA-256:\n`{info['server_hash']}`\n"
+        f"🎲 Зерно клиента: `{info['client_seed']}`",
+        parse_mode="Markdown"
+    )
+
+@dp.message(Command("fair_verify"))
+async def cmd_fair_verify(message: Message):
+    """Пересчитать ставку по раскрытому зерну"""
+    parts = message.text.split()
+    if len(parts) == 4 and parts[1] == "round" and parts[3].isdigit():
+        # Общий раунд Banana Crash: зерно из итога раунда и его номер
+        point = crash_rounds.round_crash_point(parts[2], int(parts[3]))
+        await message.answer(
+            f"💥 Раунд `{parts[3]}`: краш на *x{point:.2f}*\n"
+            f"🔐 SHA-256 зерна: `{hash_seed(parts[2])}`",
+            parse_mode="Markdown"
+        )
+        return
+    
+    try:
+        game, server_seed, client_seed, nonce, bet = parts[1:6]
+        if game not in GAMES:
+            raise ValueError(game)
+        choice = parts[6] if len(parts) > 6 else None
+        result = verify(game, server_seed, client_seed, int(nonce), float(bet), choice=choice)
+    except ValueError:
+        await message.answer(
+            f"❌ Формат: /fair_verify игра зерно_сервера зерно_клиента nonce ставка [выбор]\n"
+            f"или /fair_verify round зерно_раунда номер_раунда\n"
+            f"Игры: {', '.join(GAMES)}"
+        )
+        return
+    
+    await message.answer(
+        f"{'✅ Выигрыш' if result['win'] else '❌ Проигрыш'} {format_balance(result['amount'])} STAR\n"
+        f"{result['result']}"
+    )
+
 # ========== АДМИН ПАНЕЛЬ ==========
 
 @dp.callback_query(F.data == "admin_panel")
@@ -781,11 +883,12 @@ async def handle_admin_panel(callback: CallbackQuery):
         await callback.answer("❌ Доступ запрещен")
         return
     
-    stats = db.get_stats()
+    stats = await db.get_stats()
     
     keyboard = [
         [InlineKeyboardButton(text="📊 Статистика", callback_data="admin_stats")],
         [InlineKeyboardButton(text="👥 Пользователи", callback_data="admin_users")],
+        [InlineKeyboardButton(text="💸 Заявки на вывод", callback_data="admin_withdrawals")],
         [InlineKeyboardButton(text="📢 Добавить спонсора", callback_data="admin_add_sponsor")],
         [InlineKeyboardButton(text="📢 Рассылка", callback_data="admin_broadcast")],
         [InlineKeyboardButton(text="◀️ Назад", callback_data="main_menu")]
@@ -797,7 +900,8 @@ async def handle_admin_panel(callback: CallbackQuery):
         f"• Пользователей: {stats['total_users']}\n"
         f"• Общий баланс: {format_balance(stats['total_balance'])} STAR\n"
         f"• Всего поставлено: {format_balance(stats['total_wagered'])} STAR\n"
-        f"• Заявок на вывод: {stats['pending_withdrawals']}"
+        f"• Заявок на вывод: {stats['pending_withdrawals']}\n"
+        f"• Отсечено частых нажатий: {throttling.get_stats()['throttled']}"
     )
     
     await callback.message.edit_text(
@@ -806,25 +910,324 @@ async def handle_admin_panel(callback: CallbackQuery):
         parse_mode="Markdown"
     )
 
+ADMIN_PAGE_SIZE = 10
+
+@dp.callback_query(F.data.startswith("admin_users"))
+async def handle_admin_users(callback: CallbackQuery):
+    """Список пользователей постранично (админ)"""
+    if callback.from_user.id != Config.ADMIN_ID:
+        await callback.answer("❌ Доступ запрещен")
+        return
+    
+    # admin_users или admin_users_<after_id>
+    parts = callback.data.split("_")
+    after_id = int(parts[2]) if len(parts) > 2 else None
+    
+    users = await db.iter_users(after_id, ADMIN_PAGE_SIZE)
+    lines = [
+        f"• `{user['user_id']}` {user['username']} — {format_balance(user['balance'])} STAR"
+        for user in users
+    ]
+    
+    keyboard = []
+    if len(users) == ADMIN_PAGE_SIZE:
+        keyboard.append([InlineKeyboardButton(
+            text="▶️ Далее", callback_data=f"admin_users_{users[-1]['user_id']}"
+        )])
+    keyboard.append([InlineKeyboardButton(text="◀️ Назад", callback_data="admin_panel")])
+    
+    await callback.message.edit_text(
+        "👥 *Пользователи*\n\n" + ("\n".join(lines) or "Пусто") +
+        "\n\n📄 Выгрузка всех: /export\\_users",
+        reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard),
+        parse_mode="Markdown"
+    )
+
+@dp.callback_query(F.data.startswith("admin_withdrawals"))
+async def handle_admin_withdrawals(callback: CallbackQuery):
+    """Заявки на вывод постранично (админ)"""
+    if callback.from_user.id != Config.ADMIN_ID:
+        await callback.answer("❌ Доступ запрещен")
+        return
+    
+    # admin_withdrawals или admin_withdrawals_<created_at>_<id>
+    parts = callback.data.split("_")
+    cursor = (int(parts[2]), int(parts[3])) if len(parts) > 3 else None
+    
+    withdrawals, next_cursor = await db.iter_withdrawals("pending", cursor, ADMIN_PAGE_SIZE)
+    lines = [
+        f"• #{w['id']} `{w['user_id']}` {w['username']} — {w['amount']} STAR, "
+        f"{datetime.fromtimestamp(w['created_at']).strftime('%d.%m %H:%M')}"
+        for w in withdrawals
+    ]
+    
+    keyboard = []
+    if next_cursor:
+        keyboard.append([InlineKeyboardButton(
+            text="▶️ Далее", callback_data=f"admin_withdrawals_{next_cursor[0]}_{next_cursor[1]}"
+        )])
+    keyboard.append([InlineKeyboardButton(text="◀️ Назад", callback_data="admin_panel")])
+    
+    await callback.message.edit_text(
+        "💸 *Заявки на вывод (pending)*\n\n" + ("\n".join(lines) or "Пусто"),
+        reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard),
+        parse_mode="Markdown"
+    )
+
+def write_users_csv(path: str) -> int:
+    """Выгрузить пользователей в CSV потоково (выполняется в потоке БД)"""
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["user_id", "username", "balance", "referrer_id", "created_at",
+                         "total_wagered", "games_played", "games_won"])
+        for user in db.db.stream_users():
+            writer.writerow([user['user_id'], user['username'], user['balance'], user['referrer_id'],
+                             user['created_at'], user['total_wagered'], user['games_played'],
+                             user['games_won']])
+            count += 1
+    return count
+
+@dp.message(Command("export_users"))
+async def cmd_export_users(message: Message):
+    """Выгрузка пользователей в CSV (админ)"""
+    if message.from_user.id != Config.ADMIN_ID:
+        return
+    
+    fd, path = tempfile.mkstemp(prefix="users_", suffix=".csv")
+    os.close(fd)
+    try:
+        count = await db.run(write_users_csv, path)
+        await message.answer_document(FSInputFile(path, filename="users.csv"),
+                                      caption=f"👥 Пользователей: {count}")
+    finally:
+        os.remove(path)
+
+@dp.callback_query(F.data == "admin_broadcast")
+async def handle_admin_broadcast(callback: CallbackQuery, state: FSMContext):
+    """Начать рассылку (админ)"""
+    if callback.from_user.id != Config.ADMIN_ID:
+        await callback.answer("❌ Доступ запрещен")
+        return
+    
+    await state.set_state(AdminStates.broadcasting)
+    await callback.message.edit_text(
+        "📢 *Рассылка*\n\n"
+        "Отправьте текст сообщения для всех пользователей:",
+        reply_markup=InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="◀️ Отмена", callback_data="admin_panel")]
+        ]),
+        parse_mode="Markdown"
+    )
+
+@dp.message(AdminStates.broadcasting)
+async def handle_broadcast_text(message: Message, state: FSMContext):
+    """Текст рассылки (админ)"""
+    await state.clear()
+    if message.from_user.id != Config.ADMIN_ID:
+        return
+    
+    broadcast_id = await broadcaster.start(message.text)
+    await message.answer(
+        f"✅ Рассылка #{broadcast_id} запущена\n\n"
+        f"Прогресс: /broadcasts"
+    )
+
+@dp.message(Command("broadcasts"))
+async def cmd_broadcasts(message: Message):
+    """Прогресс рассылок (админ)"""
+    if message.from_user.id != Config.ADMIN_ID:
+        return
+    
+    broadcasts = await db.get_broadcasts(limit=5)
+    if not broadcasts:
+        await message.answer("📢 Рассылок еще не было")
+        return
+    
+    lines = [
+        f"#{b['id']} [{b['status']}] отправлено {b['sent']}, "
+        f"заблокировали {b['blocked']}, ошибок {b['failed']}"
+        for b in broadcasts
+    ]
+    await message.answer("📢 Рассылки:\n" + "\n".join(lines))
+
+@dp.message(Command("broadcast_cancel"))
+async def cmd_broadcast_cancel(message: Message):
+    """Отменить рассылку: /broadcast_cancel <id> (админ)"""
+    if message.from_user.id != Config.ADMIN_ID:
+        return
+    
+    try:
+        broadcast_id = int(message.text.split()[1])
+    except (IndexError, ValueError):
+        await message.answer("❌ Использование: /broadcast_cancel <id>")
+        return
+    
+    await broadcaster.cancel(broadcast_id)
+    await message.answer(f"🛑 Рассылка #{broadcast_id} отменена")
+
+async def archive_ledger() -> dict:
+    """Перенести старые транзакции в архив по шагам в потоке БД"""
+    moved = await db.run_steps(db.db.archive_steps(
+        Config.ARCHIVE_AFTER_DAYS,
+        Config.ARCHIVE_DIR,
+        compact=Config.ARCHIVE_COMPACT
+    ))
+    return dict(moved or {})
+
+async def archive_loop():
+    """Периодическая архивация журнала (первая — через интервал после запуска)"""
+    while True:
+        await asyncio.sleep(Config.ARCHIVE_INTERVAL)
+        try:
+            await archive_ledger()
+        except Exception as e:
+            logger.error(f"❌ Ошибка архивации: {e}")
+
+@dp.message(Command("archive"))
+async def cmd_archive(message: Message):
+    """Архивация журнала транзакций (админ)"""
+    if message.from_user.id != Config.ADMIN_ID:
+        return
+    
+    await message.answer("📦 Архивация запущена...")
+    moved = await archive_ledger()
+    lines = [f"• {month}: {rows}" for month, rows in moved.items()]
+    await message.answer("✅ Архивация завершена\n" + ("\n".join(lines) or "Нечего переносить"))
+
+async def backup_now() -> list:
+    """Резервная копия всех файлов базы (в отдельном потоке)"""
+    return await asyncio.to_thread(
+        backup_database,
+        db.db,
+        Config.BACKUP_DIR,
+        keep=Config.BACKUP_KEEP,
+        compress=Config.BACKUP_COMPRESS,
+        pages=Config.BACKUP_PAGES_PER_STEP,
+        pause=Config.BACKUP_STEP_PAUSE_MS / 1000,
+        archive_dir=Config.ARCHIVE_DIR
+    )
+
+async def backup_loop():
+    """Периодическое резервное копирование"""
+    while True:
+        await asyncio.sleep(Config.BACKUP_INTERVAL)
+        try:
+            await backup_now()
+        except Exception as e:
+            logger.error(f"❌ Ошибка резервного копирования: {e}")
+
+@dp.message(Command("backup"))
+async def cmd_backup(message: Message):
+    """Резервная копия базы (админ)"""
+    if message.from_user.id != Config.ADMIN_ID:
+        return
+    
+    await message.answer("💾 Резервное копирование запущено...")
+    try:
+        paths = await backup_now()
+    except Exception as e:
+        await message.answer(f"❌ Ошибка резервного копирования: {e}")
+        return
+    
+    lines = [f"• {os.path.basename(path)} ({os.path.getsize(path) / 1024 / 1024:.1f} МБ)" for path in paths]
+    await message.answer(
+        "✅ Резервная копия готова\n" + "\n".join(lines) +
+        "\n\nВосстановление (бот остановлен): python backup.py restore <файл>"
+    )
+
+@dp.message(Command("jackpot_draw"))
+async def cmd_jackpot_draw(message: Message):
+    """Провести розыгрыш общего джекпота сейчас (админ)"""
+    if message.from_user.id != Config.ADMIN_ID:
+        return
+    
+    result = await jackpot_pool.draw()
+    lines = [f"• {user_id}: {format_balance(payout)} STAR" for user_id, payout in result['payouts'].items()]
+    await message.answer(
+        f"🏆 Джекпот #{result['round_id']} разыгран\n"
+        f"🎟 Билетов: {result['tickets']}, пул: {format_balance(result['pool'])} STAR\n"
+        + ("\n".join(lines) or "Участников не было") +
+        f"\n\nПеренос в следующий розыгрыш: {format_balance(result['carryover'])} STAR"
+    )
+
+@dp.message(Command("rebuild_stats"))
+async def cmd_rebuild_stats(message: Message):
+    """Пересчет статистики с проверкой расхождений (админ)"""
+    if message.from_user.id != Config.ADMIN_ID:
+        return
+    
+    drift = await db.rebuild_stats()
+    if not drift:
+        await message.answer("✅ Статистика пересчитана, расхождений нет")
+        return
+    
+    lines = [
+        f"• {key}: {values['stored']:.2f} → {values['actual']:.2f}"
+        for key, values in drift.items()
+    ]
+    await message.answer("⚠️ Статистика пересчитана, исправлены расхождения:\n" + "\n".join(lines))
+
 # ========== ЗАПУСК ==========
 
 async def main():
     """Запуск бота"""
     logger.info("🚀 Запуск Monkey Stars Bot...")
+    archive_task = None
+    backup_task = None
     
     try:
         # Проверка базы
-        stats = db.get_stats()
+        stats = await db.get_stats()
         logger.info(f"✅ База данных: {stats['total_users']} пользователей")
         
+        # Продолжаем рассылки, прерванные перезапуском
+        await broadcaster.resume_all()
+        
+        # Общие раунды Banana Crash (с возвратом ставок прерванного раунда)
+        await crash_rounds.start()
+        
+        # Общий джекпот с розыгрышами по расписанию
+        await jackpot_pool.start()
+        
+        # Фоновая архивация старых транзакций
+        archive_task = asyncio.create_task(archive_loop())
+        
+        # Фоновое резервное копирование
+        backup_task = asyncio.create_task(backup_loop())
+        
         # Запуск
-        logger.info("✅ Бот запущен")
-        await dp.start_polling(bot)
+        logger.info(f"✅ Бот запущен ({Config.BOT_MODE})")
+        if Config.BOT_MODE == "webhook":
+            await WebhookServer(
+                bot, dp,
+                secret=Config.WEBHOOK_SECRET,
+                path=Config.WEBHOOK_PATH,
+                host=Config.WEBHOOK_HOST,
+                port=Config.WEBHOOK_PORT,
+                url=Config.WEBHOOK_URL,
+                queue_size=Config.WEBHOOK_QUEUE_SIZE,
+                workers=Config.WEBHOOK_WORKERS,
+                max_connections=Config.WEBHOOK_MAX_CONNECTIONS
+            ).serve()
+        else:
+            await bot.delete_webhook()  # Telegram не отдает getUpdates, пока установлен вебхук
+            await dp.start_polling(bot)
         
     except Exception as e:
         logger.error(f"❌ Ошибка: {e}")
     finally:
+        if archive_task:
+            archive_task.cancel()
+        if backup_task:
+            backup_task.cancel()
+        await broadcaster.shutdown()
+        await crash_rounds.shutdown()
+        await jackpot_pool.shutdown()
+        fair.pool.close()
+        await storage.close()
         await bot.session.close()
+        await db.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,175 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict
+
+from aiogram.exceptions import (
+    TelegramRetryAfter, TelegramForbiddenError, TelegramBadRequest, TelegramAPIError
+)
+
+from rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+class Broadcaster:
+    """Рассылка сообщений всем пользователям.
+    
+    Получатели читаются из базы порциями по user_id, отправка идет через
+    общую корзину токенов (глобальный лимит) с паузой между сообщениями
+    в один чат. Прогресс сохраняется после каждой порции и при остановке
+    (до первого недоставленного сообщения порции), поэтому после
+    перезапуска рассылка продолжается с места остановки.
+    
+    `bot` — любой объект с корутиной `send_message(chat_id, text)`,
+    в тестах его можно заменить фейком.
+    """
+    
+    PER_CHAT_INTERVAL = 1.0  # Не чаще одного сообщения в секунду в один чат
+    MAX_RETRIES = 3
+    
+    def __init__(self, bot, db, rate: float = 25, chunk_size: int = 100, concurrency: int = 10):
+        self.bot = bot
+        self.db = db
+        self.chunk_size = chunk_size
+        self.concurrency = concurrency
+        self.limiter = TokenBucket(rate, capacity=rate)
+        self._chat_last_sent: "OrderedDict[int, float]" = OrderedDict()
+        self._tasks: Dict[int, asyncio.Task] = {}
+    
+    async def start(self, text: str) -> int:
+        """Создать и запустить рассылку"""
+        broadcast_id = await self.db.create_broadcast(text)
+        self._spawn(broadcast_id)
+        logger.info(f"📢 Рассылка #{broadcast_id} запущена")
+        return broadcast_id
+    
+    async def resume_all(self) -> int:
+        """Продолжить незавершенные рассылки (после перезапуска)"""
+        broadcasts = await self.db.get_broadcasts("running", limit=100)
+        for broadcast in broadcasts:
+            self._spawn(broadcast['id'])
+            logger.info(f"📢 Рассылка #{broadcast['id']} продолжена с user_id > {broadcast['last_user_id']}")
+        return len(broadcasts)
+    
+    async def cancel(self, broadcast_id: int) -> bool:
+        """Отменить рассылку"""
+        task = self._tasks.pop(broadcast_id, None)
+        if task:
+            task.cancel()
+        return await self.db.set_broadcast_status(broadcast_id, "cancelled")
+    
+    async def shutdown(self):
+        """Остановить задачи; статус running сохраняется для продолжения"""
+        tasks = list(self._tasks.values())
+        self._tasks.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    
+    def _spawn(self, broadcast_id: int):
+        if broadcast_id in self._tasks:
+            return
+        task = asyncio.create_task(self._run(broadcast_id))
+        self._tasks[broadcast_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(broadcast_id, None))
+    
+    async def _run(self, broadcast_id: int):
+        broadcast = await self.db.get_broadcast(broadcast_id)
+        if not broadcast or broadcast['status'] != "running":
+            return
+        
+        text = broadcast['text']
+        after_id = broadcast['last_user_id']
+        counters = {
+            "sent": broadcast['sent'],
+            "failed": broadcast['failed'],
+            "blocked": broadcast['blocked']
+        }
+        semaphore = asyncio.Semaphore(self.concurrency)
+        user_ids = []
+        results: Dict[int, str] = {}  # chat_id -> sent, blocked или failed в текущей порции
+        
+        async def deliver(chat_id: int):
+            async with semaphore:
+                results[chat_id] = await self._send(chat_id, text)
+        
+        def count(chat_ids):
+            for chat_id in chat_ids:
+                counters[results[chat_id]] += 1
+        
+        try:
+            while True:
+                user_ids = await self.db.iter_user_ids(after_id, self.chunk_size)
+                if not user_ids:
+                    break
+                
+                await asyncio.gather(*(deliver(chat_id) for chat_id in user_ids))
+                count(user_ids)
+                results.clear()
+                after_id = user_ids[-1]
+                await self.db.update_broadcast_progress(
+                    broadcast_id, after_id,
+                    counters["sent"], counters["failed"], counters["blocked"]
+                )
+            
+            await self.db.update_broadcast_progress(
+                broadcast_id, after_id,
+                counters["sent"], counters["failed"], counters["blocked"], status="done"
+            )
+            logger.info(
+                f"✅ Рассылка #{broadcast_id} завершена: отправлено {counters['sent']}, "
+                f"заблокировали {counters['blocked']}, ошибок {counters['failed']}"
+            )
+        except asyncio.CancelledError:
+            # Сохранить отправленное подряд начало порции: при продолжении
+            # заново уйдут только сообщения, которые были в полете
+            done = []
+            for chat_id in user_ids:
+                if chat_id not in results:
+                    break
+                done.append(chat_id)
+            if done:
+                count(done)
+                await asyncio.shield(self.db.update_broadcast_progress(
+                    broadcast_id, done[-1],
+                    counters["sent"], counters["failed"], counters["blocked"]
+                ))
+            raise
+        except Exception as e:
+            logger.error(f"❌ Рассылка #{broadcast_id} остановлена: {e}")
+            await self.db.set_broadcast_status(broadcast_id, "failed")
+    
+    async def _wait_chat(self, chat_id: int):
+        """Соблюсти лимит на один чат"""
+        last = self._chat_last_sent.get(chat_id)
+        if last is not None:
+            wait = self.PER_CHAT_INTERVAL - (time.monotonic() - last)
+            if wait > 0:
+                await asyncio.sleep(wait)
+        self._chat_last_sent[chat_id] = time.monotonic()
+        self._chat_last_sent.move_to_end(chat_id)
+        # Старые записи уже не влияют на лимит
+        while self._chat_last_sent and len(self._chat_last_sent) > self.chunk_size * 2:
+            self._chat_last_sent.popitem(last=False)
+    
+    async def _send(self, chat_id: int, text: str) -> str:
+        """Отправить одно сообщение: sent, blocked или failed"""
+        for _ in range(self.MAX_RETRIES):
+            await self._wait_chat(chat_id)
+            await self.limiter.acquire()
+            try:
+                await self.bot.send_message(chat_id, text)
+                return "sent"
+            except TelegramRetryAfter as e:
+                # Флуд-контроль: приостанавливаем всю рассылку
+                logger.warning(f"⏳ Flood control, пауза {e.retry_after} сек")
+                self.limiter.pause(e.retry_after)
+            except TelegramForbiddenError:
+                return "blocked"
+            except TelegramBadRequest:
+                return "failed"
+            except TelegramAPIError as e:
+                logger.error(f"Ошибка отправки {chat_id}: {e}")
+                return "failed"
+        return "failed"
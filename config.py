@@ -1,4 +1,5 @@
 import os
+import re
 
 class Config:
     # Токен бота (установите в системе или прямо здесь)
@@ -14,6 +15,102 @@ class Config:
     REFERRAL_REWARD_REFEREE = 2.0
     CLICK_REFERRAL_PERCENT = 10
     
+    # Отложенная запись журнала транзакций (групповой commit)
+    LEDGER_WRITE_BEHIND = False
+    LEDGER_FLUSH_INTERVAL_MS = 200  # Максимальная задержка записи
+    LEDGER_FLUSH_MAX_ROWS = 500     # Сброс при заполнении буфера
+    
+    # Кэш статуса подписок на спонсоров (секунды)
+    SUBSCRIPTION_CACHE_TTL = 60
+    
+    # Кэш пользователей (LRU со сквозной записью)
+    USER_CACHE_SIZE = 50_000  # Максимум записей в памяти
+    USER_CACHE_TTL = 300      # Секунды
+    
+    # Рассылки (лимиты Telegram: ~30 сообщений/сек всего, 1/сек в один чат)
+    BROADCAST_RATE = 25          # Сообщений в секунду
+    BROADCAST_CHUNK_SIZE = 100   # Получателей за шаг (прогресс сохраняется после шага)
+    BROADCAST_CONCURRENCY = 10   # Одновременных запросов к Bot API
+    
+    # Архивация старых транзакций в помесячные файлы
+    ARCHIVE_AFTER_DAYS = 90
+    ARCHIVE_DIR = "archive"
+    ARCHIVE_INTERVAL = 86400  # Как часто запускать (секунды)
+    # Сжатие основной базы после переноса: "incremental" — по шагам, "full" — VACUUM
+    # (блокирует запись на все время сжатия), "" — не сжимать
+    ARCHIVE_COMPACT = "incremental"
+    
+    # Шардирование базы по user_id (1 — один файл monkey_stars.db).
+    # Выигрыш зависит от диска и числа ядер — замерьте bench/bench_shards.py.
+    # Существующий monkey_stars.db на шарды не переносится.
+    DB_SHARDS = 1
+    
+    # Автоигра: серия раундов с одним расчетом и одним сообщением
+    AUTOPLAY_ROUNDS = (10, 50)   # Варианты числа раундов
+    AUTOPLAY_BETS = (1, 5)       # Варианты ставки за раунд
+    AUTOPLAY_STOP_LOSS = 20      # Остановка при проигрыше стольких ставок
+    AUTOPLAY_STOP_WIN = 50       # Остановка при выигрыше стольких ставок
+    
+    # Общие раунды Banana Crash (множитель растет как e^(growth * t))
+    CRASH_ROUND_BETTING_TIME = 10     # Прием ставок (секунды)
+    CRASH_ROUND_GROWTH = 0.12         # x2 примерно за 6 сек, x10 — за 19 сек
+    CRASH_ROUND_HOUSE_EDGE = 0.04
+    CRASH_ROUND_MAX_MULTIPLIER = 100.0
+    CRASH_ROUND_TICK = 0.5            # Шаг таймера (секунды)
+    CRASH_ROUND_PAUSE = 3             # Пауза между раундами
+    CRASH_ROUND_EDIT_RATE = 20        # Правок сообщений в секунду на всех игроков
+    CRASH_ROUND_BETS = (1, 5, 10)
+    
+    # Общий прогрессивный джекпот
+    JACKPOT_POOL_TICKET_PRICE = 1.0
+    JACKPOT_POOL_SHARE = 0.9             # Доля продаж, идущая в пул
+    JACKPOT_POOL_PRIZES = (0.5, 0.3, 0.2)  # Доли пула призовым билетам
+    JACKPOT_POOL_DRAW_INTERVAL = 3600    # Розыгрыш раз в час (секунды)
+    JACKPOT_POOL_TICKETS = (1, 5, 10)    # Варианты покупки
+    
+    # Доказуемо честная игра
+    FAIR_CHAIN_LENGTH = 10000     # Зерен сервера в одной хеш-цепочке
+    FAIR_NONCE_BLOCK = 100        # Номеров ставок за одну запись в базу
+    FAIR_CACHE_SIZE = 10000       # Игроков с зернами в памяти
+    
+    # Состояния FSM (ввод ставки, админские сценарии) хранятся в базе
+    FSM_STATE_TTL = 86400          # Брошенное состояние сбрасывается через сутки
+    FSM_FLUSH_INTERVAL_MS = 200    # Пакетная запись изменений
+    FSM_CACHE_SIZE = 10_000        # Состояний в памяти
+    FSM_CACHE_TTL = 300            # Насколько кэш может отставать от базы; 0 — для нескольких реплик
+    
+    # Ограничение частоты действий пользователя: (токенов в секунду, запас).
+    # Действие — начало callback_data до "_", message — текстовые сообщения
+    THROTTLE_RATES = {
+        'default': (5, 10),
+        'message': (2, 5),
+        'click': (1, 3),
+        'bet': (3, 6),
+        'autoplay': (0.5, 2),
+        'withdraw': (0.5, 2),
+        'jackpot': (2, 5),
+        'crash': (5, 10),     # Забрать в общем раунде нужно без задержек
+    }
+    
+    # Получение апдейтов: "polling" или "webhook"
+    BOT_MODE = os.getenv("BOT_MODE", "polling")
+    WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")        # Публичный адрес; пусто — вебхук ставится вручную
+    WEBHOOK_PATH = "/webhook"
+    WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")  # 1-256 символов A-Z, a-z, 0-9, _ и -
+    WEBHOOK_HOST = "0.0.0.0"
+    WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+    WEBHOOK_QUEUE_SIZE = 1000     # Апдейтов в очереди; при переполнении Telegram повторит доставку
+    WEBHOOK_WORKERS = 16          # Задач, обрабатывающих очередь
+    WEBHOOK_MAX_CONNECTIONS = 40  # Одновременных запросов от Telegram (1-100)
+    
+    # Резервные копии (sqlite3 backup API, без остановки бота)
+    BACKUP_DIR = "backups"
+    BACKUP_INTERVAL = 21600       # Как часто делать копию (секунды)
+    BACKUP_KEEP = 7               # Сколько последних копий хранить
+    BACKUP_COMPRESS = True        # Сжимать копии gzip
+    BACKUP_PAGES_PER_STEP = 1024  # Страниц за шаг копирования
+    BACKUP_STEP_PAUSE_MS = 5      # Пауза между шагами, чтобы не мешать ставкам
+    
     # Суммы для вывода
     WITHDRAWAL_AMOUNTS = [15, 25, 50, 100]
     
@@ -21,6 +118,8 @@ class Config:
     GAMES = {
         'flip': {
             'name': '🎯 Monkey Flip',
+            'engine': 'flip',
+            'description': 'Подбрось банан (x2.0)',
             'win_chance': 0.49,
             'multiplier': 2.0,
             'special_event_chance': 0.015,
@@ -28,6 +127,10 @@ class Config:
         },
         'crash': {
             'name': '🚀 Banana Crash',
+            'engine': 'crash',
+            'description': 'Краш-игра',
+            'autoplay': True,
+            'menu_buttons': (("👥 Общий раунд", "crash_round"),),
             'instant_crash_chance': 0.6,
             'low_multiplier_range': (1.0, 1.1),
             'high_multiplier_chance': 0.02,
@@ -36,6 +139,9 @@ class Config:
         },
         'slot': {
             'name': '🎰 Банановый слот',
+            'engine': 'slot',
+            'description': '3 барабана',
+            'autoplay': True,
             'winning_combinations': 1,
             'total_combinations': 27,
             'win_multiplier': 20,
@@ -44,12 +150,17 @@ class Config:
         },
         'dice': {
             'name': '🎲 Банановые кости',
+            'engine': 'dice',
+            'description': 'Угадай число (x3.0)',
             'win_chance': 0.1667,  # 1/6
             'multiplier': 3.0,
             'min_bet': 1.0
         },
         'jackpot': {
             'name': '💰 Джекпот',
+            'engine': 'jackpot',
+            'description': 'Шанс x100',
+            'menu_buttons': (("🏆 Общий джекпот", "jackpot_pool"),),
             'ticket_price': 1.0,
             'win_chance': 0.01,
             'multiplier': 100.0,
@@ -68,4 +179,11 @@ class Config:
                 "3. Или установите в системе:\n"
                 "   export BOT_TOKEN='ваш_токен'"
             )
+        if cls.BOT_MODE not in ("polling", "webhook"):
+            raise ValueError(f"❌ BOT_MODE должен быть polling или webhook, а не {cls.BOT_MODE!r}")
+        if cls.BOT_MODE == "webhook" and not re.fullmatch(r"[A-Za-z0-9_-]{1,256}", cls.WEBHOOK_SECRET):
+            raise ValueError(
+                "❌ Для режима webhook задайте WEBHOOK_SECRET:\n"
+                "   export WEBHOOK_SECRET='случайная_строка'"
+            )
         return True
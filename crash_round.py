@@ -0,0 +1,309 @@
+import asyncio
+import logging
+import math
+import random
+import secrets
+import time
+from collections import deque
+from typing import Dict, Optional, Set, Tuple
+
+from aiogram.exceptions import TelegramRetryAfter, TelegramBadRequest, TelegramAPIError
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+from fair_rng import FairRandom, hash_seed
+from rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+class CrashRound:
+    """Состояние одного общего раунда"""
+    
+    __slots__ = ("id", "server_seed", "server_hash", "crash_point", "phase", "betting_ends_at",
+                 "started_at", "bets", "cashouts", "messages", "queue", "edited")
+    
+    def __init__(self, round_id: int, server_seed: str, crash_point: float, betting_ends_at: float):
+        self.id = round_id
+        self.server_seed = server_seed
+        self.server_hash = hash_seed(server_seed)  # Показывается до старта, зерно — после краша
+        self.crash_point = crash_point
+        self.phase = "betting"  # betting -> running -> crashed
+        self.betting_ends_at = betting_ends_at
+        self.started_at: Optional[float] = None
+        self.bets: Dict[int, float] = {}
+        self.cashouts: Dict[int, float] = {}
+        self.messages: Dict[int, Tuple[int, int]] = {}  # user_id -> (chat_id, message_id)
+        self.queue: deque = deque()  # Очередь обновления сообщений (давно обновленные — слева)
+        self.edited: Dict[int, float] = {}
+
+class CrashRoundScheduler:
+    """Общие раунды Banana Crash.
+    
+    Раз в несколько секунд открывается прием ставок, затем множитель
+    растет как e^(growth * t) по одному таймеру на всех игроков. Точка
+    краша — одно число из FairRandom(зерно раунда, CLIENT_SEED, id раунда):
+    хеш зерна игроки видят при ставке, само зерно — после краша, и точку
+    можно пересчитать (/fair_verify round). Выдача по ней вычисляется
+    по времени нажатия, а не по тику, поэтому редкие обновления сообщений
+    не влияют на выигрыш. После краша все ставки рассчитываются одной
+    транзакцией (Database.settle_round); при ошибке расчет повторяется,
+    и итоги показываются только после него.
+    
+    Сообщения игроков обновляются в пределах общего бюджета edit_rate
+    правок в секунду: на каждом тике правятся самые давно обновленные,
+    промежуточные значения множителя пропускаются.
+    """
+    
+    PER_MESSAGE_INTERVAL = 1.0  # Не чаще одной правки сообщения в секунду
+    EDIT_CONCURRENCY = 10
+    CLIENT_SEED = "crash_round"  # Общий раунд: зерна игрока нет, nonce — id раунда
+    SETTLE_RETRY_DELAY = 1.0  # Повтор расчета раунда при ошибке базы, с удвоением
+    SETTLE_RETRY_MAX_DELAY = 30.0
+    
+    def __init__(self, bot, db, betting_time: float = 10, growth: float = 0.12,
+                 house_edge: float = 0.04, max_multiplier: float = 100.0, tick: float = 0.5,
+                 pause: float = 3, edit_rate: float = 20, seeds=None):
+        self.bot = bot
+        self.db = db
+        self.seeds = seeds  # SeedChainPool; без него — secrets.token_hex
+        self.betting_time = betting_time
+        self.growth = growth
+        self.house_edge = house_edge
+        self.max_multiplier = max_multiplier
+        self.tick = tick
+        self.pause = pause
+        self.limiter = TokenBucket(edit_rate, capacity=edit_rate)
+        self.round: Optional[CrashRound] = None
+        self._pending_joins = 0
+        self._joins_done = asyncio.Event()
+        self._joins_done.set()
+        self._edit_semaphore = asyncio.Semaphore(self.EDIT_CONCURRENCY)
+        self._edits: Set[asyncio.Task] = set()
+        self._task: Optional[asyncio.Task] = None
+    
+    # === ЖИЗНЕННЫЙ ЦИКЛ ===
+    async def start(self):
+        """Вернуть ставки прерванных раундов и запустить расписание"""
+        await self.db.refund_open_bets()
+        self._task = asyncio.create_task(self._loop())
+        logger.info("🚀 Общие раунды Banana Crash запущены")
+    
+    async def shutdown(self):
+        """Остановить раунды; нерассчитанные ставки вернутся при следующем запуске"""
+        tasks = [task for task in (self._task, *self._edits) if task]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+    
+    async def _loop(self):
+        while True:
+            try:
+                await self._play_round()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Ошибка раунда Banana Crash: {e}")
+            await asyncio.sleep(self.pause)
+    
+    # === МАТЕМАТИКА РАУНДА ===
+    def draw_crash_point(self, rng: random.Random = random) -> float:
+        """Точка краша: P(краш >= m) = (1 - house_edge) / m, одно случайное число"""
+        point = math.floor(100 * (1 - self.house_edge) / (1 - rng.random())) / 100
+        return min(max(point, 1.0), self.max_multiplier)
+    
+    def round_crash_point(self, server_seed: str, round_id: int) -> float:
+        """Точка краша раунда по его зерну (для проверки игроком)"""
+        return self.draw_crash_point(FairRandom(server_seed, self.CLIENT_SEED, round_id))
+    
+    def multiplier_at(self, round_: CrashRound, now: float) -> float:
+        """Множитель в момент now (с точностью до сотых, вниз)"""
+        elapsed = max(0.0, now - round_.started_at)
+        return math.floor(100 * math.exp(self.growth * elapsed)) / 100
+    
+    # === ИГРОКИ ===
+    @property
+    def accepting_bets(self) -> bool:
+        return self.round is not None and self.round.phase == "betting"
+    
+    def seconds_to_start(self) -> int:
+        if not self.accepting_bets:
+            return 0
+        return max(0, math.ceil(self.round.betting_ends_at - time.monotonic()))
+    
+    def in_round(self, user_id: int) -> bool:
+        return self.round is not None and user_id in self.round.bets
+    
+    async def join(self, user_id: int, bet: float, chat_id: int, message_id: int) -> Optional[float]:
+        """Войти в раунд: ставка списывается сразу. None — прием закрыт или не хватает баланса"""
+        round_ = self.round
+        if round_ is None or round_.phase != "betting" or user_id in round_.bets:
+            return None
+        
+        round_.bets[user_id] = bet  # Занимаем место, пока идет запись в базу
+        self._pending_joins += 1
+        self._joins_done.clear()
+        try:
+            balance = await self.db.place_round_bet(user_id, round_.id, bet)
+        finally:
+            self._pending_joins -= 1
+            if not self._pending_joins:
+                self._joins_done.set()
+        
+        if balance is None:
+            round_.bets.pop(user_id, None)
+            return None
+        round_.messages[user_id] = (chat_id, message_id)
+        round_.queue.append(user_id)
+        return balance
+    
+    def cash_out(self, user_id: int) -> Optional[float]:
+        """Забрать выигрыш по текущему множителю; None — поздно или нет ставки"""
+        round_ = self.round
+        if (round_ is None or round_.phase != "running" or round_.started_at is None
+                or user_id not in round_.bets or user_id in round_.cashouts):
+            return None
+        
+        multiplier = self.multiplier_at(round_, time.monotonic())
+        if multiplier >= round_.crash_point:
+            return None  # Краш уже случился, таймер просто еще не дошел
+        round_.cashouts[user_id] = multiplier
+        return multiplier
+    
+    # === РАУНД ===
+    async def _play_round(self):
+        round_id = int(time.time() * 1000)
+        server_seed = self.seeds.pop() if self.seeds is not None else secrets.token_hex(32)
+        round_ = CrashRound(
+            round_id,
+            server_seed,
+            self.round_crash_point(server_seed, round_id),
+            time.monotonic() + self.betting_time
+        )
+        self.round = round_
+        await asyncio.sleep(self.betting_time)
+        
+        round_.phase = "running"
+        await self._joins_done.wait()  # Ставки, которые уже пишутся в базу, входят в раунд
+        if not round_.bets:
+            round_.phase = "crashed"
+            return
+        
+        round_.started_at = time.monotonic()
+        crash_at = round_.started_at + math.log(round_.crash_point) / self.growth
+        while True:
+            now = time.monotonic()
+            if now >= crash_at:
+                break
+            self._refresh(round_, now)
+            await asyncio.sleep(min(self.tick, crash_at - now))
+        
+        round_.phase = "crashed"
+        settled = await self._settle(round_)
+        payout = sum(round_.bets[user_id] * m for user_id, m in round_.cashouts.items())
+        logger.info(
+            f"💥 Раунд {round_.id}: краш x{round_.crash_point:.2f}, зерно {round_.server_seed}, игроков {settled}, "
+            f"забрали {len(round_.cashouts)}, выплачено {payout:.2f} STAR"
+        )
+        self._spawn(self._finish(round_))
+    
+    async def _settle(self, round_: CrashRound) -> int:
+        """Рассчитать все ставки раунда, повторяя при ошибках базы.
+        
+        settle_round трогает только открытые ставки, поэтому повтор
+        дорассчитывает остаток. Пока ставки открыты, новый раунд не
+        начинается и итоги игрокам не показываются: иначе после перезапуска
+        refund_open_bets вернул бы забравшим только ставку без выигрыша.
+        """
+        cashouts = dict(round_.cashouts)
+        settled = 0
+        delay = self.SETTLE_RETRY_DELAY
+        while True:
+            settled += await self.db.settle_round(round_.id, cashouts)
+            if settled >= len(round_.bets):
+                return settled
+            logger.error(
+                f"❌ Раунд {round_.id} рассчитан не полностью ({settled} из {len(round_.bets)}), "
+                f"повтор через {delay:.0f} сек"
+            )
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.SETTLE_RETRY_MAX_DELAY)
+    
+    # === СООБЩЕНИЯ ===
+    def _refresh(self, round_: CrashRound, now: float):
+        """Обновить самые давно обновленные сообщения в пределах бюджета"""
+        multiplier = self.multiplier_at(round_, now)
+        queue = round_.queue
+        while queue:
+            user_id = queue[0]
+            if now - round_.edited.get(user_id, 0.0) < self.PER_MESSAGE_INTERVAL:
+                break  # Слева самые старые: остальные обновлялись еще позже
+            if not self.limiter.try_acquire(now=now):
+                break
+            queue.rotate(-1)
+            round_.edited[user_id] = now
+            text, markup = self._running_message(round_, user_id, multiplier)
+            self._spawn(self._edit(*round_.messages[user_id], text, markup))
+    
+    def _running_message(self, round_: CrashRound, user_id: int,
+                         multiplier: float) -> Tuple[str, Optional[InlineKeyboardMarkup]]:
+        bet = round_.bets[user_id]
+        cashout = round_.cashouts.get(user_id)
+        if cashout:
+            return (
+                f"🚀 *Banana Crash: общий раунд*\n\n"
+                f"📈 Множитель: *x{multiplier:.2f}*\n"
+                f"✅ Вы забрали на x{cashout:.2f}: *+{bet * cashout:.2f} STAR*",
+                None
+            )
+        return (
+            f"🚀 *Banana Crash: общий раунд*\n\n"
+            f"📈 Множитель: *x{multiplier:.2f}*\n"
+            f"💰 Ставка: *{bet} STAR*\n\n"
+            f"Заберите выигрыш до краша!",
+            InlineKeyboardMarkup(inline_keyboard=[
+                [InlineKeyboardButton(text=f"💰 Забрать ~{bet * multiplier:.2f} STAR", callback_data="crash_cashout")]
+            ])
+        )
+    
+    async def _finish(self, round_: CrashRound):
+        """Итог раунда каждому игроку (в пределах бюджета правок)"""
+        markup = InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="🚀 Следующий раунд", callback_data="crash_round")],
+            [InlineKeyboardButton(text="🎮 Все игры", callback_data="play_games")]
+        ])
+        for user_id, (chat_id, message_id) in round_.messages.items():
+            bet = round_.bets[user_id]
+            cashout = round_.cashouts.get(user_id)
+            result = (
+                f"✅ Вы забрали на x{cashout:.2f}: *+{bet * cashout:.2f} STAR*" if cashout
+                else f"❌ Ставка {bet} STAR сгорела"
+            )
+            await self.limiter.acquire()
+            self._spawn(self._edit(
+                chat_id, message_id,
+                f"💥 *Краш на x{round_.crash_point:.2f}*\n\n{result}\n\n"
+                f"🔐 Раунд `{round_.id}`, зерно `{round_.server_seed}`",
+                markup
+            ))
+    
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._edits.add(task)
+        task.add_done_callback(self._edits.discard)
+    
+    async def _edit(self, chat_id: int, message_id: int, text: str,
+                    markup: Optional[InlineKeyboardMarkup]):
+        async with self._edit_semaphore:
+            try:
+                await self.bot.edit_message_text(
+                    text, chat_id=chat_id, message_id=message_id,
+                    reply_markup=markup, parse_mode="Markdown"
+                )
+            except TelegramRetryAfter as e:
+                # Флуд-контроль: останавливаем все правки
+                logger.warning(f"⏳ Flood control, пауза {e.retry_after} сек")
+                self.limiter.pause(e.retry_after)
+            except TelegramBadRequest:
+                pass  # Сообщение удалено или не изменилось
+            except TelegramAPIError as e:
+                logger.error(f"Ошибка обновления раунда для {chat_id}: {e}")
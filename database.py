@@ -1,22 +1,176 @@
+import os
+import json
 import sqlite3
+import threading
 import time
 import logging
-from typing import Optional, Dict, List, Tuple
-from datetime import datetime
+from array import array
+from calendar import timegm
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional, Dict, List, Tuple, Iterator
+
+import migrations
 
 logger = logging.getLogger(__name__)
 
+# Счетчик SQL-запросов текущего апдейта (см. count_queries): [число]
+_query_counter: ContextVar[Optional[List]] = ContextVar("query_counter", default=None)
+
+class CountingConnection(sqlite3.Connection):
+    """Подключение, которое считает запросы для count_queries.
+    
+    Один вызов execute или executemany — один запрос, управление
+    транзакциями не считается. trace-callback SQLite для этого не
+    подходит: он повторяет текст запроса на каждый сработавший триггер,
+    и повтор не отличить от второго такого же запроса.
+    """
+    
+    @staticmethod
+    def _count(sql: str):
+        counter = _query_counter.get()
+        if counter is not None and not sql.lstrip().upper().startswith(("BEGIN", "COMMIT", "ROLLBACK")):
+            counter[0] += 1
+    
+    def execute(self, sql: str, *args) -> sqlite3.Cursor:
+        self._count(sql)
+        return super().execute(sql, *args)
+    
+    def executemany(self, sql: str, *args) -> sqlite3.Cursor:
+        self._count(sql)
+        return super().executemany(sql, *args)
+
+@contextmanager
+def count_queries():
+    """Посчитать SQL-запросы внутри блока: `with count_queries() as counter: ...`.
+    
+    Счетчик лежит в contextvar, AsyncDatabase копирует контекст в поток БД,
+    поэтому учитываются и запросы через `await db.method()`.
+    """
+    counter = [0]
+    token = _query_counter.set(counter)
+    try:
+        yield counter
+    finally:
+        _query_counter.reset(token)
+
 class Database:
-    def __init__(self, db_path: str = "monkey_stars.db"):
+    # Настройки подключения (применяются один раз при открытии)
+    PRAGMAS = (
+        "PRAGMA auto_vacuum=INCREMENTAL",  # только для новой базы: архивация возвращает место по шагам
+        "PRAGMA journal_mode=WAL",       # читатели не блокируют писателя
+        "PRAGMA synchronous=NORMAL",     # в WAL безопасно, fsync только на checkpoint
+        "PRAGMA cache_size=-16000",      # ~16 МБ кэша страниц
+        "PRAGMA mmap_size=268435456",    # 256 МБ memory-mapped I/O
+        "PRAGMA temp_store=MEMORY",
+        "PRAGMA busy_timeout=5000",
+    )
+    STATEMENT_CACHE_SIZE = 256  # Кэш подготовленных запросов на подключение
+    USER_REAL_COLUMNS = ('balance', 'total_wagered')
+    
+    def __init__(self, db_path: str = "monkey_stars.db",
+                 ledger_write_behind: bool = False,
+                 ledger_flush_interval_ms: int = 200,
+                 ledger_flush_max_rows: int = 500,
+                 subscription_cache_ttl: int = 60,
+                 subscription_cache_size: int = 100_000,
+                 user_cache_size: int = 50_000,
+                 user_cache_ttl: int = 300):
         self.db_path = db_path
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
         self.init_db()
+        
+        # LRU-кэш пользователей со сквозной записью
+        self.user_cache_size = user_cache_size  # Ограничение памяти (число записей)
+        self.user_cache_ttl = user_cache_ttl
+        self._user_cache: "OrderedDict[int, Tuple[Dict, float]]" = OrderedDict()
+        self._user_cache_version = 0  # Растет при каждой записи в кэш
+        self._user_cache_lock = threading.Lock()
+        self._user_cache_hits = 0
+        self._user_cache_misses = 0
+        
+        # Кэш списка спонсоров и статуса "подписан на всех"
+        self.subscription_cache_ttl = subscription_cache_ttl
+        self.subscription_cache_size = subscription_cache_size
+        self._sponsors_cache: Optional[List[Dict]] = None
+        self._subscribed_cache: "OrderedDict[int, Tuple[bool, float]]" = OrderedDict()
+        self._sponsors_generation = 0  # Растет при изменении списка спонсоров
+        self._sponsors_lock = threading.Lock()
+        
+        # Отложенная (групповая) запись журнала транзакций
+        self.ledger_write_behind = ledger_write_behind
+        self.ledger_flush_interval = ledger_flush_interval_ms / 1000
+        self.ledger_flush_max_rows = ledger_flush_max_rows
+        self._ledger_buffer: List[Tuple] = []
+        self._ledger_lock = threading.Lock()
+        self._ledger_flush_lock = threading.Lock()
+        self._ledger_wakeup = threading.Event()
+        self._ledger_stop = threading.Event()
+        self._ledger_metrics = {
+            "flushes": 0,
+            "rows_flushed": 0,
+            "last_flush_size": 0,
+            "max_flush_size": 0,
+            "last_flush_ms": 0.0,
+            "max_queue_depth": 0
+        }
+        self._ledger_thread = None
+        if ledger_write_behind:
+            self._ledger_thread = threading.Thread(
+                target=self._ledger_flush_loop,
+                name="ledger-flush",
+                daemon=True
+            )
+            self._ledger_thread.start()
     
-    def get_connection(self):
-        """Получить подключение к базе"""
-        conn = sqlite3.connect(self.db_path)
+    def get_connection(self) -> sqlite3.Connection:
+        """Получить подключение к базе (одно долгоживущее на поток)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+    
+    def _connect(self) -> sqlite3.Connection:
+        """Открыть новое подключение с настройками"""
+        conn = sqlite3.connect(
+            self.db_path,
+            cached_statements=self.STATEMENT_CACHE_SIZE,
+            check_same_thread=False,  # Закрываются из основного потока в close()
+            factory=CountingConnection
+        )
         conn.row_factory = sqlite3.Row  # Для работы с колонками по имени
+        for pragma in self.PRAGMAS:
+            sqlite3.Connection.execute(conn, pragma)  # Настройка подключения — не запрос апдейта
         return conn
     
+    def close(self):
+        """Сбросить журнал и закрыть все подключения"""
+        if self._ledger_thread:
+            self._ledger_stop.set()
+            self._ledger_wakeup.set()
+            self._ledger_thread.join()
+            self._ledger_thread = None
+        self.flush_transactions()
+        
+        with self._connections_lock:
+            connections = self._connections
+            self._connections = []
+            self._local = threading.local()
+        
+        for conn in connections:
+            try:
+                conn.close()
+            except Exception as e:
+                logger.error(f"Ошибка закрытия подключения: {e}")
+        
+        logger.info("✅ Подключения к базе данных закрыты")
+    
     def init_db(self):
         """Инициализация базы данных"""
         with self.get_connection() as conn:
@@ -85,76 +239,161 @@ class Database:
             ''')
             
             conn.commit()
-            logger.info("✅ База данных инициализирована")
+            
+            # Версионированные миграции (индексы и последующие изменения схемы)
+            version = migrations.migrate(conn)
+            logger.info(f"✅ База данных инициализирована (схема v{version})")
+        
+        for name, plan in self.check_query_plans().items():
+            logger.warning(f"⚠️ Запрос {name} без индекса: {'; '.join(plan)}")
+    
+    def check_query_plans(self) -> Dict[str, List[str]]:
+        """Найти горячие запросы с полным сканированием (EXPLAIN QUERY PLAN)"""
+        return migrations.find_full_scans(self.get_connection())
+    
+    # === КЭШ ПОЛЬЗОВАТЕЛЕЙ ===
+    def _cache_user(self, row: sqlite3.Row):
+        """Записать актуальную строку пользователя в кэш.
+        
+        Вызывается внутри транзакции записи, пока удерживается блокировка
+        SQLite, поэтому порядок записей в кэш совпадает с порядком commit.
+        """
+        user = dict(row)
+        # RETURNING отдает значения до приведения к REAL
+        for column in self.USER_REAL_COLUMNS:
+            if user.get(column) is not None:
+                user[column] = float(user[column])
+        with self._user_cache_lock:
+            self._user_cache_version += 1
+            self._user_cache[user['user_id']] = (user, time.monotonic() + self.user_cache_ttl)
+            self._user_cache.move_to_end(user['user_id'])
+            while len(self._user_cache) > self.user_cache_size:
+                self._user_cache.popitem(last=False)
+    
+    def _invalidate_user(self, user_id: int):
+        """Удалить пользователя из кэша"""
+        with self._user_cache_lock:
+            self._user_cache_version += 1
+            self._user_cache.pop(user_id, None)
+    
+    def get_user_cache_stats(self) -> Dict:
+        """Счетчики кэша пользователей"""
+        with self._user_cache_lock:
+            return {
+                "size": len(self._user_cache),
+                "max_size": self.user_cache_size,
+                "hits": self._user_cache_hits,
+                "misses": self._user_cache_misses
+            }
     
     # === ПОЛЬЗОВАТЕЛИ ===
     def get_user(self, user_id: int) -> Optional[Dict]:
         """Получить пользователя по ID"""
+        with self._user_cache_lock:
+            cached = self._user_cache.get(user_id)
+            if cached and cached[1] > time.monotonic():
+                self._user_cache.move_to_end(user_id)
+                self._user_cache_hits += 1
+                return dict(cached[0])
+            self._user_cache_misses += 1
+            version = self._user_cache_version
+        
         with self.get_connection() as conn:
             cursor = conn.execute(
                 "SELECT * FROM users WHERE user_id = ?",
                 (user_id,)
             )
             row = cursor.fetchone()
-            return dict(row) if row else None
+        if not row:
+            return None
+        
+        user = dict(row)
+        with self._user_cache_lock:
+            # Не кладем в кэш, если за время чтения была запись
+            if version == self._user_cache_version:
+                self._user_cache[user_id] = (dict(user), time.monotonic() + self.user_cache_ttl)
+                while len(self._user_cache) > self.user_cache_size:
+                    self._user_cache.popitem(last=False)
+        return user
     
     def create_user(self, user_id: int, username: str, referrer_id: int = None) -> bool:
         """Создать нового пользователя"""
         try:
-            with self.get_connection() as conn:
-                # Проверяем, есть ли уже пользователь
-                existing = self.get_user(user_id)
-                if existing:
-                    return True
-                
-                # Создаем пользователя
-                conn.execute('''
-                    INSERT INTO users (user_id, username, referrer_id, created_at)
-                    VALUES (?, ?, ?, ?)
-                ''', (user_id, username or f"user_{user_id}", referrer_id, int(time.time())))
-                
-                conn.commit()
-                
-                # Если есть реферер, начисляем бонусы
-                if referrer_id:
-                    from config import Config
-                    
-                    # Бонус рефереру (3 STAR)
-                    self.update_balance(referrer_id, Config.REFERRAL_REWARD_REFERRER)
-                    self.add_transaction(
-                        referrer_id,
-                        Config.REFERRAL_REWARD_REFERRER,
-                        "referral_bonus",
-                        f"За приглашение {username}"
-                    )
-                    
-                    # Бонус рефералу (2 STAR)
-                    self.update_balance(user_id, Config.REFERRAL_REWARD_REFEREE)
-                    self.add_transaction(
-                        user_id,
-                        Config.REFERRAL_REWARD_REFEREE,
-                        "referral_bonus",
-                        "За регистрацию по реферальной ссылке"
-                    )
-                
-                logger.info(f"✅ Пользователь {user_id} создан")
-                return True
+            if not self.insert_user(user_id, username, referrer_id):
+                return True  # Пользователь уже есть
+            
+            # Если есть реферер, начисляем бонусы
+            if referrer_id:
+                self.apply_referral_bonus(user_id, username, referrer_id)
+            
+            logger.info(f"✅ Пользователь {user_id} создан")
+            return True
                 
         except Exception as e:
             logger.error(f"Ошибка создания пользователя {user_id}: {e}")
             return False
     
+    def insert_user(self, user_id: int, username: str, referrer_id: int = None) -> bool:
+        """Добавить строку пользователя; False, если он уже существует"""
+        # Проверяем, есть ли уже пользователь
+        if self.get_user(user_id):
+            return False
+        
+        with self.get_connection() as conn:
+            cursor = conn.execute('''
+                INSERT INTO users (user_id, username, referrer_id, created_at)
+                VALUES (?, ?, ?, ?)
+                RETURNING *
+            ''', (user_id, username or f"user_{user_id}", referrer_id, int(time.time())))
+            self._cache_user(cursor.fetchone())
+            return True
+    
+    def apply_referral_bonus(self, user_id: int, username: str, referrer_id: int,
+                             referrer_db: "Database" = None):
+        """Начислить бонусы за регистрацию по реферальной ссылке.
+        
+        referrer_db — база, где хранится реферер (в шардированном режиме
+        это может быть другой файл).
+        """
+        from config import Config
+        referrer_db = referrer_db or self
+        
+        # Бонус рефереру (3 STAR); реферера может не быть в базе — тогда без записи в журнал
+        referrer_db.credit_balance(
+            referrer_id,
+            Config.REFERRAL_REWARD_REFERRER,
+            "referral_bonus",
+            f"За приглашение {username}"
+        )
+        
+        # Бонус рефералу (2 STAR)
+        self.credit_balance(
+            user_id,
+            Config.REFERRAL_REWARD_REFEREE,
+            "referral_bonus",
+            "За регистрацию по реферальной ссылке"
+        )
+    
     def update_balance(self, user_id: int, amount: float) -> bool:
-        """Обновить баланс пользователя"""
+        """Обновить баланс пользователя.
+        
+        Списание проходит только если баланса хватает: проверка и изменение —
+        один UPDATE, поэтому параллельные списания не уводят баланс в минус.
+        False — пользователя нет или не хватает баланса.
+        """
         try:
             with self.get_connection() as conn:
-                conn.execute(
-                    "UPDATE users SET balance = balance + ? WHERE user_id = ?",
-                    (amount, user_id)
+                cursor = conn.execute(
+                    "UPDATE users SET balance = balance + ? WHERE user_id = ? AND balance + ? >= 0 RETURNING *",
+                    (amount, user_id, amount)
                 )
+                row = cursor.fetchone()
+                if row:
+                    self._cache_user(row)
                 conn.commit()
-                return True
+                return row is not None
         except Exception as e:
+            self._invalidate_user(user_id)
             logger.error(f"Ошибка обновления баланса {user_id}: {e}")
             return False
     
@@ -162,68 +401,646 @@ class Database:
         """Обновить время последнего клика"""
         try:
             with self.get_connection() as conn:
-                conn.execute(
-                    "UPDATE users SET last_click = ? WHERE user_id = ?",
+                cursor = conn.execute(
+                    "UPDATE users SET last_click = ? WHERE user_id = ? RETURNING *",
                     (int(time.time()), user_id)
                 )
+                row = cursor.fetchone()
+                if row:
+                    self._cache_user(row)
                 conn.commit()
                 return True
         except Exception as e:
+            self._invalidate_user(user_id)
             logger.error(f"Ошибка обновления last_click {user_id}: {e}")
             return False
     
-    def update_game_stats(self, user_id: int, wagered: float, won: bool) -> bool:
-        """Обновить статистику игр"""
+    def _credit(self, conn: sqlite3.Connection, user_id: int, amount: float,
+                type: str, description: str, now: int) -> bool:
+        """Начисление и строка журнала в открытой транзакции"""
+        row = conn.execute(
+            "UPDATE users SET balance = balance + ? WHERE user_id = ? RETURNING *",
+            (amount, user_id)
+        ).fetchone()
+        if row is None:
+            return False
+        self._cache_user(row)
+        conn.execute(
+            "INSERT INTO transactions (user_id, amount, type, description, created_at) VALUES (?, ?, ?, ?, ?)",
+            (user_id, amount, type, description, now)
+        )
+        return True
+    
+    def credit_balance(self, user_id: int, amount: float, type: str, description: str = "") -> bool:
+        """Начислить сумму и записать ее в журнал одной транзакцией"""
         try:
             with self.get_connection() as conn:
-                # Обновляем общую сумму ставок и количество игр
+                return self._credit(conn, user_id, amount, type, description, int(time.time()))
+        except Exception as e:
+            self._invalidate_user(user_id)
+            logger.error(f"Ошибка начисления {user_id}: {e}")
+            return False
+    
+    def claim_click(self, user_id: int, reward: float, cooldown: int,
+                    referral_bonus: float = 0.0, referral_note: str = "") -> Optional[Dict]:
+        """Начислить награду кликера, если прошел кулдаун.
+        
+        Кулдаун проверяется в том же UPDATE, что начисляет награду, — два
+        одновременных клика не получат награду дважды. referral_bonus
+        начисляется рефереру в той же транзакции. Возвращает обновленного
+        пользователя или None, если кулдаун еще идет.
+        """
+        now = int(time.time())
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.execute('''
+                    UPDATE users
+                    SET balance = balance + ?, last_click = ?
+                    WHERE user_id = ? AND (last_click IS NULL OR last_click <= ?)
+                    RETURNING *
+                ''', (reward, now, user_id, now - cooldown))
+                row = cursor.fetchone()
+                if row is None:
+                    return None
+                self._cache_user(row)
+                
                 conn.execute(
-                    "UPDATE users SET total_wagered = total_wagered + ?, games_played = games_played + 1 WHERE user_id = ?",
-                    (wagered, user_id)
+                    "INSERT INTO transactions (user_id, amount, type, description, created_at) VALUES (?, ?, ?, ?, ?)",
+                    (user_id, reward, "click", "Кликер", now)
                 )
-                
-                # Если выиграл - увеличиваем счетчик побед
-                if won:
-                    conn.execute(
-                        "UPDATE users SET games_won = games_won + 1 WHERE user_id = ?",
-                        (user_id,)
-                    )
+                if referral_bonus and row['referrer_id']:
+                    self._credit(conn, row['referrer_id'], referral_bonus, "referral_income", referral_note, now)
+            return self.get_user(user_id)
+        except Exception as e:
+            self._invalidate_user(user_id)
+            logger.error(f"Ошибка начисления клика {user_id}: {e}")
+            return None
+    
+    def update_game_stats(self, user_id: int, wagered: float, won: bool) -> bool:
+        """Обновить статистику игр"""
+        try:
+            with self.get_connection() as conn:
+                # Сумма ставок, количество игр и побед одним запросом
+                cursor = conn.execute('''
+                    UPDATE users
+                    SET total_wagered = total_wagered + ?,
+                        games_played = games_played + 1,
+                        games_won = games_won + ?
+                    WHERE user_id = ?
+                    RETURNING *
+                ''', (wagered, int(won), user_id))
+                row = cursor.fetchone()
+                if row:
+                    self._cache_user(row)
                 
                 conn.commit()
                 return True
         except Exception as e:
+            self._invalidate_user(user_id)
             logger.error(f"Ошибка обновления статистики {user_id}: {e}")
             return False
     
+    def settle_bet(self, user_id: int, game: str, bet: float, payout: float,
+                   description: str = None) -> Optional[float]:
+        """Рассчитать ставку одной транзакцией.
+        
+        Списывает ставку (только если хватает баланса), начисляет выигрыш,
+        пишет транзакцию и статистику. Возвращает новый баланс или None,
+        если баланса недостаточно.
+        """
+        won = payout > 0
+        net = payout - bet
+        if description is None:
+            description = f"{game} {'выигрыш' if won else 'проигрыш'}"
+        
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.execute('''
+                    UPDATE users
+                    SET balance = balance + ?,
+                        total_wagered = total_wagered + ?,
+                        games_played = games_played + 1,
+                        games_won = games_won + ?
+                    WHERE user_id = ? AND balance >= ?
+                    RETURNING *
+                ''', (net, bet, int(won), user_id, bet))
+                row = cursor.fetchone()
+                if row is None:
+                    return None
+                self._cache_user(row)
+                
+                conn.execute(
+                    "INSERT INTO transactions (user_id, amount, type, description, created_at) VALUES (?, ?, ?, ?, ?)",
+                    (user_id, net, "game_win" if won else "game_lose", description, int(time.time()))
+                )
+                return float(row['balance'])
+        except Exception as e:
+            self._invalidate_user(user_id)
+            logger.error(f"Ошибка расчета ставки {user_id}: {e}")
+            return None
+    
+    def settle_batch(self, user_id: int, game: str, wagered: float, payout: float, rounds: int,
+                     wins: int, required_balance: float, description: str = None) -> Optional[float]:
+        """Рассчитать серию раундов (автоигру) одной транзакцией.
+        
+        required_balance — минимальный стартовый баланс, при котором ни один
+        раунд серии не ушел в минус (его считает GameEngine.play_batch).
+        В журнал пишется одна строка с итогом серии. Возвращает новый
+        баланс или None, если баланса недостаточно.
+        """
+        net = payout - wagered
+        if description is None:
+            description = f"{game} автоигра: {rounds} раундов"
+        
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.execute('''
+                    UPDATE users
+                    SET balance = balance + ?,
+                        total_wagered = total_wagered + ?,
+                        games_played = games_played + ?,
+                        games_won = games_won + ?
+                    WHERE user_id = ? AND balance >= ?
+                    RETURNING *
+                ''', (net, wagered, rounds, wins, user_id, required_balance))
+                row = cursor.fetchone()
+                if row is None:
+                    return None
+                self._cache_user(row)
+                
+                conn.execute(
+                    "INSERT INTO transactions (user_id, amount, type, description, created_at) VALUES (?, ?, ?, ?, ?)",
+                    (user_id, net, "game_win" if net > 0 else "game_lose", description, int(time.time()))
+                )
+                return float(row['balance'])
+        except Exception as e:
+            self._invalidate_user(user_id)
+            logger.error(f"Ошибка расчета автоигры {user_id}: {e}")
+            return None
+    
+    # === ОБЩИЕ РАУНДЫ CRASH ===
+    def place_round_bet(self, user_id: int, round_id: int, bet: float) -> Optional[float]:
+        """Списать ставку за вход в раунд и записать ее (одна транзакция).
+        
+        Возвращает новый баланс или None, если баланса недостаточно
+        или пользователь уже в этом раунде.
+        """
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.execute('''
+                    UPDATE users
+                    SET balance = balance - ?,
+                        total_wagered = total_wagered + ?
+                    WHERE user_id = ? AND balance >= ?
+                    RETURNING *
+                ''', (bet, bet, user_id, bet))
+                row = cursor.fetchone()
+                if row is None:
+                    return None
+                
+                now = int(time.time())
+                conn.execute(
+                    "INSERT INTO crash_bets (round_id, user_id, bet, created_at) VALUES (?, ?, ?, ?)",
+                    (round_id, user_id, bet, now)
+                )
+                conn.execute(
+                    "INSERT INTO transactions (user_id, amount, type, description, created_at) VALUES (?, ?, ?, ?, ?)",
+                    (user_id, -bet, "game_bet", f"Banana Crash раунд #{round_id}: ставка", now)
+                )
+                self._cache_user(row)
+                return float(row['balance'])
+        except sqlite3.IntegrityError:
+            return None  # Уже в раунде, транзакция откатана
+        except Exception as e:
+            self._invalidate_user(user_id)
+            logger.error(f"Ошибка ставки в раунде {round_id} ({user_id}): {e}")
+            return None
+    
+    def settle_round(self, round_id: int, cashouts: Dict[int, float]) -> int:
+        """Рассчитать все ставки раунда одной транзакцией.
+        
+        cashouts — {user_id: множитель} для забравших до краша, остальные
+        проиграли. Выигрыши начисляются пачкой (UPDATE ... FROM crash_bets),
+        в журнал пишется строка на каждого победителя. Возвращает число
+        рассчитанных ставок.
+        """
+        now = int(time.time())
+        try:
+            with self.get_connection() as conn:
+                conn.executemany(
+                    '''UPDATE crash_bets SET cashout = ?, payout = bet * ?
+                       WHERE round_id = ? AND user_id = ? AND status = 'open'
+                    ''',
+                    [(multiplier, multiplier, round_id, user_id) for user_id, multiplier in cashouts.items()]
+                )
+                conn.execute('''
+                    UPDATE users
+                    SET balance = balance + b.payout,
+                        games_played = games_played + 1,
+                        games_won = games_won + (b.payout > 0)
+                    FROM crash_bets b
+                    WHERE b.round_id = ? AND b.status = 'open' AND users.user_id = b.user_id
+                ''', (round_id,))
+                conn.execute('''
+                    INSERT INTO transactions (user_id, amount, type, description, created_at)
+                    SELECT user_id, payout, 'game_win',
+                           printf('Banana Crash раунд #%d: выигрыш x%.2f', round_id, cashout), ?
+                    FROM crash_bets
+                    WHERE round_id = ? AND status = 'open' AND payout > 0
+                ''', (now, round_id))
+                user_ids = [row[0] for row in conn.execute(
+                    "UPDATE crash_bets SET status = 'settled' WHERE round_id = ? AND status = 'open' RETURNING user_id",
+                    (round_id,)
+                )]
+        except Exception as e:
+            logger.error(f"Ошибка расчета раунда {round_id}: {e}")
+            return 0
+        
+        # Пачка не возвращает строки: сбрасываем кэш после commit
+        for user_id in user_ids:
+            self._invalidate_user(user_id)
+        return len(user_ids)
+    
+    def refund_open_bets(self) -> int:
+        """Вернуть ставки раундов, прерванных перезапуском"""
+        try:
+            with self.get_connection() as conn:
+                conn.execute('''
+                    UPDATE users
+                    SET balance = balance + b.bet,
+                        total_wagered = total_wagered - b.bet
+                    FROM crash_bets b
+                    WHERE b.status = 'open' AND users.user_id = b.user_id
+                ''')
+                conn.execute('''
+                    INSERT INTO transactions (user_id, amount, type, description, created_at)
+                    SELECT user_id, bet, 'refund', printf('Banana Crash раунд #%d: возврат ставки', round_id), ?
+                    FROM crash_bets
+                    WHERE status = 'open'
+                ''', (int(time.time()),))
+                user_ids = [row[0] for row in conn.execute(
+                    "UPDATE crash_bets SET status = 'refunded' WHERE status = 'open' RETURNING user_id"
+                )]
+        except Exception as e:
+            logger.error(f"Ошибка возврата ставок: {e}")
+            return 0
+        
+        for user_id in user_ids:
+            self._invalidate_user(user_id)
+        if user_ids:
+            logger.info(f"↩️ Возвращено {len(user_ids)} ставок прерванных раундов")
+        return len(user_ids)
+    
+    # === ОБЩИЙ ДЖЕКПОТ ===
+    def get_open_jackpot_round(self) -> Dict:
+        """Открытый розыгрыш джекпота (создается, если его нет)"""
+        with self.get_connection() as conn:
+            row = conn.execute(
+                "SELECT * FROM jackpot_rounds WHERE status = 'open' ORDER BY id DESC LIMIT 1"
+            ).fetchone()
+            if row is None:
+                row = conn.execute(
+                    "INSERT INTO jackpot_rounds (created_at) VALUES (?) RETURNING *",
+                    (int(time.time()),)
+                ).fetchone()
+            return dict(row)
+    
+    def buy_jackpot_tickets(self, user_id: int, round_id: int, tickets: int,
+                            ticket_price: float) -> Optional[float]:
+        """Купить билеты: списание, строка покупки и журнал одной транзакцией.
+        
+        Возвращает новый баланс или None, если баланса недостаточно.
+        """
+        cost = tickets * ticket_price
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.execute('''
+                    UPDATE users
+                    SET balance = balance - ?,
+                        total_wagered = total_wagered + ?,
+                        games_played = games_played + 1
+                    WHERE user_id = ? AND balance >= ?
+                    RETURNING *
+                ''', (cost, cost, user_id, cost))
+                row = cursor.fetchone()
+                if row is None:
+                    return None
+                
+                now = int(time.time())
+                conn.execute(
+                    "INSERT INTO jackpot_tickets (round_id, user_id, tickets, created_at) VALUES (?, ?, ?, ?)",
+                    (round_id, user_id, tickets, now)
+                )
+                conn.execute(
+                    "INSERT INTO transactions (user_id, amount, type, description, created_at) VALUES (?, ?, ?, ?, ?)",
+                    (user_id, -cost, "jackpot_ticket", f"Общий джекпот #{round_id}: {tickets} бил.", now)
+                )
+                self._cache_user(row)
+                return float(row['balance'])
+        except Exception as e:
+            self._invalidate_user(user_id)
+            logger.error(f"Ошибка покупки билетов {user_id}: {e}")
+            return None
+    
+    def get_jackpot_sales(self, round_id: int) -> int:
+        """Продано билетов в розыгрыше"""
+        with self.get_connection() as conn:
+            row = conn.execute(
+                "SELECT COALESCE(SUM(tickets), 0) FROM jackpot_tickets WHERE round_id = ?",
+                (round_id,)
+            ).fetchone()
+            return row[0]
+    
+    def get_jackpot_entries(self, round_id: int) -> Tuple[array, array]:
+        """Участники розыгрыша: (user_id, накопленное число билетов).
+        
+        Покупки суммируются по игрокам в SQLite (покрывающий индекс
+        idx_jackpot_tickets_round), поэтому массивы растут с числом
+        игроков, а не покупок. Победитель ищется бинарным поиском
+        по накопленным билетам.
+        """
+        user_ids = array('q')
+        cumulative = array('q')
+        total = 0
+        with self.get_connection() as conn:
+            cursor = conn.execute(
+                "SELECT user_id, SUM(tickets) FROM jackpot_tickets WHERE round_id = ? GROUP BY user_id",
+                (round_id,)
+            )
+            for user_id, tickets in cursor:
+                total += tickets
+                user_ids.append(user_id)
+                cumulative.append(total)
+        return user_ids, cumulative
+    
+    def _pay_jackpot(self, conn: sqlite3.Connection, round_id: int,
+                     payouts: Dict[int, float], now: int) -> bool:
+        """Выплаты розыгрыша в открытой транзакции.
+        
+        Отметка в jackpot_settlements пишется первой: если она уже есть,
+        розыгрыш на этом файле выплачен и ничего не делается (False).
+        """
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO jackpot_settlements (round_id, settled_at) VALUES (?, ?)",
+            (round_id, now)
+        )
+        if not cursor.rowcount:
+            return False
+        conn.executemany(
+            "UPDATE users SET balance = balance + ?, games_won = games_won + 1 WHERE user_id = ?",
+            [(payout, user_id) for user_id, payout in payouts.items()]
+        )
+        conn.executemany(
+            "INSERT INTO transactions (user_id, amount, type, description, created_at) VALUES (?, ?, ?, ?, ?)",
+            [
+                (user_id, payout, "jackpot_win", f"Общий джекпот #{round_id}: выигрыш", now)
+                for user_id, payout in payouts.items()
+            ]
+        )
+        return True
+    
+    def pay_jackpot(self, round_id: int, payouts: Dict[int, float]) -> bool:
+        """Выплатить призы розыгрыша, закрытого в другом файле (шарды).
+        
+        Повторный вызов для того же розыгрыша ничего не выплачивает.
+        """
+        with self.get_connection() as conn:
+            paid = self._pay_jackpot(conn, round_id, payouts, int(time.time()))
+        if paid:
+            for user_id in payouts:
+                self._invalidate_user(user_id)
+        return paid
+    
+    def settle_jackpot(self, round_id: int, payouts: Dict[int, float], tickets: int,
+                       pool: float, carryover: float,
+                       winners: Optional[Dict[int, float]] = None) -> Optional[int]:
+        """Закрыть розыгрыш, выплатить призы и открыть следующий одной транзакцией.
+        
+        Розыгрыш сначала переводится в drawn: если его уже закрыл другой
+        процесс или прошлая попытка, ничего не выплачивается и возвращается
+        None. Иначе возвращается id следующего розыгрыша с переносом carryover.
+        
+        winners — все призы розыгрыша, если здесь выплачивается только их
+        часть (шарды): тогда розыгрыш остается с payouts_pending = 1 до
+        mark_jackpot_paid.
+        """
+        now = int(time.time())
+        with self.get_connection() as conn:
+            cursor = conn.execute('''
+                UPDATE jackpot_rounds
+                SET status = 'drawn', tickets = ?, pool = ?, winners = ?, drawn_at = ?,
+                    payouts_pending = ?
+                WHERE id = ? AND status = 'open'
+            ''', (tickets, pool, json.dumps(payouts if winners is None else winners), now,
+                  int(winners is not None), round_id))
+            if not cursor.rowcount:
+                return None
+            self._pay_jackpot(conn, round_id, payouts, now)
+            next_round_id = conn.execute(
+                "INSERT INTO jackpot_rounds (carryover, created_at) VALUES (?, ?) RETURNING id",
+                (carryover, now)
+            ).fetchone()[0]
+        
+        # Пачка не возвращает строки: сбрасываем кэш после commit
+        for user_id in payouts:
+            self._invalidate_user(user_id)
+        return next_round_id
+    
+    def get_jackpot_winners(self, round_id: int) -> Optional[Dict[int, float]]:
+        """Призы закрытого розыгрыша (None, если он еще открыт)"""
+        with self.get_connection() as conn:
+            row = conn.execute(
+                "SELECT winners FROM jackpot_rounds WHERE id = ? AND status = 'drawn'",
+                (round_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {int(user_id): payout for user_id, payout in json.loads(row[0] or "{}").items()}
+    
+    def get_pending_jackpot_rounds(self) -> List[int]:
+        """Закрытые розыгрыши, выплаты которых на шардах не подтверждены"""
+        with self.get_connection() as conn:
+            return [row[0] for row in conn.execute(
+                "SELECT id FROM jackpot_rounds WHERE payouts_pending = 1"
+            )]
+    
+    def mark_jackpot_paid(self, round_id: int):
+        """Все выплаты розыгрыша сделаны"""
+        with self.get_connection() as conn:
+            conn.execute("UPDATE jackpot_rounds SET payouts_pending = 0 WHERE id = ?", (round_id,))
+    
+    def finish_jackpot_payouts(self) -> int:
+        """Дозавершить прерванные выплаты (в одном файле их не бывает)"""
+        return 0
+    
+    # === ЧЕСТНАЯ ИГРА ===
+    def get_fair_seed(self, user_id: int) -> Optional[Dict]:
+        """Активное зерно игрока"""
+        with self.get_connection() as conn:
+            row = conn.execute(
+                "SELECT * FROM fair_seeds WHERE user_id = ? AND status = 'active'",
+                (user_id,)
+            ).fetchone()
+            return dict(row) if row else None
+    
+    def create_fair_seed(self, user_id: int, server_seed: str, server_hash: str,
+                         client_seed: str) -> Optional[Dict]:
+        """Первое зерно игрока; если оно уже создано параллельно — вернуть его"""
+        try:
+            with self.get_connection() as conn:
+                row = conn.execute('''
+                    INSERT INTO fair_seeds (user_id, server_seed, server_hash, client_seed, created_at)
+                    VALUES (?, ?, ?, ?, ?)
+                    RETURNING *
+                ''', (user_id, server_seed, server_hash, client_seed, int(time.time()))).fetchone()
+                return dict(row)
+        except sqlite3.IntegrityError:
+            return self.get_fair_seed(user_id)
+        except Exception as e:
+            logger.error(f"Ошибка создания зерна {user_id}: {e}")
+            return None
+    
+    def reserve_fair_nonces(self, user_id: int, seed_id: int, count: int) -> Optional[int]:
+        """Зарезервировать count номеров ставок, вернуть первый.
+        
+        Граница хранится в базе до выдачи номеров, поэтому после перезапуска
+        номера не повторяются (неиспользованные просто пропускаются).
+        """
+        with self.get_connection() as conn:
+            row = conn.execute('''
+                UPDATE fair_seeds SET nonce = nonce + ?
+                WHERE id = ? AND user_id = ? AND status = 'active'
+                RETURNING nonce
+            ''', (count, seed_id, user_id)).fetchone()
+            return row['nonce'] - count if row else None
+    
+    def rotate_fair_seed(self, user_id: int, used_nonces: int, server_seed: str, server_hash: str,
+                         client_seed: str) -> Optional[Tuple[Dict, Dict]]:
+        """Раскрыть активное зерно и выдать новое одной транзакцией: (раскрытое, новое)"""
+        try:
+            with self.get_connection() as conn:
+                now = int(time.time())
+                revealed = conn.execute('''
+                    UPDATE fair_seeds SET status = 'revealed', nonce = MIN(nonce, ?), revealed_at = ?
+                    WHERE user_id = ? AND status = 'active'
+                    RETURNING *
+                ''', (used_nonces, now, user_id)).fetchone()
+                if revealed is None:
+                    return None
+                seed = conn.execute('''
+                    INSERT INTO fair_seeds (user_id, server_seed, server_hash, client_seed, created_at)
+                    VALUES (?, ?, ?, ?, ?)
+                    RETURNING *
+                ''', (user_id, server_seed, server_hash, client_seed, now)).fetchone()
+                return dict(revealed), dict(seed)
+        except Exception as e:
+            logger.error(f"Ошибка смены зерна {user_id}: {e}")
+            return None
+    
+    def get_fair_seed_history(self, user_id: int, limit: int = 5) -> List[Dict]:
+        """Раскрытые зерна игрока, новые первыми"""
+        with self.get_connection() as conn:
+            rows = conn.execute('''
+                SELECT * FROM fair_seeds
+                WHERE user_id = ? AND status = 'revealed'
+                ORDER BY id DESC LIMIT ?
+            ''', (user_id, limit)).fetchall()
+            return [dict(row) for row in rows]
+    
+    # === СОСТОЯНИЯ FSM ===
+    def get_fsm_state(self, key: str) -> Optional[Tuple[Optional[str], Optional[str], int]]:
+        """Состояние FSM по ключу: (state, data в JSON, updated_at)"""
+        with self.get_connection() as conn:
+            row = conn.execute(
+                "SELECT state, data, updated_at FROM fsm_states WHERE key = ?", (key,)
+            ).fetchone()
+            return tuple(row) if row else None
+    
+    def save_fsm_states(self, rows: List[Tuple[str, Optional[str], Optional[str], int]]) -> bool:
+        """Записать пачку состояний одной транзакцией.
+        
+        rows — (key, state, data, updated_at); без состояния и данных строка удаляется.
+        """
+        try:
+            with self.get_connection() as conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO fsm_states (key, state, data, updated_at) VALUES (?, ?, ?, ?)",
+                    [row for row in rows if row[1] is not None or row[2] is not None]
+                )
+                conn.executemany(
+                    "DELETE FROM fsm_states WHERE key = ?",
+                    [(row[0],) for row in rows if row[1] is None and row[2] is None]
+                )
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка записи состояний FSM: {e}")
+            return False
+    
+    def purge_fsm_states(self, older_than: int) -> int:
+        """Удалить брошенные состояния (updated_at < older_than)"""
+        with self.get_connection() as conn:
+            return conn.execute("DELETE FROM fsm_states WHERE updated_at < ?", (older_than,)).rowcount
+    
     # === СПОНСОРЫ ===
     def get_sponsors(self) -> List[Dict]:
-        """Получить всех спонсоров"""
-        with self.get_connection() as conn:
-            cursor = conn.execute("SELECT * FROM sponsors ORDER BY id")
-            return [dict(row) for row in cursor.fetchall()]
+        """Получить всех спонсоров (из кэша)"""
+        sponsors = self._sponsors_cache
+        if sponsors is None:
+            with self._sponsors_lock:
+                generation = self._sponsors_generation
+            with self.get_connection() as conn:
+                cursor = conn.execute("SELECT * FROM sponsors ORDER BY id")
+                sponsors = [dict(row) for row in cursor.fetchall()]
+            with self._sponsors_lock:
+                if generation == self._sponsors_generation:
+                    self._sponsors_cache = sponsors
+        return [dict(sponsor) for sponsor in sponsors]
     
     def get_user_sponsors_status(self, user_id: int) -> List[Dict]:
         """Получить статус подписок пользователя"""
-        sponsors = self.get_sponsors()
-        if not sponsors:
+        if not self.get_sponsors():
             return []
         
-        result = []
         with self.get_connection() as conn:
-            for sponsor in sponsors:
-                # Проверяем подписку пользователя
-                cursor = conn.execute(
-                    "SELECT is_subscribed FROM user_sponsors WHERE user_id = ? AND sponsor_id = ?",
-                    (user_id, sponsor['id'])
-                )
-                row = cursor.fetchone()
-                
-                result.append({
-                    **sponsor,
-                    'is_subscribed': bool(row[0]) if row else False
-                })
+            cursor = conn.execute('''
+                SELECT s.*, COALESCE(us.is_subscribed, 0) AS is_subscribed
+                FROM sponsors s
+                LEFT JOIN user_sponsors us ON us.sponsor_id = s.id AND us.user_id = ?
+                ORDER BY s.id
+            ''', (user_id,))
+            return [
+                {**dict(row), 'is_subscribed': bool(row['is_subscribed'])}
+                for row in cursor.fetchall()
+            ]
+    
+    def is_subscribed_to_all(self, user_id: int) -> bool:
+        """Подписан ли пользователь на всех спонсоров (с кэшем по TTL)"""
+        now = time.monotonic()
+        with self._sponsors_lock:
+            cached = self._subscribed_cache.get(user_id)
+            if cached and cached[1] > now:
+                self._subscribed_cache.move_to_end(user_id)
+                return cached[0]
+            generation = self._sponsors_generation
         
-        return result
+        sponsors_status = self.get_user_sponsors_status(user_id)
+        subscribed = all(sponsor['is_subscribed'] for sponsor in sponsors_status)
+        
+        with self._sponsors_lock:
+            # Не кэшируем результат, если спонсоры изменились во время запроса
+            if generation == self._sponsors_generation:
+                self._subscribed_cache[user_id] = (subscribed, now + self.subscription_cache_ttl)
+                self._subscribed_cache.move_to_end(user_id)
+                while len(self._subscribed_cache) > self.subscription_cache_size:
+                    self._subscribed_cache.popitem(last=False)
+        return subscribed
+    
+    def _invalidate_sponsors(self):
+        """Сбросить кэш спонсоров и статусов подписки"""
+        with self._sponsors_lock:
+            self._sponsors_generation += 1
+            self._sponsors_cache = None
+            self._subscribed_cache.clear()
     
     def update_user_sponsor_status(self, user_id: int, sponsor_id: int, is_subscribed: bool) -> bool:
         """Обновить статус подписки"""
@@ -234,22 +1051,26 @@ class Database:
                     VALUES (?, ?, ?, ?)
                 ''', (user_id, sponsor_id, int(is_subscribed), int(time.time())))
                 conn.commit()
-                return True
+            with self._sponsors_lock:
+                self._subscribed_cache.pop(user_id, None)
+            return True
         except Exception as e:
             logger.error(f"Ошибка обновления статуса подписки: {e}")
             return False
     
-    def add_sponsor(self, channel_username: str, channel_id: str, channel_url: str) -> bool:
+    def add_sponsor(self, channel_username: str, channel_id: str, channel_url: str,
+                    sponsor_id: int = None) -> bool:
         """Добавить спонсора (админ)"""
         try:
             with self.get_connection() as conn:
                 conn.execute(
-                    "INSERT INTO sponsors (channel_username, channel_id, channel_url) VALUES (?, ?, ?)",
-                    (channel_username, channel_id, channel_url)
+                    "INSERT INTO sponsors (id, channel_username, channel_id, channel_url) VALUES (?, ?, ?, ?)",
+                    (sponsor_id, channel_username, channel_id, channel_url)
                 )
                 conn.commit()
-                logger.info(f"✅ Спонсор {channel_username} добавлен")
-                return True
+            self._invalidate_sponsors()
+            logger.info(f"✅ Спонсор {channel_username} добавлен")
+            return True
         except Exception as e:
             logger.error(f"Ошибка добавления спонсора: {e}")
             return False
@@ -261,7 +1082,8 @@ class Database:
                 conn.execute("DELETE FROM sponsors WHERE id = ?", (sponsor_id,))
                 conn.execute("DELETE FROM user_sponsors WHERE sponsor_id = ?", (sponsor_id,))
                 conn.commit()
-                return True
+            self._invalidate_sponsors()
+            return True
         except Exception as e:
             logger.error(f"Ошибка удаления спонсора: {e}")
             return False
@@ -291,6 +1113,17 @@ class Database:
     # === ТРАНЗАКЦИИ ===
     def add_transaction(self, user_id: int, amount: float, type: str, description: str = "") -> bool:
         """Добавить транзакцию"""
+        if self.ledger_write_behind:
+            row = (user_id, amount, type, description, int(time.time()))
+            with self._ledger_lock:
+                self._ledger_buffer.append(row)
+                depth = len(self._ledger_buffer)
+                if depth > self._ledger_metrics["max_queue_depth"]:
+                    self._ledger_metrics["max_queue_depth"] = depth
+            if depth >= self.ledger_flush_max_rows:
+                self._ledger_wakeup.set()
+            return True
+        
         try:
             with self.get_connection() as conn:
                 conn.execute(
@@ -303,35 +1136,328 @@ class Database:
             logger.error(f"Ошибка добавления транзакции: {e}")
             return False
     
-    def get_user_transactions(self, user_id: int, limit: int = 10) -> List[Dict]:
-        """Получить транзакции пользователя"""
+    def flush_transactions(self) -> int:
+        """Записать накопленные транзакции одной транзакцией БД"""
+        with self._ledger_flush_lock:
+            with self._ledger_lock:
+                rows = self._ledger_buffer
+                self._ledger_buffer = []
+            if not rows:
+                return 0
+            
+            started = time.perf_counter()
+            try:
+                with self.get_connection() as conn:
+                    conn.executemany(
+                        "INSERT INTO transactions (user_id, amount, type, description, created_at) VALUES (?, ?, ?, ?, ?)",
+                        rows
+                    )
+            except Exception as e:
+                logger.error(f"Ошибка записи журнала ({len(rows)} строк): {e}")
+                # Возвращаем строки в начало очереди, чтобы не потерять их
+                with self._ledger_lock:
+                    self._ledger_buffer[:0] = rows
+                return 0
+            
+            metrics = self._ledger_metrics
+            metrics["flushes"] += 1
+            metrics["rows_flushed"] += len(rows)
+            metrics["last_flush_size"] = len(rows)
+            metrics["max_flush_size"] = max(metrics["max_flush_size"], len(rows))
+            metrics["last_flush_ms"] = (time.perf_counter() - started) * 1000
+            return len(rows)
+    
+    def _ledger_flush_loop(self):
+        """Фоновый поток: сброс журнала раз в интервал или по заполнению"""
+        while not self._ledger_stop.is_set():
+            self._ledger_wakeup.wait(self.ledger_flush_interval)
+            self._ledger_wakeup.clear()
+            self.flush_transactions()
+    
+    def get_ledger_metrics(self) -> Dict:
+        """Метрики отложенной записи журнала"""
+        with self._ledger_lock:
+            queue_depth = len(self._ledger_buffer)
+        return {"queue_depth": queue_depth, **self._ledger_metrics}
+    
+    def get_user_transactions(self, user_id: int, limit: int = 10,
+                              cursor: Optional[Tuple[int, int]] = None) -> List[Dict]:
+        """Получить транзакции пользователя.
+        
+        cursor — (created_at, id) последней показанной транзакции;
+        следующая страница начинается сразу после нее.
+        """
+        self.flush_transactions()
         with self.get_connection() as conn:
-            cursor = conn.execute(
-                "SELECT * FROM transactions WHERE user_id = ? ORDER BY created_at DESC LIMIT ?",
+            return self._query_transactions(conn, "main", user_id, limit, cursor)
+    
+    def _query_transactions(self, conn: sqlite3.Connection, schema: str, user_id: int,
+                            limit: int, cursor: Optional[Tuple[int, int]]) -> List[Dict]:
+        """Страница транзакций пользователя из основной или подключенной архивной базы"""
+        if cursor:
+            rows = conn.execute(f'''
+                SELECT * FROM {schema}.transactions
+                WHERE user_id = ? AND (created_at, id) < (?, ?)
+                ORDER BY created_at DESC, id DESC
+                LIMIT ?
+            ''', (user_id, cursor[0], cursor[1], limit))
+        else:
+            rows = conn.execute(
+                f"SELECT * FROM {schema}.transactions WHERE user_id = ? ORDER BY created_at DESC, id DESC LIMIT ?",
                 (user_id, limit)
             )
-            return [dict(row) for row in cursor.fetchall()]
+        return [dict(row) for row in rows.fetchall()]
+    
+    # === АРХИВ ТРАНЗАКЦИЙ ===
+    def _archive_path(self, month: str, archive_dir: str = None) -> str:
+        """Путь к файлу архива за месяц (YYYY_MM)"""
+        base = os.path.splitext(os.path.basename(self.db_path))[0]
+        directory = archive_dir or os.path.dirname(os.path.abspath(self.db_path))
+        return os.path.join(directory, f"{base}_archive_{month}.db")
+    
+    def archive_steps(self, older_than_days: int, archive_dir: str = None, batch_size: int = 5000,
+                      compact: str = "incremental", vacuum_pages: int = 1000) -> Iterator[Dict[str, int]]:
+        """Перенести транзакции старше older_than_days в помесячные архивы по шагам.
+        
+        Каждый шаг — одна короткая транзакция (пачка строк или vacuum_pages
+        страниц), после него отдается {месяц: перенесено строк}. Генератор
+        выполняется в потоке БД (AsyncDatabase.run_steps), и между шагами
+        поток обслуживает обычные запросы. Итоги по пользователю копятся
+        в balance_checkpoints.
+        
+        compact — что сделать с освободившимися страницами:
+        "incremental" — вернуть их порциями через PRAGMA incremental_vacuum
+        (нужен auto_vacuum=INCREMENTAL; у новых баз он включен, у старых
+        включается одним VACUUM), "full" — VACUUM (держит блокировку записи
+        все время сжатия), "" — оставить в файле под новые строки.
+        """
+        self.flush_transactions()
+        if archive_dir:
+            os.makedirs(archive_dir, exist_ok=True)
+        cutoff = int(time.time()) - older_than_days * 86400
+        conn = self.get_connection()
+        
+        moved = {}
+        # Следующий месяц — MIN по индексу created_at, без прохода по всем старым строкам
+        first = conn.execute(
+            "SELECT MIN(created_at) FROM transactions WHERE created_at < ?", (cutoff,)
+        ).fetchone()[0]
+        while first is not None:
+            year, mon = time.gmtime(first)[:2]
+            month = f"{year}_{mon:02d}"
+            start = timegm((year, mon, 1, 0, 0, 0))
+            end = min(timegm((year + mon // 12, mon % 12 + 1, 1, 0, 0, 0)), cutoff)
+            for total in self._archive_month(
+                conn, month, self._archive_path(month, archive_dir), start, end, batch_size
+            ):
+                moved[month] = total
+                yield moved
+            logger.info(f"📦 Архив {month}: перенесено {moved.get(month, 0)} транзакций")
+            first = conn.execute(
+                "SELECT MIN(created_at) FROM transactions WHERE created_at >= ? AND created_at < ?",
+                (end, cutoff)
+            ).fetchone()[0]
+        
+        if not moved:
+            return
+        if compact == "full":
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            conn.execute("VACUUM")
+            logger.info("✅ Основная база сжата")
+        elif compact == "incremental":
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                logger.info("ℹ️ auto_vacuum не INCREMENTAL: место займут новые строки (включается одним VACUUM)")
+                return
+            freed = 0
+            while True:
+                free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+                if not free:
+                    break
+                conn.execute(f"PRAGMA incremental_vacuum({vacuum_pages})").fetchall()
+                freed += min(free, vacuum_pages)
+                yield moved
+            logger.info(f"✅ Основная база сжата: освобождено {freed} страниц")
+    
+    def archive_transactions(self, older_than_days: int, archive_dir: str = None, batch_size: int = 5000,
+                             compact: str = "incremental", vacuum_pages: int = 1000) -> Dict[str, int]:
+        """Архивация целиком в текущем потоке (см. archive_steps)"""
+        moved = {}
+        for moved in self.archive_steps(older_than_days, archive_dir, batch_size, compact, vacuum_pages):
+            pass
+        return dict(moved)
+    
+    def _archive_month(self, conn: sqlite3.Connection, month: str, path: str,
+                       start: int, end: int, batch_size: int) -> Iterator[int]:
+        """Перенести строки за [start, end) в архивный файл; после каждой пачки — перенесено всего"""
+        conn.execute("ATTACH DATABASE ? AS archive", (path,))
+        try:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS archive.transactions (
+                    id INTEGER PRIMARY KEY,
+                    user_id INTEGER,
+                    amount REAL,
+                    type TEXT,
+                    description TEXT,
+                    created_at INTEGER
+                )
+            ''')
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS archive.idx_transactions_user_created "
+                "ON transactions (user_id, created_at)"
+            )
+            conn.commit()
+            
+            batch = '''
+                SELECT id FROM main.transactions
+                WHERE created_at >= ? AND created_at < ?
+                ORDER BY created_at
+                LIMIT ?
+            '''
+            params = (start, end, batch_size)
+            total = 0
+            while True:
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    # Повторный перенос после сбоя не создаст дублей (INSERT OR IGNORE)
+                    cursor = conn.execute(
+                        f"INSERT OR IGNORE INTO archive.transactions SELECT * FROM main.transactions WHERE id IN ({batch})",
+                        params
+                    )
+                    conn.execute(f'''
+                        INSERT INTO balance_checkpoints (user_id, archived_amount, archived_income, archived_count, archived_until)
+                        SELECT user_id, SUM(amount), SUM(CASE WHEN amount < 0 THEN -amount ELSE 0 END), COUNT(*), MAX(created_at)
+                        FROM main.transactions WHERE id IN ({batch})
+                        GROUP BY user_id
+                        ON CONFLICT(user_id) DO UPDATE SET
+                            archived_amount = archived_amount + excluded.archived_amount,
+                            archived_income = archived_income + excluded.archived_income,
+                            archived_count = archived_count + excluded.archived_count,
+                            archived_until = MAX(COALESCE(archived_until, 0), excluded.archived_until)
+                    ''', params)
+                    deleted = conn.execute(
+                        f"DELETE FROM main.transactions WHERE id IN ({batch})", params
+                    ).rowcount
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+                
+                total += deleted
+                yield total
+                if deleted < batch_size:
+                    break
+            
+            conn.execute('''
+                INSERT INTO transaction_archives (month, path, rows, archived_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(month) DO UPDATE SET rows = rows + excluded.rows, archived_at = excluded.archived_at
+            ''', (month, path, total, int(time.time())))
+            conn.commit()
+        finally:
+            conn.execute("DETACH DATABASE archive")
+    
+    def get_archived_transactions(self, user_id: int, limit: int = 10,
+                                  cursor: Optional[Tuple[int, int]] = None) -> List[Dict]:
+        """Транзакции пользователя из архивов (архивы подключаются по очереди)"""
+        conn = self.get_connection()
+        checkpoint = conn.execute(
+            "SELECT archived_count FROM balance_checkpoints WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        if not checkpoint or not checkpoint[0]:
+            return []
+        
+        archives = conn.execute(
+            "SELECT month, path FROM transaction_archives ORDER BY month DESC"
+        ).fetchall()
+        result = []
+        for archive in archives:
+            if len(result) >= limit or not os.path.exists(archive['path']):
+                continue
+            conn.execute("ATTACH DATABASE ? AS archive", (archive['path'],))
+            try:
+                page = self._query_transactions(conn, "archive", user_id, limit - len(result), cursor)
+            finally:
+                conn.execute("DETACH DATABASE archive")
+            result.extend(page)
+            if page:
+                cursor = (page[-1]['created_at'], page[-1]['id'])
+        return result
+    
+    def get_user_history(self, user_id: int, limit: int = 10,
+                         cursor: Optional[Tuple[int, int]] = None) -> List[Dict]:
+        """История транзакций: сначала горячая таблица, затем архивы"""
+        result = self.get_user_transactions(user_id, limit, cursor)
+        if len(result) < limit:
+            if result:
+                cursor = (result[-1]['created_at'], result[-1]['id'])
+            result.extend(self.get_archived_transactions(user_id, limit - len(result), cursor))
+        return result
+    
+    def reconcile_user(self, user_id: int) -> Optional[Dict]:
+        """Сверить баланс с журналом: checkpoint архива + сумма горячих строк"""
+        self.flush_transactions()
+        with self.get_connection() as conn:
+            row = conn.execute('''
+                SELECT u.balance,
+                       COALESCE(bc.archived_amount, 0) AS archived,
+                       COALESCE((SELECT SUM(amount) FROM transactions WHERE user_id = u.user_id), 0) AS hot
+                FROM users u
+                LEFT JOIN balance_checkpoints bc ON bc.user_id = u.user_id
+                WHERE u.user_id = ?
+            ''', (user_id,)).fetchone()
+        if not row:
+            return None
+        ledger = row['archived'] + row['hot']
+        return {
+            "balance": row['balance'],
+            "ledger": ledger,
+            "archived": row['archived'],
+            "hot": row['hot'],
+            "difference": row['balance'] - ledger
+        }
     
     # === ВЫВОД СРЕДСТВ ===
-    def create_withdrawal(self, user_id: int, amount: float) -> Optional[Dict]:
-        """Создать заявку на вывод"""
+    def create_withdrawal(self, user_id: int, amount: float,
+                          id_stride: int = 1, id_offset: int = 0) -> Optional[Dict]:
+        """Создать заявку на вывод и списать сумму одной транзакцией.
+        
+        Списание условное (WHERE balance >= ?), поэтому два одновременных
+        вывода не проходят оба. None — не хватает баланса или ошибка.
+        id_stride/id_offset — номер заявки в описании транзакции для
+        шардированной базы (id * id_stride + id_offset).
+        """
+        now = int(time.time())
         try:
             with self.get_connection() as conn:
+                cursor = conn.execute(
+                    "UPDATE users SET balance = balance - ? WHERE user_id = ? AND balance >= ? RETURNING *",
+                    (amount, user_id, amount)
+                )
+                row = cursor.fetchone()
+                if row is None:
+                    return None
+                self._cache_user(row)
+                
                 cursor = conn.execute(
                     "INSERT INTO withdrawals (user_id, amount, created_at) VALUES (?, ?, ?) RETURNING id",
-                    (user_id, amount, int(time.time()))
+                    (user_id, amount, now)
                 )
                 withdrawal_id = cursor.fetchone()[0]
-                conn.commit()
+                conn.execute(
+                    "INSERT INTO transactions (user_id, amount, type, description, created_at) VALUES (?, ?, ?, ?, ?)",
+                    (user_id, -amount, "withdrawal", f"Вывод #{withdrawal_id * id_stride + id_offset}", now)
+                )
                 
                 return {
                     'id': withdrawal_id,
                     'user_id': user_id,
                     'amount': amount,
                     'status': 'pending',
-                    'created_at': int(time.time())
+                    'created_at': now,
+                    'balance': float(row['balance'])
                 }
         except Exception as e:
+            self._invalidate_user(user_id)
             logger.error(f"Ошибка создания вывода: {e}")
             return None
     
@@ -356,6 +1482,46 @@ class Database:
             
             return [dict(row) for row in cursor.fetchall()]
     
+    def iter_withdrawals(self, status: str = None, cursor: Optional[Tuple[int, int]] = None,
+                         page_size: int = 50) -> Tuple[List[Dict], Optional[Tuple[int, int]]]:
+        """Страница заявок на вывод (новые сначала).
+        
+        cursor — (created_at, id) последней заявки предыдущей страницы.
+        Возвращает (заявки, курсор следующей страницы или None).
+        """
+        conditions = []
+        params: list = []
+        if status:
+            conditions.append("w.status = ?")
+            params.append(status)
+        if cursor:
+            conditions.append("(w.created_at, w.id) < (?, ?)")
+            params.extend(cursor)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        
+        with self.get_connection() as conn:
+            rows = conn.execute(f'''
+                SELECT w.*, u.username
+                FROM withdrawals w
+                LEFT JOIN users u ON w.user_id = u.user_id
+                {where}
+                ORDER BY w.created_at DESC, w.id DESC
+                LIMIT ?
+            ''', (*params, page_size)).fetchall()
+        
+        page = [dict(row) for row in rows]
+        next_cursor = (page[-1]['created_at'], page[-1]['id']) if len(page) == page_size else None
+        return page, next_cursor
+    
+    def stream_withdrawals(self, status: str = None, page_size: int = 500) -> Iterator[Dict]:
+        """Потоковый обход заявок на вывод без загрузки всей таблицы"""
+        cursor = None
+        while True:
+            page, cursor = self.iter_withdrawals(status, cursor, page_size)
+            yield from page
+            if cursor is None:
+                break
+    
     def update_withdrawal_status(self, withdrawal_id: int, status: str) -> bool:
         """Обновить статус вывода"""
         try:
@@ -377,36 +1543,67 @@ class Database:
             cursor = conn.execute("SELECT * FROM users ORDER BY created_at DESC")
             return [dict(row) for row in cursor.fetchall()]
     
+    def iter_users(self, after_id: int = None, page_size: int = 100) -> List[Dict]:
+        """Страница пользователей по возрастанию user_id (keyset-пагинация)"""
+        with self.get_connection() as conn:
+            cursor = conn.execute(
+                "SELECT * FROM users WHERE user_id > ? ORDER BY user_id LIMIT ?",
+                (after_id if after_id is not None else -1, page_size)
+            )
+            return [dict(row) for row in cursor.fetchall()]
+    
+    def stream_users(self, page_size: int = 1000) -> Iterator[Dict]:
+        """Потоковый обход всех пользователей страницами"""
+        after_id = None
+        while True:
+            page = self.iter_users(after_id, page_size)
+            yield from page
+            if len(page) < page_size:
+                break
+            after_id = page[-1]['user_id']
+    
     def get_stats(self) -> Dict:
-        """Получить статистику"""
+        """Получить статистику (из инкрементальных счетчиков)"""
+        self.flush_transactions()
         with self.get_connection() as conn:
-            # Количество пользователей
-            cursor = conn.execute("SELECT COUNT(*) FROM users")
-            total_users = cursor.fetchone()[0]
-            
-            # Общий баланс
-            cursor = conn.execute("SELECT SUM(balance) FROM users")
-            total_balance = cursor.fetchone()[0] or 0.0
-            
-            # Общая сумма ставок
-            cursor = conn.execute("SELECT SUM(total_wagered) FROM users")
-            total_wagered = cursor.fetchone()[0] or 0.0
-            
-            # Заявки на вывод
-            cursor = conn.execute("SELECT COUNT(*) FROM withdrawals WHERE status = 'pending'")
-            pending_withdrawals = cursor.fetchone()[0]
-            
-            # Общий доход (сумма всех проигрышей)
-            cursor = conn.execute("SELECT SUM(amount) FROM transactions WHERE amount < 0")
-            total_income = abs(cursor.fetchone()[0] or 0.0)
-            
-            return {
-                "total_users": total_users,
-                "total_balance": total_balance,
-                "total_wagered": total_wagered,
-                "pending_withdrawals": pending_withdrawals,
-                "total_income": total_income
-            }
+            cursor = conn.execute("SELECT key, value FROM stats")
+            stats = {key: 0.0 for key in migrations.STATS_QUERIES}
+            stats.update({row[0]: row[1] for row in cursor.fetchall()})
+        
+        stats["total_users"] = int(stats["total_users"])
+        stats["pending_withdrawals"] = int(stats["pending_withdrawals"])
+        return stats
+    
+    def rebuild_stats(self) -> Dict[str, Dict[str, float]]:
+        """Пересчитать счетчики статистики с нуля.
+        
+        Возвращает расхождения: {ключ: {"stored", "actual", "drift"}}.
+        """
+        self.flush_transactions()
+        conn = self.get_connection()
+        drift = {}
+        try:
+            # IMMEDIATE: писатели ждут, пока идет пересчет
+            conn.execute("BEGIN IMMEDIATE")
+            stored = {row[0]: row[1] for row in conn.execute("SELECT key, value FROM stats")}
+            for key, query in migrations.REBUILD_STATS_QUERIES.items():
+                actual = conn.execute(query).fetchone()[0] or 0.0
+                difference = actual - stored.get(key, 0.0)
+                if abs(difference) > 1e-6:
+                    drift[key] = {"stored": stored.get(key, 0.0), "actual": actual, "drift": difference}
+                conn.execute(
+                    "INSERT OR REPLACE INTO stats (key, value) VALUES (?, ?)",
+                    (key, actual)
+                )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        
+        for key, values in drift.items():
+            logger.warning(f"⚠️ Расхождение статистики {key}: {values['drift']:+.6f}")
+        logger.info("✅ Статистика пересчитана")
+        return drift
     
     def broadcast_message(self, message: str) -> List[int]:
         """Отправить сообщение всем пользователям"""
@@ -414,3 +1611,71 @@ class Database:
             cursor = conn.execute("SELECT user_id FROM users")
             user_ids = [row[0] for row in cursor.fetchall()]
             return user_ids
+    
+    # === РАССЫЛКИ ===
+    def iter_user_ids(self, after_id: int = 0, page_size: int = 500) -> List[int]:
+        """Страница ID пользователей для рассылки (по возрастанию)"""
+        with self.get_connection() as conn:
+            cursor = conn.execute(
+                "SELECT user_id FROM users WHERE user_id > ? ORDER BY user_id LIMIT ?",
+                (after_id, page_size)
+            )
+            return [row[0] for row in cursor.fetchall()]
+    
+    def create_broadcast(self, text: str) -> int:
+        """Создать рассылку, вернуть ее ID"""
+        now = int(time.time())
+        with self.get_connection() as conn:
+            cursor = conn.execute(
+                "INSERT INTO broadcasts (text, created_at, updated_at) VALUES (?, ?, ?) RETURNING id",
+                (text, now, now)
+            )
+            return cursor.fetchone()[0]
+    
+    def get_broadcast(self, broadcast_id: int) -> Optional[Dict]:
+        """Получить рассылку по ID"""
+        with self.get_connection() as conn:
+            cursor = conn.execute("SELECT * FROM broadcasts WHERE id = ?", (broadcast_id,))
+            row = cursor.fetchone()
+            return dict(row) if row else None
+    
+    def get_broadcasts(self, status: str = None, limit: int = 10) -> List[Dict]:
+        """Последние рассылки (опционально по статусу)"""
+        with self.get_connection() as conn:
+            if status:
+                cursor = conn.execute(
+                    "SELECT * FROM broadcasts WHERE status = ? ORDER BY id DESC LIMIT ?",
+                    (status, limit)
+                )
+            else:
+                cursor = conn.execute("SELECT * FROM broadcasts ORDER BY id DESC LIMIT ?", (limit,))
+            return [dict(row) for row in cursor.fetchall()]
+    
+    def update_broadcast_progress(self, broadcast_id: int, last_user_id: int, sent: int,
+                                  failed: int, blocked: int, status: str = None) -> bool:
+        """Сохранить прогресс рассылки"""
+        try:
+            with self.get_connection() as conn:
+                conn.execute('''
+                    UPDATE broadcasts
+                    SET last_user_id = ?, sent = ?, failed = ?, blocked = ?,
+                        status = COALESCE(?, status), updated_at = ?
+                    WHERE id = ?
+                ''', (last_user_id, sent, failed, blocked, status, int(time.time()), broadcast_id))
+                return True
+        except Exception as e:
+            logger.error(f"Ошибка сохранения прогресса рассылки #{broadcast_id}: {e}")
+            return False
+    
+    def set_broadcast_status(self, broadcast_id: int, status: str) -> bool:
+        """Изменить статус рассылки"""
+        try:
+            with self.get_connection() as conn:
+                conn.execute(
+                    "UPDATE broadcasts SET status = ?, updated_at = ? WHERE id = ?",
+                    (status, int(time.time()), broadcast_id)
+                )
+                return True
+        except Exception as e:
+            logger.error(f"Ошибка обновления статуса рассылки #{broadcast_id}: {e}")
+            return False
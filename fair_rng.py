@@ -0,0 +1,331 @@
+"""Доказуемо честный генератор случайных чисел.
+
+Исход каждой ставки определяется тройкой (server_seed, client_seed, nonce):
+блок k потока — HMAC-SHA256(server_seed, "client_seed:nonce:k"), каждые
+8 байт блока дают число [0, 1) (старшие 53 бита). До игры игрок видит
+только SHA-256 зерна сервера, после смены зерна — само зерно и может
+пересчитать любую ставку.
+
+    python fair_rng.py verify crash <server_seed> <client_seed> <nonce> --bet 5
+    python fair_rng.py bench -n 200000
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import logging
+import random
+import secrets
+import struct
+import threading
+import time
+from collections import OrderedDict, deque
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+from game_registry import GAMES
+from games import GameEngine
+
+logger = logging.getLogger(__name__)
+
+FLOATS_PER_BLOCK = 4  # 32 байта HMAC-SHA256 = 4 числа по 8 байт
+_UNPACK = struct.Struct(">4Q").unpack
+_SCALE = 2.0 ** -53
+
+@lru_cache(maxsize=4096)
+def _keyed_mac(server_seed: str):
+    """HMAC с подготовленным ключом зерна: на блок — только copy() и update()"""
+    return hmac.new(server_seed.encode(), digestmod=hashlib.sha256)
+
+def hash_seed(server_seed: str) -> str:
+    """Публикуемый хеш зерна сервера"""
+    return hashlib.sha256(server_seed.encode()).hexdigest()
+
+class FairRandom(random.Random):
+    """random.Random, у которого random() берется из HMAC-потока ставки.
+    
+    uniform, choice, sample, randint и остальные методы random.Random
+    работают поверх random(), поэтому экземпляр передается в
+    GameEngine.play_* как rng и исход полностью определяется зернами и nonce.
+    """
+    
+    def __init__(self, server_seed: str, client_seed: str, nonce: int, seed_id: int = None):
+        # random.Random.__init__ не вызываем: состояние Mersenne Twister не используется
+        self.server_seed = server_seed
+        self.client_seed = client_seed
+        self.nonce = nonce
+        self.seed_id = seed_id
+        self.gauss_next = None
+        self._mac = _keyed_mac(server_seed)
+        self._prefix = f"{client_seed}:{nonce}:".encode()
+        self._block = 0
+        self._buffer = ()
+        self._index = FLOATS_PER_BLOCK
+    
+    def seed(self, *args, **kwargs):
+        pass  # Поток задан зернами ставки
+    
+    def random(self) -> float:
+        if self._index == FLOATS_PER_BLOCK:
+            mac = self._mac.copy()
+            mac.update(self._prefix + str(self._block).encode())
+            self._buffer = _UNPACK(mac.digest())
+            self._block += 1
+            self._index = 0
+        value = self._buffer[self._index]
+        self._index += 1
+        return (value >> 11) * _SCALE
+    
+    @property
+    def tag(self) -> str:
+        """Метка ставки для сообщений и журнала: <id зерна>:<nonce>"""
+        return f"{self.seed_id}:{self.nonce}"
+
+class SeedChainPool:
+    """Запас зерен сервера, готовых заранее.
+    
+    Фоновый поток строит хеш-цепочки h(i+1) = SHA-256(h(i)) из одной
+    порции энтропии и кладет их в очередь в обратном порядке: по выданным
+    раньше значениям нельзя вычислить следующие. Игроку выдается не само
+    значение цепочки, а HMAC от него — соседние значения связаны, и
+    раскрытое зерно одного игрока не должно открывать зерно другого.
+    Горячий путь — pop() из deque.
+    """
+    
+    def __init__(self, chain_length: int = 10000, low_water: int = None):
+        self.chain_length = chain_length
+        self.low_water = low_water or chain_length // 2
+        self._seeds: deque = deque()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._fill_loop, name="seed-chain", daemon=True)
+        self._wakeup.set()
+        self._thread.start()
+    
+    def build_chain(self) -> list:
+        """Одна цепочка зерен в порядке выдачи"""
+        value = secrets.token_bytes(32)
+        chain = []
+        for _ in range(self.chain_length):
+            value = hashlib.sha256(value).digest()
+            chain.append(hmac.new(value, b"server_seed", hashlib.sha256).hexdigest())
+        chain.reverse()
+        return chain
+    
+    def _fill_loop(self):
+        while not self._stopped:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            while not self._stopped and len(self._seeds) < self.low_water:
+                self._seeds.extend(self.build_chain())
+    
+    def pop(self) -> str:
+        """Следующее зерно сервера"""
+        try:
+            seed = self._seeds.popleft()
+        except IndexError:
+            seed = secrets.token_hex(32)  # Поток еще не успел: зерно без цепочки
+        if len(self._seeds) < self.low_water:
+            self._wakeup.set()
+        return seed
+    
+    def __len__(self) -> int:
+        return len(self._seeds)
+    
+    def close(self):
+        self._stopped = True
+        self._wakeup.set()
+        self._thread.join(timeout=5)
+
+class FairSession:
+    """Активное зерно игрока и выданные в памяти номера ставок"""
+    
+    __slots__ = ("seed", "nonce", "limit", "lock")
+    
+    def __init__(self, seed: Dict):
+        self.seed = seed
+        self.nonce = self.limit = seed['nonce']  # Первая ставка зарезервирует блок
+        self.lock = asyncio.Lock()
+
+class ProvablyFair:
+    """Зерна и nonce игроков.
+    
+    Номера ставок резервируются в базе блоками по nonce_block, дальше
+    выдаются из памяти: на ставку — ни одного запроса к базе, кроме
+    каждой nonce_block-й. Сессии последних cache_size игроков держатся в LRU.
+    """
+    
+    def __init__(self, db, pool: SeedChainPool, nonce_block: int = 100, cache_size: int = 10000):
+        self.db = db
+        self.pool = pool
+        self.nonce_block = nonce_block
+        self.cache_size = cache_size
+        self._sessions: "OrderedDict[int, FairSession]" = OrderedDict()
+    
+    def _new_seed(self):
+        server_seed = self.pool.pop()
+        return server_seed, hash_seed(server_seed)
+    
+    async def _session(self, user_id: int) -> FairSession:
+        session = self._sessions.get(user_id)
+        if session is not None:
+            self._sessions.move_to_end(user_id)
+            return session
+        
+        seed = await self.db.get_fair_seed(user_id)
+        if seed is None:
+            seed = await self.db.create_fair_seed(user_id, *self._new_seed(), secrets.token_hex(8))
+            if seed is None:
+                raise RuntimeError(f"Нет зерна для {user_id}")
+        
+        session = self._sessions.get(user_id)  # Пока ждали базу, сессию мог создать параллельный вызов
+        if session is None:
+            session = self._sessions[user_id] = FairSession(seed)
+            if len(self._sessions) > self.cache_size:
+                self._sessions.popitem(last=False)
+        return session
+    
+    async def rngs(self, user_id: int, count: int) -> List[FairRandom]:
+        """Генераторы для count ставок подряд (автоигра): у каждой свой nonce"""
+        session = await self._session(user_id)
+        async with session.lock:
+            if session.nonce + count > session.limit:
+                # Остаток блока пропускается: номера серии идут подряд
+                block = max(self.nonce_block, count)
+                start = await self.db.reserve_fair_nonces(user_id, session.seed['id'], block)
+                if start is None:
+                    raise RuntimeError(f"Зерно {session.seed['id']} игрока {user_id} не активно")
+                session.nonce, session.limit = start, start + block
+            first = session.nonce
+            session.nonce += count
+            seed = session.seed
+        return [
+            FairRandom(seed['server_seed'], seed['client_seed'], nonce, seed['id'])
+            for nonce in range(first, first + count)
+        ]
+    
+    async def rng(self, user_id: int) -> FairRandom:
+        """Генератор для следующей ставки игрока (каждый вызов — новый nonce)"""
+        return (await self.rngs(user_id, 1))[0]
+    
+    async def info(self, user_id: int) -> Dict:
+        """Что игрок видит до раскрытия: хеш зерна, свое зерно, следующий nonce"""
+        session = await self._session(user_id)
+        return {
+            "seed_id": session.seed['id'],
+            "server_hash": session.seed['server_hash'],
+            "client_seed": session.seed['client_seed'],
+            "nonce": session.nonce
+        }
+    
+    async def rotate(self, user_id: int, client_seed: str = None) -> Optional[Dict]:
+        """Раскрыть текущее зерно сервера и выдать новое (можно со своим client_seed)"""
+        session = await self._session(user_id)
+        async with session.lock:
+            result = await self.db.rotate_fair_seed(
+                user_id, session.nonce, *self._new_seed(),
+                client_seed or session.seed['client_seed']
+            )
+            if result is None:
+                return None
+            revealed, session.seed = result
+            session.nonce = session.limit = session.seed['nonce']
+        return revealed
+
+# === ПРОВЕРКА ===
+def verify(game: str, server_seed: str, client_seed: str, nonce: int, bet: float,
+           server_hash: str = None, choice: str = None) -> Dict:
+    """Пересчитать ставку по раскрытому зерну.
+    
+    Игра берется из реестра (game_registry.GAMES) с теми же настройками,
+    с которыми она играется в боте. server_hash — хеш, который игрок видел
+    до игры; если передан, проверяется, что раскрытое зерно ему
+    соответствует. choice — выбор игрока (сторона для flip, число для dice).
+    """
+    hash_ok = server_hash is None or hmac.compare_digest(hash_seed(server_seed), server_hash)
+    entry = GAMES[game]
+    if entry.choices:
+        choice = choice or next(iter(entry.choices))
+        if choice not in entry.choices:
+            raise ValueError(f"{game}: выбор {choice!r} не из {', '.join(entry.choices)}")
+    win, amount, details = entry.play(bet, FairRandom(server_seed, client_seed, nonce), choice)
+    return {
+        "game": game,
+        "hash_ok": hash_ok,
+        "win": win,
+        "amount": amount,
+        "result": details
+    }
+
+# === БЕНЧМАРК ===
+async def _bench_service(rounds: int) -> float:
+    import os
+    import tempfile
+    from async_database import AsyncDatabase
+    from database import Database
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        raw = Database(os.path.join(tmp, "bench.db"))
+        pool = SeedChainPool()
+        fair = ProvablyFair(AsyncDatabase(raw), pool)
+        users = 1000
+        started = time.perf_counter()
+        for i in range(rounds):
+            rng = await fair.rng(i % users + 1)
+            GameEngine.play_crash(1.0, rng)
+        elapsed = time.perf_counter() - started
+        pool.close()
+        raw.close()
+    return rounds / elapsed
+
+def benchmark(rounds: int = 200_000) -> Dict[str, float]:
+    """Исходов в секунду: голый random, FairRandom, сервис с базой; зерен в секунду"""
+    result = {}
+    
+    started = time.perf_counter()
+    for _ in range(rounds):
+        GameEngine.play_crash(1.0)
+    result["random"] = rounds / (time.perf_counter() - started)
+    
+    server_seed, client_seed = secrets.token_hex(32), "bench"
+    started = time.perf_counter()
+    for nonce in range(rounds):
+        GameEngine.play_crash(1.0, FairRandom(server_seed, client_seed, nonce))
+    result["fair_random"] = rounds / (time.perf_counter() - started)
+    
+    result["service"] = asyncio.run(_bench_service(rounds))
+    
+    pool = SeedChainPool()
+    pool.close()
+    started = time.perf_counter()
+    pool.build_chain()
+    result["seeds"] = pool.chain_length / (time.perf_counter() - started)
+    return result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Доказуемо честная игра Monkey Stars")
+    commands = parser.add_subparsers(dest="command", required=True)
+    
+    check = commands.add_parser("verify", help="Пересчитать ставку по раскрытому зерну")
+    check.add_argument("game", choices=sorted(GAMES))
+    check.add_argument("server_seed")
+    check.add_argument("client_seed")
+    check.add_argument("nonce", type=int)
+    check.add_argument("--bet", type=float, default=1.0)
+    check.add_argument("--hash", help="Хеш зерна, опубликованный до игры")
+    check.add_argument("--choice", help="Выбор игрока: сторона для flip, число для dice")
+    
+    bench = commands.add_parser("bench", help="Исходов в секунду")
+    bench.add_argument("-n", "--rounds", type=float, default=2e5)
+    args = parser.parse_args()
+    
+    if args.command == "verify":
+        outcome = verify(args.game, args.server_seed, args.client_seed, args.nonce, args.bet,
+                         args.hash, args.choice)
+        if not outcome["hash_ok"]:
+            print("❌ Зерно не соответствует опубликованному хешу")
+        print(f"{'✅ Выигрыш' if outcome['win'] else '❌ Проигрыш'} {outcome['amount']:.2f} STAR\n"
+              f"{outcome['result']}")
+    else:
+        for name, rate in benchmark(int(args.rounds)).items():
+            print(f"{name}: {rate:,.0f}/сек")
@@ -0,0 +1,145 @@
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+logger = logging.getLogger(__name__)
+
+class SQLiteStorage(BaseStorage):
+    """Хранилище FSM в основной базе (таблица fsm_states) вместо MemoryStorage.
+    
+    Состояние ввода ставки и админские сценарии переживают перезапуск.
+    Чтения идут из LRU-кэша в памяти, промах — один запрос по ключу.
+    Записи копятся и раз в flush_interval секунд уходят в базу одной
+    транзакцией; на одну запись ключа в пачке попадает только последнее
+    значение. Данные хранятся компактным JSON, пустые — NULL.
+    
+    Состояние, которое не менялось ttl секунд, считается брошенным:
+    читается как пустое и раз в purge_interval секунд удаляется из базы.
+    cache_ttl ограничивает, насколько кэш может отстать от базы, если
+    состояния пишут несколько процессов (для реплик за балансировщиком — 0).
+    """
+    
+    def __init__(self, db, ttl: int = 86400, flush_interval: float = 0.2,
+                 cache_size: int = 10_000, cache_ttl: float = 300, purge_interval: int = 3600):
+        self.db = db
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self.purge_interval = purge_interval
+        # ключ -> [state, data, updated_at, срок кэша]
+        self._cache: "OrderedDict[str, list]" = OrderedDict()
+        self._dirty: Dict[str, list] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._purged_at = time.time()
+        self.stats = {"hits": 0, "misses": 0, "writes": 0, "flushes": 0, "flushed_rows": 0, "expired": 0}
+    
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        return (f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id or ''}:"
+                f"{key.business_connection_id or ''}:{key.destiny}")
+    
+    @staticmethod
+    def _encode(data: Dict[str, Any]) -> Optional[str]:
+        return json.dumps(data, ensure_ascii=False, separators=(",", ":")) if data else None
+    
+    def _remember(self, key: str, record: list):
+        record[3] = time.monotonic() + self.cache_ttl
+        self._cache[key] = record
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+    
+    async def _get(self, key: StorageKey) -> list:
+        """Запись [state, data, updated_at, срок кэша]; брошенное состояние — пустое"""
+        skey = self._key(key)
+        record = self._dirty.get(skey)  # Незаписанное изменение важнее кэша
+        if record is None:
+            record = self._cache.get(skey)
+            if record is not None and record[3] <= time.monotonic():
+                record = None
+        if record is not None:
+            self.stats["hits"] += 1
+            if skey in self._cache:
+                self._cache.move_to_end(skey)
+        else:
+            self.stats["misses"] += 1
+            row = await self.db.get_fsm_state(skey)
+            if row is None:
+                record = [None, {}, 0, 0.0]
+            else:
+                record = [row[0], json.loads(row[1]) if row[1] else {}, row[2], 0.0]
+            self._remember(skey, record)
+        
+        if (record[0] is not None or record[1]) and record[2] < time.time() - self.ttl:
+            self.stats["expired"] += 1
+            record[0], record[1] = None, {}
+        return record
+    
+    def _put(self, key: StorageKey, state: Optional[str], data: Dict[str, Any]):
+        skey = self._key(key)
+        record = [state, data, int(time.time()), 0.0]
+        self._remember(skey, record)
+        self._dirty[skey] = record
+        self.stats["writes"] += 1
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+    
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        record = await self._get(key)
+        self._put(key, state.state if isinstance(state, State) else state, record[1])
+    
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._get(key))[0]
+    
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        record = await self._get(key)
+        self._put(key, record[0], data.copy())
+    
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return (await self._get(key))[1].copy()
+    
+    async def flush(self) -> int:
+        """Записать накопленные изменения одной транзакцией"""
+        if not self._dirty:
+            return 0
+        dirty, self._dirty = self._dirty, {}
+        rows = [(key, record[0], self._encode(record[1]), record[2]) for key, record in dirty.items()]
+        # shield: отмена фоновой задачи в close() не прерывает запись пачки
+        if not await asyncio.shield(self.db.save_fsm_states(rows)):
+            # Не записалось — вернуть в очередь, если ключ не успели переписать
+            for key, record in dirty.items():
+                self._dirty.setdefault(key, record)
+            return 0
+        self.stats["flushes"] += 1
+        self.stats["flushed_rows"] += len(rows)
+        return len(rows)
+    
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+                if time.time() - self._purged_at > self.purge_interval:
+                    self._purged_at = time.time()
+                    purged = await self.db.purge_fsm_states(int(time.time()) - self.ttl)
+                    if purged:
+                        logger.info(f"🧹 Удалено брошенных состояний FSM: {purged}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Ошибка записи состояний FSM: {e}")
+    
+    async def close(self) -> None:
+        """Остановить фоновую запись и записать остаток"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
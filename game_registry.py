@@ -0,0 +1,260 @@
+import random
+from functools import partial
+from types import MappingProxyType
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+from config import Config
+from games import GameEngine
+
+# === ДВИЖКИ ===
+# play: (bet, rng, config, choice) -> (выигрыш?, сумма, строки результата)
+# paytable: config -> [(исход, вероятность, множитель)]
+# describe: config -> строки меню
+
+def _play_flip(bet: float, rng, config, choice: Optional[str]) -> Tuple[bool, float, str]:
+    win, amount, emoji, text = GameEngine.play_flip(bet, choice, rng, config)
+    return win, amount, f"{emoji} {text}"
+
+def _play_crash(bet: float, rng, config, choice: Optional[str]) -> Tuple[bool, float, str]:
+    win, amount, emoji, text = GameEngine.play_crash(bet, rng, config)
+    return win, amount, f"{emoji} {text}"
+
+def _play_slot(bet: float, rng, config, choice: Optional[str]) -> Tuple[bool, float, str]:
+    win, amount, text, reels = GameEngine.play_slot(bet, rng, config)
+    return win, amount, f"🎰 Результат: {' '.join(reels)}\n{text}"
+
+def _play_dice(bet: float, rng, config, choice: Optional[str]) -> Tuple[bool, float, str]:
+    win, amount, text, _ = GameEngine.play_dice(bet, int(choice), rng, config)
+    return win, amount, text
+
+def _play_jackpot(bet: float, rng, config, choice: Optional[str]) -> Tuple[bool, float, str]:
+    win, amount, text = GameEngine.play_jackpot(bet, rng, config)
+    return win, amount, text
+
+def _paytable_flip(config) -> List[Tuple[str, float, float]]:
+    chance = (1 - config['special_event_chance']) * config['win_chance']
+    return [("Угадана сторона", chance, config['multiplier'])]
+
+def _paytable_crash(config) -> List[Tuple[str, float, float]]:
+    sampler = GameEngine._build_crash(config)
+    outcomes = list(zip(sampler.outcomes, sampler.probabilities))
+    high = sum(p for (outcome, _), p in outcomes if outcome == "high")
+    cash_out = [(m, p) for (outcome, m), p in outcomes if outcome == "cash_out" and p > 0]
+    table = [("Высокий множитель", high, (config['min_high_multiplier'] + 5.0) / 2)]  # Среднее uniform
+    if cash_out:
+        chance = sum(p for _, p in cash_out)
+        table.append(("Забрал на низком множителе", chance, sum(m * p for m, p in cash_out) / chance))
+    return table
+
+def _paytable_slot(config) -> List[Tuple[str, float, float]]:
+    n = len(GameEngine.SLOT_SYMBOLS)
+    total = n ** 3
+    return [
+        ("3x🍌", 1 / total, config['jackpot_multiplier']),
+        ("3 одинаковых", (n - 1) / total, config['win_multiplier']),
+        ("2 одинаковых", 3 * n * (n - 1) / total, 1.5),
+    ]
+
+def _paytable_dice(config) -> List[Tuple[str, float, float]]:
+    return [("Угадано число", 1 / 6, config['multiplier'])]
+
+def _paytable_jackpot(config) -> List[Tuple[str, float, float]]:
+    # На один билет: ставка = цена билета
+    return [("Выигрышный билет", config['win_chance'], config['multiplier'])]
+
+def _describe_flip(config) -> List[str]:
+    return [
+        f"📈 Шанс выигрыша: *{config['win_chance'] * 100:.0f}%*",
+        f"🎲 Множитель: *x{config['multiplier']}*",
+        f"💰 Мин. ставка: *{config['min_bet']} STAR*",
+    ]
+
+def _describe_crash(config) -> List[str]:
+    return [
+        "📈 Множитель растет от x1.00",
+        f"💥 {config['instant_crash_chance'] * 100:.0f}% шанс мгновенного краша",
+        f"🎰 {config['high_multiplier_chance'] * 100:.0f}% шанс на высокий множитель",
+    ]
+
+def _describe_slot(config) -> List[str]:
+    return [
+        f"🎯 3 одинаковых = x{config['win_multiplier']}",
+        f"🍌 3 банана = ДЖЕКПОТ x{config['jackpot_multiplier']}!",
+        "🎲 2 одинаковых = x1.5",
+    ]
+
+def _describe_dice(config) -> List[str]:
+    return [
+        "🎯 Угадайте число от 1 до 6",
+        f"🎲 Множитель: *x{config['multiplier']}*",
+        f"💰 Мин. ставка: *{config['min_bet']} STAR*",
+    ]
+
+def _describe_jackpot(config) -> List[str]:
+    return [
+        f"🎟 Цена билета: *{config['ticket_price']} STAR*",
+        f"🍀 Шанс билета: *{config['win_chance'] * 100:.0f}%*",
+        f"🏆 Выигрыш: *x{config['multiplier']:.0f}*",
+    ]
+
+class Engine(NamedTuple):
+    """Движок игры: как играть, как описать и какой выбор нужен до ставки"""
+    play: Callable
+    paytable: Callable
+    describe: Callable
+    choices: Tuple[Tuple[str, str], ...] = ()  # (значение, подпись кнопки)
+    prompt: str = "Выберите ставку:"
+    bet_label: str = "💰 {bet} STAR"
+
+ENGINES: Dict[str, Engine] = {
+    'flip': Engine(_play_flip, _paytable_flip, _describe_flip,
+                   (("heads", "🍌 Banana"), ("tails", "🐵 Monkey")), "Выберите сторону:"),
+    'crash': Engine(_play_crash, _paytable_crash, _describe_crash, bet_label="🚀 Играть ({bet} STAR)"),
+    'slot': Engine(_play_slot, _paytable_slot, _describe_slot, bet_label="🎰 Крутить ({bet} STAR)"),
+    'dice': Engine(_play_dice, _paytable_dice, _describe_dice,
+                   tuple((str(n), str(n)) for n in range(1, 7)), "Выберите число:"),
+    'jackpot': Engine(_play_jackpot, _paytable_jackpot, _describe_jackpot,
+                      bet_label="💰 Билеты на {bet} STAR"),
+}
+
+# === СКОМПИЛИРОВАННЫЕ ИГРЫ ===
+def _rows(buttons: List[InlineKeyboardButton], width: int = 3) -> List[List[InlineKeyboardButton]]:
+    return [buttons[i:i + width] for i in range(0, len(buttons), width)]
+
+def autoplay_rows(key: str) -> List[List[InlineKeyboardButton]]:
+    """Кнопки автоигры для меню игры"""
+    return [
+        [
+            InlineKeyboardButton(
+                text=f"🔁 Авто {rounds} × {bet} STAR",
+                callback_data=f"autoplay_{key}_{rounds}_{bet}"
+            )
+            for bet in Config.AUTOPLAY_BETS
+        ]
+        for rounds in Config.AUTOPLAY_ROUNDS
+    ]
+
+class Game:
+    """Игра из Config.GAMES, скомпилированная при запуске.
+    
+    Неизменяема: настройки заморожены (MappingProxyType), таблица выплат,
+    RTP, текст меню и клавиатуры посчитаны один раз и переиспользуются
+    в каждом ответе. Новая игра на существующем движке — только запись
+    в Config.GAMES с ключом 'engine'.
+    """
+    
+    __slots__ = ("key", "engine", "name", "icon", "title", "description", "config", "min_bet",
+                 "bets", "choices", "autoplay", "paytable", "rtp", "menu_markup",
+                 "choice_markups", "again_markup", "_play", "_menu_head", "_menu_tail")
+    
+    def __init__(self, key: str, config: Dict):
+        if "_" in key:
+            raise ValueError(f"Ключ игры {key!r} не должен содержать '_' (разделитель callback_data)")
+        engine_name = config.get('engine', key)
+        engine = ENGINES.get(engine_name)
+        if engine is None:
+            raise ValueError(f"Игра {key}: неизвестный движок {engine_name!r}")
+        autoplay = bool(config.get('autoplay'))
+        if autoplay and engine_name not in GameEngine.BATCH_GAMES:
+            raise ValueError(f"Игра {key}: автоигра есть только у {', '.join(GameEngine.BATCH_GAMES)}")
+        bets = tuple(float(bet) for bet in config.get('bets', (1, 5, 10)))
+        if any(bet < config['min_bet'] for bet in bets):
+            raise ValueError(f"Игра {key}: ставка на кнопке меньше min_bet")
+        
+        icon, _, title = config['name'].partition(" ")
+        paytable = tuple(engine.paytable(config))
+        init = partial(object.__setattr__, self)
+        init("key", key)
+        init("engine", engine_name)
+        init("name", config['name'])
+        init("icon", icon)
+        init("title", title or config['name'])
+        init("description", config.get('description', ""))
+        init("config", MappingProxyType(dict(config)))
+        init("min_bet", config['min_bet'])
+        init("bets", bets)
+        init("choices", dict(engine.choices))
+        init("autoplay", autoplay)
+        init("paytable", paytable)
+        init("rtp", sum(chance * multiplier for _, chance, multiplier in paytable))
+        init("_play", engine.play)
+        
+        init("_menu_head", f"{icon} *{self.title}*\n\n💰 Ваш баланс: *")
+        init("_menu_tail", " STAR*\n" + "\n".join(engine.describe(config)) + f"\n\n{engine.prompt}")
+        
+        back = [InlineKeyboardButton(text="◀️ Назад", callback_data="play_games")]
+        extra = [
+            [InlineKeyboardButton(text=text, callback_data=data)]
+            for text, data in config.get('menu_buttons', ())
+        ]
+        if engine.choices:
+            rows = _rows([
+                InlineKeyboardButton(text=label, callback_data=f"pick_{key}_{value}")
+                for value, label in engine.choices
+            ])
+        else:
+            rows = [
+                [InlineKeyboardButton(text=engine.bet_label.format(bet=f"{bet:g}"), callback_data=f"bet_{key}_{bet:g}")]
+                for bet in bets
+            ]
+        init("menu_markup", InlineKeyboardMarkup(inline_keyboard=[
+            *rows, *extra, *(autoplay_rows(key) if autoplay else []), back
+        ]))
+        init("choice_markups", {
+            value: InlineKeyboardMarkup(inline_keyboard=[
+                [
+                    InlineKeyboardButton(text=f"💰 {bet:g} STAR", callback_data=f"bet_{key}_{bet:g}_{value}")
+                    for bet in bets
+                ],
+                [InlineKeyboardButton(text="◀️ Отмена", callback_data=f"game_{key}")]
+            ])
+            for value in self.choices
+        })
+        init("again_markup", InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text=f"{icon} Играть снова", callback_data=f"game_{key}")],
+            [InlineKeyboardButton(text="🎮 Все игры", callback_data="play_games")],
+            [InlineKeyboardButton(text="🐵 Главное меню", callback_data="main_menu")]
+        ]))
+    
+    def __setattr__(self, name, value):
+        raise AttributeError(f"Игра {self.key} неизменяема")
+    
+    def menu(self, balance: str) -> str:
+        """Текст меню игры с балансом игрока"""
+        return f"{self._menu_head}{balance}{self._menu_tail}"
+    
+    def play(self, bet: float, rng: random.Random = random, choice: str = None) -> Tuple[bool, float, str]:
+        """Сыграть раунд: (выигрыш?, сумма, строки результата)"""
+        return self._play(bet, rng, self.config, choice)
+    
+    def bet_description(self, win: bool, amount: float, bet: float) -> str:
+        """Описание ставки для журнала транзакций"""
+        return f"{self.title} выигрыш x{amount / bet:.2f}" if win else f"{self.title} проигрыш"
+    
+    def result(self, bet: float, details: str, balance: str, footer: str = "") -> str:
+        """Сообщение с итогом раунда"""
+        return (
+            f"{self.icon} *{self.title}*\n\n"
+            f"💰 Ставка: *{bet} STAR*\n"
+            f"{details}\n\n"
+            f"💰 Новый баланс: *{balance} STAR*\n"
+            f"{footer}\n\n"
+            f"🎮 Сыграть ещё?"
+        )
+
+def compile_games(games: Dict[str, Dict]) -> Dict[str, Game]:
+    """Скомпилировать все игры; ошибка в настройках видна при запуске, а не в раунде"""
+    return {key: Game(key, config) for key, config in games.items()}
+
+GAMES: Dict[str, Game] = compile_games(Config.GAMES)
+
+GAMES_MARKUP = InlineKeyboardMarkup(inline_keyboard=[
+    *[[InlineKeyboardButton(text=game.name, callback_data=f"game_{game.key}")] for game in GAMES.values()],
+    [InlineKeyboardButton(text="◀️ Назад", callback_data="main_menu")]
+])
+GAMES_LINES = "\n".join(
+    f"{game.icon} *{game.title}*" + (f" - {game.description}" if game.description else "")
+    for game in GAMES.values()
+)
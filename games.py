@@ -1,20 +1,92 @@
+import math
 import random
-from typing import Tuple, List
+from typing import Tuple, List, Dict, Sequence
 from config import Config
+from sampling import AliasSampler
 
 class GameEngine:
     
+    SLOT_SYMBOLS = ['🍌', '🐵', '⭐', '💎', '🎯', '💰', '🎰', '🍀']
+    BATCH_GAMES = ('crash', 'slot')  # Движки, которые умеет play_batch
+    
+    # Таблицы исходов: (название игры, параметры распределения) -> сэмплер.
+    # Веса зависят только от этих параметров, поэтому игры на одном движке
+    # и измененные настройки получают свои таблицы, а id() настроек,
+    # который Python может выдать новому объекту, в ключ не входит.
+    _samplers: Dict[Tuple[str, tuple], AliasSampler] = {}
+    SAMPLERS_LIMIT = 256
+    
+    @classmethod
+    def _sampler(cls, config: Dict, build, params: Tuple[str, ...]) -> AliasSampler:
+        """Сэмплер исходов по настройкам игры; перестраивается при их изменении"""
+        values = (config[param] for param in params)
+        key = (
+            config.get('name', build.__name__),
+            tuple(tuple(value) if isinstance(value, list) else value for value in values)
+        )
+        sampler = cls._samplers.get(key)
+        if sampler is None:
+            if len(cls._samplers) >= cls.SAMPLERS_LIMIT:
+                cls._samplers.clear()
+            sampler = cls._samplers[key] = build(config)
+        return sampler
+    
+    @staticmethod
+    def _rounded_uniform(low: float, high: float) -> List[Tuple[float, float]]:
+        """Распределение round(random.uniform(low, high), 2): [(значение, вероятность)]"""
+        if high <= low:
+            return [(round(low, 2), 1.0)]
+        result = []
+        for cents in range(round(low * 100), round(high * 100) + 1):
+            start = max(low, (cents - 0.5) / 100)
+            end = min(high, (cents + 0.5) / 100)
+            if end > start:
+                result.append((cents / 100, (end - start) / (high - low)))
+        return result
+    
+    CRASH_PARAMS = ('instant_crash_chance', 'high_multiplier_chance', 'low_multiplier_range')
+    
+    @staticmethod
+    def _build_crash(config: Dict) -> AliasSampler:
+        """Исходы краша: мгновенный, высокий множитель, забрал/краш на низком множителе"""
+        instant = config['instant_crash_chance']
+        high = (1 - instant) * config['high_multiplier_chance']
+        low = (1 - instant) * (1 - config['high_multiplier_chance'])
+        
+        weights = [instant, high]
+        outcomes = [("instant", None), ("high", None)]
+        for multiplier, chance in GameEngine._rounded_uniform(*config['low_multiplier_range']):
+            # Игрок забирает в 80% случаев, когда множитель > 1.0
+            cash_out = 0.8 if multiplier > 1.0 else 0.0
+            weights += [low * chance * cash_out, low * chance * (1 - cash_out)]
+            outcomes += [("cash_out", multiplier), ("crash", multiplier)]
+        return AliasSampler(weights, outcomes)
+    
+    @staticmethod
+    def _build_slot(config: Dict) -> AliasSampler:
+        """Категории комбинаций трех независимых барабанов"""
+        n = len(GameEngine.SLOT_SYMBOLS)
+        return AliasSampler(
+            [1, n - 1, 3 * n * (n - 1), n * (n - 1) * (n - 2)],  # Из n^3 равновероятных комбинаций
+            ["jackpot", "three", "two", "none"]
+        )
+    
     @staticmethod
-    def play_flip(bet: float, choice: str) -> Tuple[bool, float, str, str]:
-        """Игра Monkey Flip"""
-        config = Config.GAMES['flip']
+    def play_flip(bet: float, choice: str, rng: random.Random = random,
+                  config: Dict = None) -> Tuple[bool, float, str, str]:
+        """Игра Monkey Flip.
+        
+        rng — источник случайности (например, FairRandom), config — настройки
+        игры, если не Config.GAMES['flip'] (несколько игр на одном движке).
+        """
+        config = config or Config.GAMES['flip']
         
         # Специальное событие (1.5% шанс проигрыша)
-        if random.random() < config['special_event_chance']:
+        if rng.random() < config['special_event_chance']:
             return False, 0.0, "🍌🌀", "Специальное событие! Банан улетел в космос!"
         
         # Основная логика
-        win = random.random() < config['win_chance']
+        win = rng.random() < config['win_chance']
         
         if win:
             win_amount = bet * config['multiplier']
@@ -27,40 +99,51 @@ class GameEngine:
             return False, 0.0, lose_emoji, result_text
     
     @staticmethod
-    def play_crash(bet: float) -> Tuple[bool, float, str, str]:
+    def play_crash(bet: float, rng: random.Random = random,
+                   config: Dict = None) -> Tuple[bool, float, str, str]:
         """Игра Banana Crash"""
-        config = Config.GAMES['crash']
+        config = config or Config.GAMES['crash']
+        
+        # Один выбор из заранее посчитанного распределения исходов
+        outcome, multiplier = GameEngine._sampler(config, GameEngine._build_crash, GameEngine.CRASH_PARAMS).sample(rng)
         
         # 60% шанс мгновенного краша
-        if random.random() < config['instant_crash_chance']:
+        if outcome == "instant":
             return False, 0.0, "💥", "Мгновенный краш! x1.00"
         
         # 2% шанс на высокий множитель
-        if random.random() < config['high_multiplier_chance']:
-            multiplier = random.uniform(config['min_high_multiplier'], 5.0)
+        if outcome == "high":
+            multiplier = rng.uniform(config['min_high_multiplier'], 5.0)
             multiplier = round(multiplier, 2)
             win_amount = bet * multiplier
             return True, win_amount, "🚀", f"Улетный множитель! x{multiplier}"
         
-        # Обычный низкий множитель
-        multiplier = random.uniform(*config['low_multiplier_range'])
-        multiplier = round(multiplier, 2)
-        
-        # Игрок забирает в 80% случаев, когда множитель > 1.0
-        if multiplier > 1.0 and random.random() < 0.8:
+        # Обычный низкий множитель: игрок забрал или краш
+        if outcome == "cash_out":
             win_amount = bet * multiplier
             return True, win_amount, "✅", f"Вы забрали на x{multiplier}"
         else:
             return False, 0.0, "💥", f"Краш на x{multiplier}"
     
     @staticmethod
-    def play_slot(bet: float) -> Tuple[bool, float, str, List[str]]:
+    def play_slot(bet: float, rng: random.Random = random,
+                  config: Dict = None) -> Tuple[bool, float, str, List[str]]:
         """Игра Слот-машина"""
-        config = Config.GAMES['slot']
-        
-        # Генерируем 3 барабана
-        symbols = ['🍌', '🐵', '⭐', '💎', '🎯', '💰', '🎰', '🍀']
-        reels = [random.choice(symbols) for _ in range(3)]
+        config = config or Config.GAMES['slot']
+        
+        # Выбираем категорию комбинации, затем барабаны внутри нее равновероятно
+        symbols = GameEngine.SLOT_SYMBOLS
+        combination = GameEngine._sampler(config, GameEngine._build_slot, ()).sample(rng)
+        if combination == "jackpot":
+            reels = [symbols[0]] * 3
+        elif combination == "three":
+            reels = [rng.choice(symbols[1:])] * 3
+        elif combination == "two":
+            pair, odd = rng.sample(symbols, 2)
+            reels = [pair] * 3
+            reels[rng.randrange(3)] = odd
+        else:
+            reels = rng.sample(symbols, 3)
         
         # Проверяем выигрышную комбинацию
         if reels[0] == reels[1] == reels[2]:
@@ -80,12 +163,13 @@ class GameEngine:
             return False, 0.0, f"🎰 {reels[0]} {reels[1]} {reels[2]}", reels
     
     @staticmethod
-    def play_dice(bet: float, user_number: int) -> Tuple[bool, float, str, int]:
+    def play_dice(bet: float, user_number: int, rng: random.Random = random,
+                  config: Dict = None) -> Tuple[bool, float, str, int]:
         """Игра Банановые кости"""
-        config = Config.GAMES['dice']
+        config = config or Config.GAMES['dice']
         
         # Бросаем кубик (1-6)
-        dice_roll = random.randint(1, 6)
+        dice_roll = rng.randint(1, 6)
         
         # Игрок выигрывает, если угадал число
         if user_number == dice_roll:
@@ -95,17 +179,75 @@ class GameEngine:
             return False, 0.0, f"🎲 Выпало {dice_roll}, а вы загадали {user_number}", dice_roll
     
     @staticmethod
-    def play_jackpot(bet: float) -> Tuple[bool, float, str]:
+    def play_jackpot(bet: float, rng: random.Random = random,
+                     config: Dict = None) -> Tuple[bool, float, str]:
         """Игра Джекпот"""
-        config = Config.GAMES['jackpot']
+        config = config or Config.GAMES['jackpot']
         
         # Количество билетов
         tickets = int(bet / config['ticket_price'])
         
-        # Проверяем каждый билет
-        for _ in range(tickets):
-            if random.random() < config['win_chance']:
-                win_amount = config['ticket_price'] * config['multiplier']
-                return True, win_amount, "💰 ДЖЕКПОТ!!!"
+        # Хотя бы один выигрышный билет из tickets: 1 - (1 - p)^tickets.
+        # Одно случайное число вместо проверки каждого билета.
+        chance = -math.expm1(tickets * math.log1p(-config['win_chance'])) if tickets > 0 else 0.0
+        if rng.random() < chance:
+            win_amount = config['ticket_price'] * config['multiplier']
+            return True, win_amount, "💰 ДЖЕКПОТ!!!"
         
         return False, 0.0, f"💰 Куплено {tickets} билетов. Попробуйте еще!"
+    
+    @staticmethod
+    def play_batch(game: str, bet: float, rounds: int, balance: float,
+                   stop_loss: float = None, stop_win: float = None,
+                   rng: random.Random = random, config: Dict = None,
+                   rngs: Sequence[random.Random] = None) -> Dict:
+        """Автоигра: до rounds раундов подряд с одной ставкой.
+        
+        Серия останавливается, когда не хватает баланса на следующий раунд,
+        проигрыш достиг stop_loss или выигрыш достиг stop_win. Возвращает
+        итог серии для Database.settle_batch и сводного сообщения.
+        rngs — свой генератор на каждый раунд (в честной игре у раунда свой
+        nonce); без них все раунды берут числа из rng по очереди. game —
+        движок (crash или slot), config — настройки игры на нем.
+        """
+        play = {
+            'crash': lambda rng: GameEngine.play_crash(bet, rng, config)[1],
+            'slot': lambda rng: GameEngine.play_slot(bet, rng, config)[1],
+        }[game]
+        
+        net = payout = best = required = 0.0
+        played = wins = 0
+        stop_reason = "rounds"
+        for index in range(rounds):
+            if balance + net < bet:
+                stop_reason = "balance"
+                break
+            if stop_loss is not None and net <= -stop_loss:
+                stop_reason = "stop_loss"
+                break
+            if stop_win is not None and net >= stop_win:
+                stop_reason = "stop_win"
+                break
+            
+            # Стартовый баланс, при котором этот раунд еще по карману
+            required = max(required, bet - net)
+            amount = play(rng if rngs is None else rngs[index])
+            played += 1
+            wins += amount > 0
+            payout += amount
+            best = max(best, amount)
+            net += amount - bet
+        
+        return {
+            "game": game,
+            "bet": bet,
+            "rounds": played,
+            "requested": rounds,
+            "wins": wins,
+            "wagered": bet * played,
+            "payout": payout,
+            "net": net,
+            "best_multiplier": best / bet if bet else 0.0,
+            "required_balance": required,
+            "stop_reason": stop_reason
+        }
@@ -0,0 +1,150 @@
+import asyncio
+import logging
+import random
+import time
+from bisect import bisect_right
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+def pick_winners(user_ids: Sequence[int], cumulative: Sequence[int], count: int,
+                 rng: random.Random = random) -> List[int]:
+    """Выбрать count разных билетов, вероятность пропорциональна билетам.
+    
+    cumulative[i] — сколько билетов у участников 0..i вместе. Номер билета
+    выбирается равномерно, владелец находится бинарным поиском — O(log n)
+    на победителя. Возвращает user_id владельцев билетов по порядку призов.
+    """
+    total = cumulative[-1] if cumulative else 0
+    tickets = rng.sample(range(total), min(count, total))
+    return [user_ids[bisect_right(cumulative, ticket)] for ticket in tickets]
+
+class JackpotPool:
+    """Общий прогрессивный джекпот.
+    
+    Покупка билетов — одна строка в jackpot_tickets, пул копится в памяти
+    и восстанавливается из базы при запуске. Раз в draw_interval секунд
+    проходит розыгрыш: призы (доли пула из prizes) получают владельцы
+    случайных билетов, выплаты и закрытие розыгрыша — одна транзакция.
+    Неразыгранная часть пула переходит в следующий розыгрыш.
+    
+    on_draw — корутина, получающая итог розыгрыша (например, уведомить победителей).
+    """
+    
+    def __init__(self, db, ticket_price: float = 1.0, pool_share: float = 0.9,
+                 prizes: Sequence[float] = (0.5, 0.3, 0.2), draw_interval: int = 3600,
+                 on_draw: Optional[Callable[[Dict], Awaitable]] = None):
+        self.db = db
+        self.ticket_price = ticket_price
+        self.pool_share = pool_share
+        self.prizes = tuple(prizes)
+        self.draw_interval = draw_interval
+        self.on_draw = on_draw
+        self.round: Optional[Dict] = None
+        self.tickets = 0
+        self._drawing = False
+        self._pending = 0
+        self._purchases_done = asyncio.Event()
+        self._purchases_done.set()
+        self._task: Optional[asyncio.Task] = None
+    
+    async def start(self):
+        """Загрузить открытый розыгрыш и запустить расписание"""
+        await self.db.finish_jackpot_payouts()  # Розыгрыш, прерванный на выплатах
+        self.round = await self.db.get_open_jackpot_round()
+        self.tickets = await self.db.get_jackpot_sales(self.round['id'])
+        self._task = asyncio.create_task(self._loop())
+        logger.info(f"💰 Общий джекпот #{self.round['id']}: {self.tickets} билетов, пул {self.pool:.2f} STAR")
+    
+    async def shutdown(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+    
+    @property
+    def pool(self) -> float:
+        """Текущий пул: перенос прошлого розыгрыша + доля продаж"""
+        return self.round['carryover'] + self.tickets * self.ticket_price * self.pool_share
+    
+    def seconds_to_draw(self) -> int:
+        return max(0, int(self.round['created_at'] + self.draw_interval - time.time()))
+    
+    async def buy(self, user_id: int, tickets: int) -> Optional[float]:
+        """Купить билеты; None — не хватает баланса или идет розыгрыш"""
+        if self._drawing:
+            return None
+        
+        round_id = self.round['id']
+        self._pending += 1
+        self._purchases_done.clear()
+        try:
+            balance = await self.db.buy_jackpot_tickets(user_id, round_id, tickets, self.ticket_price)
+        finally:
+            self._pending -= 1
+            if not self._pending:
+                self._purchases_done.set()
+        
+        if balance is not None:
+            self.tickets += tickets
+        return balance
+    
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.seconds_to_draw())
+            try:
+                await self.draw()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Ошибка розыгрыша джекпота: {e}")
+                await asyncio.sleep(60)
+    
+    async def draw(self) -> Dict:
+        """Провести розыгрыш открытого пула"""
+        self._drawing = True
+        try:
+            await self._purchases_done.wait()  # Покупки, которые уже пишутся в базу, участвуют
+            round_id = self.round['id']
+            started = time.perf_counter()
+            
+            user_ids, cumulative = await self.db.get_jackpot_entries(round_id)
+            tickets = cumulative[-1] if cumulative else 0
+            pool = self.round['carryover'] + tickets * self.ticket_price * self.pool_share
+            winners = pick_winners(user_ids, cumulative, len(self.prizes))
+            
+            payouts: Dict[int, float] = {}
+            for user_id, share in zip(winners, self.prizes):
+                payouts[user_id] = round(payouts.get(user_id, 0.0) + pool * share, 2)
+            carryover = pool - sum(payouts.values())
+            
+            next_round_id = await self.db.settle_jackpot(round_id, payouts, tickets, pool, carryover)
+            if next_round_id is None:
+                # Розыгрыш уже закрыт (повтор после сбоя или другой процесс):
+                # призы — сохраненные, а не только что выбранные
+                payouts = await self.db.get_jackpot_winners(round_id) or {}
+                carryover = pool - sum(payouts.values())
+            self.round = await self.db.get_open_jackpot_round()
+            self.tickets = await self.db.get_jackpot_sales(self.round['id'])
+        finally:
+            self._drawing = False
+        
+        result = {
+            "round_id": round_id,
+            "tickets": tickets,
+            "players": len(user_ids),
+            "pool": pool,
+            "payouts": payouts,
+            "carryover": carryover,
+            "seconds": time.perf_counter() - started
+        }
+        logger.info(
+            f"💰 Джекпот #{round_id}: {tickets} билетов, пул {pool:.2f} STAR, "
+            f"победителей {len(payouts)}, перенос {carryover:.2f} ({result['seconds'] * 1000:.0f} мс)"
+        )
+        if next_round_id is None:
+            logger.warning(f"⚠️ Джекпот #{round_id} уже был разыгран, повторных выплат нет")
+            result["already_drawn"] = True
+        elif self.on_draw:
+            await self.on_draw(result)
+        return result
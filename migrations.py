@@ -0,0 +1,312 @@
+import sqlite3
+import time
+import logging
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Агрегаты для админ-панели: ключ таблицы stats -> полный пересчет.
+# Используются при создании таблицы и в Database.rebuild_stats().
+STATS_QUERIES: Dict[str, str] = {
+    "total_users": "SELECT COUNT(*) FROM users",
+    "total_balance": "SELECT COALESCE(SUM(balance), 0) FROM users",
+    "total_wagered": "SELECT COALESCE(SUM(total_wagered), 0) FROM users",
+    "pending_withdrawals": "SELECT COUNT(*) FROM withdrawals WHERE status = 'pending'",
+    "total_income": "SELECT COALESCE(-SUM(amount), 0) FROM transactions WHERE amount < 0",
+}
+
+# Миграции схемы: (версия, описание, SQL-команды).
+# Применяются по порядку, каждая в своей транзакции. Уже примененные
+# миграции не меняются — для изменений добавляется новая версия.
+MIGRATIONS: List[Tuple[int, str, List[str]]] = [
+    (1, "Индексы для горячих запросов", [
+        # get_user_transactions: WHERE user_id = ? ORDER BY created_at DESC
+        "CREATE INDEX IF NOT EXISTS idx_transactions_user_created ON transactions (user_id, created_at)",
+        # get_user_referrals: WHERE referrer_id = ?
+        "CREATE INDEX IF NOT EXISTS idx_users_referrer ON users (referrer_id)",
+        # get_withdrawals: WHERE status = ? ORDER BY created_at DESC
+        "CREATE INDEX IF NOT EXISTS idx_withdrawals_status_created ON withdrawals (status, created_at)",
+        # get_withdrawals без фильтра: ORDER BY created_at DESC
+        "CREATE INDEX IF NOT EXISTS idx_withdrawals_created ON withdrawals (created_at)",
+        # delete_sponsor: DELETE FROM user_sponsors WHERE sponsor_id = ?
+        "CREATE INDEX IF NOT EXISTS idx_user_sponsors_sponsor ON user_sponsors (sponsor_id)",
+    ]),
+    (2, "Инкрементальные счетчики статистики", [
+        '''CREATE TABLE IF NOT EXISTS stats (
+            key TEXT PRIMARY KEY,
+            value REAL NOT NULL DEFAULT 0
+        )''',
+        *[
+            f"INSERT OR REPLACE INTO stats (key, value) SELECT '{key}', ({query})"
+            for key, query in STATS_QUERIES.items()
+        ],
+        # Пользователи: количество, общий баланс и сумма ставок
+        '''CREATE TRIGGER IF NOT EXISTS trg_stats_users_insert AFTER INSERT ON users
+        BEGIN
+            UPDATE stats SET value = value + 1 WHERE key = 'total_users';
+            UPDATE stats SET value = value + NEW.balance WHERE key = 'total_balance';
+            UPDATE stats SET value = value + NEW.total_wagered WHERE key = 'total_wagered';
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_stats_users_delete AFTER DELETE ON users
+        BEGIN
+            UPDATE stats SET value = value - 1 WHERE key = 'total_users';
+            UPDATE stats SET value = value - OLD.balance WHERE key = 'total_balance';
+            UPDATE stats SET value = value - OLD.total_wagered WHERE key = 'total_wagered';
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_stats_users_balance AFTER UPDATE OF balance ON users
+        WHEN NEW.balance IS NOT OLD.balance
+        BEGIN
+            UPDATE stats SET value = value + NEW.balance - OLD.balance WHERE key = 'total_balance';
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_stats_users_wagered AFTER UPDATE OF total_wagered ON users
+        WHEN NEW.total_wagered IS NOT OLD.total_wagered
+        BEGIN
+            UPDATE stats SET value = value + NEW.total_wagered - OLD.total_wagered WHERE key = 'total_wagered';
+        END''',
+        # Заявки на вывод в статусе pending
+        '''CREATE TRIGGER IF NOT EXISTS trg_stats_withdrawals_insert AFTER INSERT ON withdrawals
+        WHEN NEW.status = 'pending'
+        BEGIN
+            UPDATE stats SET value = value + 1 WHERE key = 'pending_withdrawals';
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_stats_withdrawals_status AFTER UPDATE OF status ON withdrawals
+        WHEN (NEW.status = 'pending') != (OLD.status = 'pending')
+        BEGIN
+            UPDATE stats SET value = value + (NEW.status = 'pending') - (OLD.status = 'pending')
+            WHERE key = 'pending_withdrawals';
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_stats_withdrawals_delete AFTER DELETE ON withdrawals
+        WHEN OLD.status = 'pending'
+        BEGIN
+            UPDATE stats SET value = value - 1 WHERE key = 'pending_withdrawals';
+        END''',
+        # Доход: сумма всех списаний (накопительный, удаление строк его не уменьшает)
+        '''CREATE TRIGGER IF NOT EXISTS trg_stats_transactions_insert AFTER INSERT ON transactions
+        WHEN NEW.amount < 0
+        BEGIN
+            UPDATE stats SET value = value - NEW.amount WHERE key = 'total_income';
+        END''',
+    ]),
+    (3, "Рассылки с сохранением прогресса", [
+        '''CREATE TABLE IF NOT EXISTS broadcasts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            text TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'running',
+            last_user_id INTEGER NOT NULL DEFAULT 0,
+            sent INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            blocked INTEGER NOT NULL DEFAULT 0,
+            created_at INTEGER,
+            updated_at INTEGER
+        )''',
+        "CREATE INDEX IF NOT EXISTS idx_broadcasts_status ON broadcasts (status)",
+    ]),
+    (4, "Архивация журнала транзакций", [
+        # Выбор старых строк для переноса в архив
+        "CREATE INDEX IF NOT EXISTS idx_transactions_created ON transactions (created_at)",
+        # Итоги по архивным строкам: баланс = checkpoint + сумма горячих строк
+        '''CREATE TABLE IF NOT EXISTS balance_checkpoints (
+            user_id INTEGER PRIMARY KEY,
+            archived_amount REAL NOT NULL DEFAULT 0,
+            archived_income REAL NOT NULL DEFAULT 0,
+            archived_count INTEGER NOT NULL DEFAULT 0,
+            archived_until INTEGER
+        )''',
+        '''CREATE TABLE IF NOT EXISTS transaction_archives (
+            month TEXT PRIMARY KEY,
+            path TEXT NOT NULL,
+            rows INTEGER NOT NULL DEFAULT 0,
+            archived_at INTEGER
+        )''',
+    ]),
+    (5, "Ставки общих раундов Banana Crash", [
+        # Ставка списывается при входе в раунд; open — раунд еще не рассчитан
+        '''CREATE TABLE IF NOT EXISTS crash_bets (
+            round_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            bet REAL NOT NULL,
+            cashout REAL,
+            payout REAL NOT NULL DEFAULT 0,
+            status TEXT NOT NULL DEFAULT 'open',
+            created_at INTEGER,
+            PRIMARY KEY (round_id, user_id)
+        )''',
+        # Возврат ставок раундов, прерванных перезапуском
+        "CREATE INDEX IF NOT EXISTS idx_crash_bets_open ON crash_bets (round_id) WHERE status = 'open'",
+    ]),
+    (6, "Общий прогрессивный джекпот", [
+        # Розыгрыши: открытый копит билеты, carryover — остаток пула прошлого розыгрыша
+        '''CREATE TABLE IF NOT EXISTS jackpot_rounds (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            status TEXT NOT NULL DEFAULT 'open',
+            carryover REAL NOT NULL DEFAULT 0,
+            tickets INTEGER NOT NULL DEFAULT 0,
+            pool REAL NOT NULL DEFAULT 0,
+            winners TEXT,
+            created_at INTEGER,
+            drawn_at INTEGER
+        )''',
+        # Покупки билетов: только добавление строк
+        '''CREATE TABLE IF NOT EXISTS jackpot_tickets (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            round_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            tickets INTEGER NOT NULL,
+            created_at INTEGER
+        )''',
+        "CREATE INDEX IF NOT EXISTS idx_jackpot_tickets_round ON jackpot_tickets (round_id, user_id, tickets)",
+    ]),
+    (7, "Доказуемо честная игра: зерна и nonce", [
+        # active — текущее зерно (игроку известен только server_hash), revealed — раскрытые.
+        # nonce у активного зерна — граница зарезервированных номеров ставок,
+        # у раскрытого — сколько номеров было выдано.
+        '''CREATE TABLE IF NOT EXISTS fair_seeds (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            server_seed TEXT NOT NULL,
+            server_hash TEXT NOT NULL,
+            client_seed TEXT NOT NULL,
+            nonce INTEGER NOT NULL DEFAULT 0,
+            status TEXT NOT NULL DEFAULT 'active',
+            created_at INTEGER,
+            revealed_at INTEGER
+        )''',
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_fair_seeds_active ON fair_seeds (user_id) WHERE status = 'active'",
+        "CREATE INDEX IF NOT EXISTS idx_fair_seeds_user ON fair_seeds (user_id, id)",
+    ]),
+    (8, "Состояния FSM", [
+        # key — "bot:chat:user:thread:business:destiny", data — компактный JSON
+        # (NULL — пустые данные). Строка без состояния и данных удаляется.
+        '''CREATE TABLE IF NOT EXISTS fsm_states (
+            key TEXT PRIMARY KEY,
+            state TEXT,
+            data TEXT,
+            updated_at INTEGER NOT NULL
+        ) WITHOUT ROWID''',
+        "CREATE INDEX IF NOT EXISTS idx_fsm_states_updated ON fsm_states (updated_at)",
+    ]),
+    (9, "Идемпотентные выплаты джекпота", [
+        # Отметка "выплаты розыгрыша на этом файле сделаны" — пишется в одной
+        # транзакции с выплатами, повторная выплата того же розыгрыша невозможна
+        '''CREATE TABLE IF NOT EXISTS jackpot_settlements (
+            round_id INTEGER PRIMARY KEY,
+            settled_at INTEGER
+        )''',
+        # Розыгрыш закрыт, но выплаты на других шардах еще не подтверждены
+        "ALTER TABLE jackpot_rounds ADD COLUMN payouts_pending INTEGER NOT NULL DEFAULT 0",
+        "CREATE INDEX IF NOT EXISTS idx_jackpot_rounds_pending ON jackpot_rounds (id) WHERE payouts_pending = 1",
+    ]),
+]
+
+# Полный пересчет статистики с учетом архивных транзакций (после миграции 4)
+REBUILD_STATS_QUERIES: Dict[str, str] = {
+    **STATS_QUERIES,
+    "total_income": '''SELECT
+        COALESCE((SELECT -SUM(amount) FROM transactions WHERE amount < 0), 0)
+        + COALESCE((SELECT SUM(archived_income) FROM balance_checkpoints), 0)''',
+}
+
+# Горячие запросы, план которых проверяется через EXPLAIN QUERY PLAN
+HOT_QUERIES: Dict[str, Tuple[str, tuple]] = {
+    "get_user": (
+        "SELECT * FROM users WHERE user_id = ?", (1,)
+    ),
+    "get_user_transactions": (
+        "SELECT * FROM transactions WHERE user_id = ? ORDER BY created_at DESC, id DESC LIMIT ?", (1, 10)
+    ),
+    "get_user_transactions_page": (
+        '''SELECT * FROM transactions
+           WHERE user_id = ? AND (created_at, id) < (?, ?)
+           ORDER BY created_at DESC, id DESC LIMIT ?''', (1, 0, 0, 10)
+    ),
+    "iter_users": (
+        "SELECT * FROM users WHERE user_id > ? ORDER BY user_id LIMIT ?", (0, 100)
+    ),
+    "get_user_referrals_total": (
+        "SELECT COUNT(*) FROM users WHERE referrer_id = ?", (1,)
+    ),
+    "get_user_referrals_active": (
+        '''SELECT COUNT(DISTINCT u.user_id)
+           FROM users u
+           JOIN user_sponsors us ON u.user_id = us.user_id
+           WHERE u.referrer_id = ? AND us.is_subscribed = 1''', (1,)
+    ),
+    "get_withdrawals_by_status": (
+        '''SELECT w.*, u.username
+           FROM withdrawals w
+           LEFT JOIN users u ON w.user_id = u.user_id
+           WHERE w.status = ?
+           ORDER BY w.created_at DESC''', ("pending",)
+    ),
+    "iter_withdrawals_page": (
+        '''SELECT w.*, u.username
+           FROM withdrawals w
+           LEFT JOIN users u ON w.user_id = u.user_id
+           WHERE w.status = ? AND (w.created_at, w.id) < (?, ?)
+           ORDER BY w.created_at DESC, w.id DESC
+           LIMIT ?''', ("pending", 0, 0, 50)
+    ),
+    "delete_sponsor_links": (
+        "DELETE FROM user_sponsors WHERE sponsor_id = ?", (1,)
+    ),
+    "purge_fsm_states": (
+        "DELETE FROM fsm_states WHERE updated_at < ?", (0,)
+    ),
+}
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    """Текущая версия схемы"""
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """Применить недостающие миграции, вернуть версию схемы"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at INTEGER
+        )
+    ''')
+    conn.commit()
+    
+    current = get_schema_version(conn)
+    for version, description, statements in MIGRATIONS:
+        if version <= current:
+            continue
+        
+        try:
+            conn.execute("BEGIN")
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(
+                "INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                (version, description, int(time.time()))
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            logger.error(f"❌ Миграция {version} ({description}) не применена")
+            raise
+        
+        current = version
+        logger.info(f"✅ Миграция {version}: {description}")
+    
+    return current
+
+def explain(conn: sqlite3.Connection, sql: str, params: tuple = ()) -> List[str]:
+    """План выполнения запроса (колонка detail из EXPLAIN QUERY PLAN)"""
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+
+def find_full_scans(conn: sqlite3.Connection) -> Dict[str, List[str]]:
+    """Горячие запросы с полным сканированием таблицы или сортировкой во временном B-дереве"""
+    problems = {}
+    for name, (sql, params) in HOT_QUERIES.items():
+        plan = explain(conn, sql, params)
+        bad = [
+            step for step in plan
+            if (step.startswith("SCAN") and "USING" not in step) or "TEMP B-TREE" in step
+        ]
+        if bad:
+            problems[name] = bad
+    return problems
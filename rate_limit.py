@@ -0,0 +1,129 @@
+import asyncio
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.exceptions import TelegramAPIError
+from aiogram.types import TelegramObject, Update
+
+class TokenBucket:
+    """Корзина токенов: `rate` токенов в секунду, запас не больше `capacity`"""
+    
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+    
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+    
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    def try_acquire(self, tokens: float = 1.0, now: Optional[float] = None) -> bool:
+        """Забрать токены без ожидания; False, если их не хватает"""
+        self._refill(now if now is not None else time.monotonic())
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return True
+        return False
+    
+    def delay(self, tokens: float = 1.0) -> float:
+        """Сколько секунд ждать до появления токенов"""
+        self._refill(time.monotonic())
+        return max(0.0, (tokens - self.tokens) / self.rate)
+    
+    async def acquire(self, tokens: float = 1.0):
+        """Дождаться и забрать токены"""
+        while not self.try_acquire(tokens):
+            await asyncio.sleep(self.delay(tokens))
+    
+    def pause(self, seconds: float):
+        """Остановить выдачу токенов на время (например, после 429)"""
+        self._refill(time.monotonic())
+        self.tokens = min(self.tokens, 0.0) - seconds * self.rate
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """Ограничение частоты действий: корзина токенов на пару (пользователь, действие).
+    
+    Действие — первая часть callback_data до "_" (click, bet, autoplay...)
+    или "message" для сообщений; лимиты — rates[действие] или rates["default"]
+    в виде (токенов в секунду, запас). Регистрируется на dp.update до
+    блокировок и загрузки пользователя: лишние нажатия отсекаются без
+    обращения к базе, на callback отвечает answer_text.
+    
+    Корзины лежат в OrderedDict в порядке последнего обращения; проверка —
+    O(1), простаивающие корзины удаляются с начала словаря. Корзина
+    удаляется не раньше, чем успела бы наполниться, поэтому удаление
+    не меняет решений.
+    """
+    
+    def __init__(self, rates: Dict[str, Tuple[float, float]],
+                 answer_text: str = "⏳ Слишком часто, подождите секунду",
+                 max_buckets: int = 100_000):
+        self.rates = rates
+        self.default = rates["default"]
+        self.answer_text = answer_text
+        self.max_buckets = max_buckets
+        self.idle_ttl = max(capacity / rate for rate, capacity in rates.values())
+        self._buckets: "OrderedDict[Tuple[int, str], TokenBucket]" = OrderedDict()
+        self.passed = 0
+        self.throttled: Counter = Counter()
+    
+    @staticmethod
+    def action(update: Update) -> Optional[str]:
+        if update.callback_query and update.callback_query.data:
+            return update.callback_query.data.split("_", 1)[0]
+        if update.message:
+            return "message"
+        return None
+    
+    def allow(self, user_id: int, action: str, now: Optional[float] = None) -> bool:
+        """Забрать токен из корзины пользователя; False — лимит исчерпан"""
+        now = now if now is not None else time.monotonic()
+        key = (user_id, action)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(*self.rates.get(action, self.default))
+        else:
+            self._buckets.move_to_end(key)
+        allowed = bucket.try_acquire(now=now)
+        
+        # Просроченные корзины — в начале словаря
+        while self._buckets:
+            oldest_key = next(iter(self._buckets))
+            oldest = self._buckets[oldest_key]
+            if now - oldest.updated < self.idle_ttl and len(self._buckets) <= self.max_buckets:
+                break
+            del self._buckets[oldest_key]
+        return allowed
+    
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        user = data.get("event_from_user")
+        action = self.action(event) if isinstance(event, Update) else None
+        if user is None or action is None or self.allow(user.id, action):
+            self.passed += 1
+            return await handler(event, data)
+        
+        self.throttled[action] += 1
+        if event.callback_query:
+            try:
+                await event.callback_query.answer(self.answer_text)
+            except TelegramAPIError:
+                pass
+        return None
+    
+    def get_stats(self) -> Dict:
+        return {
+            "passed": self.passed,
+            "throttled": sum(self.throttled.values()),
+            "throttled_by_action": dict(self.throttled),
+            "buckets": len(self._buckets)
+        }
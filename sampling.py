@@ -0,0 +1,40 @@
+import random
+from typing import Any, List, Sequence
+
+class AliasSampler:
+    """Выбор исхода из дискретного распределения за O(1) (метод Уолкера–Вуза).
+    
+    Таблицы строятся один раз за O(n), после этого каждый выбор — одно
+    случайное число и одно сравнение, независимо от числа исходов.
+    """
+    
+    __slots__ = ("outcomes", "probabilities", "_prob", "_alias", "_n")
+    
+    def __init__(self, weights: Sequence[float], outcomes: Sequence[Any] = None):
+        total = float(sum(weights))
+        if total <= 0 or any(w < 0 for w in weights):
+            raise ValueError("Веса должны быть неотрицательными и не все нулевыми")
+        
+        self._n = n = len(weights)
+        self.outcomes: List[Any] = list(outcomes) if outcomes is not None else list(range(n))
+        self.probabilities: List[float] = [w / total for w in weights]
+        
+        scaled = [p * n for p in self.probabilities]
+        self._prob = [1.0] * n
+        self._alias = list(range(n))
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            self._prob[s] = scaled[s]
+            self._alias[s] = l
+            scaled[l] -= 1.0 - scaled[s]
+            (small if scaled[l] < 1.0 else large).append(l)
+        # Остатки из-за погрешности округления равны 1
+    
+    def sample(self, rng: random.Random = random) -> Any:
+        """Случайный исход"""
+        # Целая часть u выбирает столбец, дробная — исход или его псевдоним
+        u = rng.random() * self._n
+        i = int(u)
+        return self.outcomes[i if u - i < self._prob[i] else self._alias[i]]
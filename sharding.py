@@ -0,0 +1,326 @@
+import heapq
+import logging
+import os
+from array import array
+from collections import defaultdict
+from typing import Optional, Dict, List, Tuple, Iterator
+
+from database import Database
+
+logger = logging.getLogger(__name__)
+
+class ShardedDatabase:
+    """Database, разделенная по user_id на несколько файлов SQLite.
+    
+    SQLite допускает одного писателя на файл, поэтому users, transactions,
+    user_sponsors и withdrawals раскладываются по шардам по хэшу user_id,
+    и ставки разных пользователей не ждут одну блокировку.
+    
+    - методы с user_id первым аргументом выполняются на шарде пользователя;
+    - спонсоры копируются на все шарды (нужны для JOIN со статусами);
+    - рассылки и прочие глобальные таблицы хранятся на первом шарде;
+    - статистика, рефералы и списки собираются со всех шардов.
+    """
+    
+    # Методы, где первый аргумент — user_id
+    USER_METHODS = frozenset({
+        "get_user", "insert_user", "update_balance", "update_last_click", "credit_balance",
+        "update_game_stats", "settle_bet", "settle_batch", "place_round_bet",
+        "buy_jackpot_tickets", "get_user_sponsors_status", "is_subscribed_to_all",
+        "update_user_sponsor_status", "add_transaction", "get_user_transactions",
+        "get_archived_transactions", "get_user_history", "reconcile_user",
+        "get_fair_seed", "create_fair_seed", "reserve_fair_nonces", "rotate_fair_seed",
+        "get_fair_seed_history",
+    })
+    
+    # Свои реализации, которые в основном пишут в шард пользователя (user_id первым)
+    USER_FIRST_METHODS = frozenset({"create_user", "claim_click", "create_withdrawal"})
+    
+    def __init__(self, db_path: str = "monkey_stars.db", shards: int = 4, **options):
+        base, ext = os.path.splitext(db_path)
+        self.shards = [Database(f"{base}.shard{i}{ext}", **options) for i in range(shards)]
+        self.catalog = self.shards[0]  # Глобальные таблицы
+        logger.info(f"✅ Шардированная база: {shards} файлов")
+    
+    def shard_index(self, user_id: int) -> int:
+        """Номер шарда пользователя (мультипликативный хэш Кнута)"""
+        return ((user_id * 2654435761) & 0xFFFFFFFF) % len(self.shards)
+    
+    def executor_index(self, name: str, args: tuple) -> int:
+        """Поток AsyncDatabase для вызова: шард пользователя или каталог.
+        
+        Методы по всем шардам тоже идут в поток каталога и пишут в чужие
+        шарды через свои подключения (ожидая на busy_timeout).
+        """
+        if args and (name in self.USER_METHODS or name in self.USER_FIRST_METHODS):
+            return self.shard_index(args[0])
+        return 0
+    
+    def shard_for(self, user_id: int) -> Database:
+        """Шард, на котором хранится пользователь"""
+        return self.shards[self.shard_index(user_id)]
+    
+    def __getattr__(self, name: str):
+        if name in self.USER_METHODS:
+            def routed(user_id, *args, **kwargs):
+                return getattr(self.shard_for(user_id), name)(user_id, *args, **kwargs)
+            routed.__name__ = name
+            return routed
+        # Остальное — глобальные таблицы на первом шарде
+        return getattr(self.catalog, name)
+    
+    # === ПОЛЬЗОВАТЕЛИ ===
+    def create_user(self, user_id: int, username: str, referrer_id: int = None) -> bool:
+        """Создать пользователя; бонус рефереру начисляется на его шарде"""
+        shard = self.shard_for(user_id)
+        try:
+            if not shard.insert_user(user_id, username, referrer_id):
+                return True
+            
+            if referrer_id:
+                shard.apply_referral_bonus(user_id, username, referrer_id, self.shard_for(referrer_id))
+            
+            logger.info(f"✅ Пользователь {user_id} создан (шард {self.shard_index(user_id)})")
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка создания пользователя {user_id}: {e}")
+            return False
+    
+    def claim_click(self, user_id: int, reward: float, cooldown: int,
+                    referral_bonus: float = 0.0, referral_note: str = "") -> Optional[Dict]:
+        """Клик на шарде пользователя.
+        
+        Бонус реферера с того же шарда начисляется в транзакции клика, с
+        другого — отдельной транзакцией на его шарде сразу после клика:
+        общей транзакции на два файла SQLite нет. Бонус только начисляет,
+        поэтому в минус не уводит, а баланс и журнал реферера меняются вместе.
+        """
+        shard = self.shard_for(user_id)
+        user = shard.get_user(user_id)
+        referrer_id = user['referrer_id'] if user else None
+        if not referrer_id or self.shard_for(referrer_id) is shard:
+            return shard.claim_click(user_id, reward, cooldown, referral_bonus, referral_note)
+        
+        claimed = shard.claim_click(user_id, reward, cooldown)
+        if claimed and referral_bonus:
+            self.shard_for(referrer_id).credit_balance(referrer_id, referral_bonus, "referral_income", referral_note)
+        return claimed
+    
+    def get_user_referrals(self, user_id: int) -> Tuple[int, int]:
+        """Рефералы могут лежать на любом шарде — суммируем"""
+        total = active = 0
+        for shard in self.shards:
+            shard_total, shard_active = shard.get_user_referrals(user_id)
+            total += shard_total
+            active += shard_active
+        return total, active
+    
+    def iter_users(self, after_id: int = None, page_size: int = 100) -> List[Dict]:
+        pages = [shard.iter_users(after_id, page_size) for shard in self.shards]
+        return list(heapq.merge(*pages, key=lambda user: user['user_id']))[:page_size]
+    
+    def stream_users(self, page_size: int = 1000) -> Iterator[Dict]:
+        for shard in self.shards:
+            yield from shard.stream_users(page_size)
+    
+    def get_all_users(self) -> List[Dict]:
+        users = [user for shard in self.shards for user in shard.get_all_users()]
+        users.sort(key=lambda user: user['created_at'], reverse=True)
+        return users
+    
+    def iter_user_ids(self, after_id: int = 0, page_size: int = 500) -> List[int]:
+        pages = [shard.iter_user_ids(after_id, page_size) for shard in self.shards]
+        return list(heapq.merge(*pages))[:page_size]
+    
+    def broadcast_message(self, message: str) -> List[int]:
+        return [user_id for shard in self.shards for user_id in shard.broadcast_message(message)]
+    
+    # === ОБЩИЕ РАУНДЫ CRASH ===
+    def settle_round(self, round_id: int, cashouts: Dict[int, float]) -> int:
+        """Ставки раунда лежат на шардах игроков — рассчитываем каждый шард"""
+        per_shard = defaultdict(dict)
+        for user_id, multiplier in cashouts.items():
+            per_shard[self.shard_index(user_id)][user_id] = multiplier
+        return sum(
+            shard.settle_round(round_id, per_shard[index])
+            for index, shard in enumerate(self.shards)
+        )
+    
+    def refund_open_bets(self) -> int:
+        return sum(shard.refund_open_bets() for shard in self.shards)
+    
+    # === ОБЩИЙ ДЖЕКПОТ (розыгрыши на первом шаре, билеты — на шардах игроков) ===
+    def get_jackpot_sales(self, round_id: int) -> int:
+        return sum(shard.get_jackpot_sales(round_id) for shard in self.shards)
+    
+    def get_jackpot_entries(self, round_id: int) -> Tuple[array, array]:
+        user_ids = array('q')
+        cumulative = array('q')
+        for shard in self.shards:
+            shard_ids, shard_cumulative = shard.get_jackpot_entries(round_id)
+            offset = cumulative[-1] if cumulative else 0
+            user_ids.extend(shard_ids)
+            cumulative.extend(total + offset for total in shard_cumulative)
+        return user_ids, cumulative
+    
+    def _split_payouts(self, payouts: Dict[int, float]) -> Dict[int, Dict[int, float]]:
+        per_shard = defaultdict(dict)
+        for user_id, payout in payouts.items():
+            per_shard[self.shard_index(user_id)][user_id] = payout
+        return per_shard
+    
+    def _pay_jackpot_shards(self, round_id: int, payouts: Dict[int, float]) -> int:
+        """Выплаты на шардах 1..n (каждая идемпотентна), затем снять отметку в каталоге"""
+        paid = 0
+        for index, shard_payouts in self._split_payouts(payouts).items():
+            if index and shard_payouts and self.shards[index].pay_jackpot(round_id, shard_payouts):
+                paid += len(shard_payouts)
+        self.catalog.mark_jackpot_paid(round_id)
+        return paid
+    
+    def settle_jackpot(self, round_id: int, payouts: Dict[int, float], tickets: int,
+                       pool: float, carryover: float) -> Optional[int]:
+        """Каталог первым закрывает розыгрыш, затем выплаты на остальных шардах.
+        
+        Каталог сохраняет всех победителей и выплачивает своих в той же
+        транзакции. Выплаты на шардах идемпотентны (jackpot_settlements),
+        поэтому повтор после сбоя доплачивает по сохраненному списку, а не по
+        новым победителям. Если розыгрыш уже был закрыт, возвращается None.
+        """
+        next_round_id = self.catalog.settle_jackpot(
+            round_id, self._split_payouts(payouts)[0], tickets, pool, carryover, winners=payouts
+        )
+        if next_round_id is None:
+            winners = self.catalog.get_jackpot_winners(round_id)
+            if winners:
+                self._pay_jackpot_shards(round_id, winners)
+            return None
+        self._pay_jackpot_shards(round_id, payouts)
+        return next_round_id
+    
+    def finish_jackpot_payouts(self) -> int:
+        """Доплатить розыгрыши, закрытые в каталоге, но не выплаченные на шардах"""
+        paid = 0
+        for round_id in self.catalog.get_pending_jackpot_rounds():
+            paid += self._pay_jackpot_shards(round_id, self.catalog.get_jackpot_winners(round_id) or {})
+        if paid:
+            logger.info(f"💰 Доплачено призов джекпота после сбоя: {paid}")
+        return paid
+    
+    # === СПОНСОРЫ (копия на каждом шарде) ===
+    def add_sponsor(self, channel_username: str, channel_id: str, channel_url: str) -> bool:
+        if not self.catalog.add_sponsor(channel_username, channel_id, channel_url):
+            return False
+        sponsor_id = self.catalog.get_sponsors()[-1]['id']
+        return all(
+            shard.add_sponsor(channel_username, channel_id, channel_url, sponsor_id=sponsor_id)
+            for shard in self.shards[1:]
+        )
+    
+    def delete_sponsor(self, sponsor_id: int) -> bool:
+        return all([shard.delete_sponsor(sponsor_id) for shard in self.shards])
+    
+    # === ВЫВОД СРЕДСТВ ===
+    # ID заявки глобальный: локальный_id * число_шардов + номер_шарда
+    def _global_withdrawal(self, withdrawal: Dict, index: int) -> Dict:
+        return {**withdrawal, 'id': withdrawal['id'] * len(self.shards) + index}
+    
+    def create_withdrawal(self, user_id: int, amount: float) -> Optional[Dict]:
+        index = self.shard_index(user_id)
+        withdrawal = self.shards[index].create_withdrawal(user_id, amount, len(self.shards), index)
+        return self._global_withdrawal(withdrawal, index) if withdrawal else None
+    
+    def update_withdrawal_status(self, withdrawal_id: int, status: str) -> bool:
+        local_id, index = divmod(withdrawal_id, len(self.shards))
+        return self.shards[index].update_withdrawal_status(local_id, status)
+    
+    def get_withdrawals(self, status: str = None) -> List[Dict]:
+        withdrawals = [
+            self._global_withdrawal(w, index)
+            for index, shard in enumerate(self.shards)
+            for w in shard.get_withdrawals(status)
+        ]
+        withdrawals.sort(key=lambda w: (w['created_at'], w['id']), reverse=True)
+        return withdrawals
+    
+    def iter_withdrawals(self, status: str = None, cursor: Optional[Tuple[int, int]] = None,
+                         page_size: int = 50) -> Tuple[List[Dict], Optional[Tuple[int, int]]]:
+        count = len(self.shards)
+        merged = []
+        for index, shard in enumerate(self.shards):
+            # Глобальный курсор -> локальный: local_id < ceil((id - index) / count)
+            local_cursor = (cursor[0], (cursor[1] - index + count - 1) // count) if cursor else None
+            page, _ = shard.iter_withdrawals(status, local_cursor, page_size)
+            merged.extend(self._global_withdrawal(w, index) for w in page)
+        
+        merged.sort(key=lambda w: (w['created_at'], w['id']), reverse=True)
+        page = merged[:page_size]
+        next_cursor = (page[-1]['created_at'], page[-1]['id']) if len(page) == page_size else None
+        return page, next_cursor
+    
+    def stream_withdrawals(self, status: str = None, page_size: int = 500) -> Iterator[Dict]:
+        cursor = None
+        while True:
+            page, cursor = self.iter_withdrawals(status, cursor, page_size)
+            yield from page
+            if cursor is None:
+                break
+    
+    # === СТАТИСТИКА И ОБСЛУЖИВАНИЕ (scatter-gather) ===
+    def get_stats(self) -> Dict:
+        stats = defaultdict(float)
+        for shard in self.shards:
+            for key, value in shard.get_stats().items():
+                stats[key] += value
+        stats["total_users"] = int(stats["total_users"])
+        stats["pending_withdrawals"] = int(stats["pending_withdrawals"])
+        return dict(stats)
+    
+    def rebuild_stats(self) -> Dict[str, Dict[str, float]]:
+        drift = {}
+        for index, shard in enumerate(self.shards):
+            for key, values in shard.rebuild_stats().items():
+                drift[f"shard{index}.{key}"] = values
+        return drift
+    
+    def check_query_plans(self) -> Dict[str, List[str]]:
+        return self.catalog.check_query_plans()
+    
+    def flush_transactions(self) -> int:
+        return sum(shard.flush_transactions() for shard in self.shards)
+    
+    def get_ledger_metrics(self) -> Dict:
+        return self._sum_metrics(shard.get_ledger_metrics() for shard in self.shards)
+    
+    def get_user_cache_stats(self) -> Dict:
+        return self._sum_metrics(shard.get_user_cache_stats() for shard in self.shards)
+    
+    def archive_steps(self, older_than_days: int, archive_dir: str = None, batch_size: int = 5000,
+                      compact: str = "incremental", vacuum_pages: int = 1000) -> Iterator[Dict[str, int]]:
+        """Шаги архивации шардов по очереди, итоги суммируются"""
+        moved = defaultdict(int)
+        for shard in self.shards:
+            done = dict(moved)
+            for step in shard.archive_steps(older_than_days, archive_dir, batch_size, compact, vacuum_pages):
+                for month, rows in step.items():
+                    moved[month] = done.get(month, 0) + rows
+                yield dict(moved)
+    
+    def archive_transactions(self, older_than_days: int, archive_dir: str = None, batch_size: int = 5000,
+                             compact: str = "incremental", vacuum_pages: int = 1000) -> Dict[str, int]:
+        moved = {}
+        for moved in self.archive_steps(older_than_days, archive_dir, batch_size, compact, vacuum_pages):
+            pass
+        return moved
+    
+    def close(self):
+        for shard in self.shards:
+            shard.close()
+    
+    @staticmethod
+    def _sum_metrics(items) -> Dict:
+        result = defaultdict(float)
+        for metrics in items:
+            for key, value in metrics.items():
+                result[key] += value
+        return dict(result)
@@ -0,0 +1,263 @@
+"""Монте-Карло симулятор RTP для игр GameEngine.
+
+Векторизованные на NumPy копии play_flip, play_crash, play_slot,
+play_dice и play_jackpot: одна итерация — массив раундов, поэтому
+10^8 раундов считаются за секунды. Нужен numpy (pip install numpy),
+бот от него не зависит.
+
+    python simulator.py                       # все игры, 10^8 раундов
+    python simulator.py crash -n 1e7 --seed 1
+    python simulator.py --parity              # сверка со скалярным движком
+"""
+import argparse
+import math
+import time
+from collections import Counter
+from typing import Callable, Dict, Optional
+
+from config import Config
+from games import GameEngine
+
+Z_95 = 1.959964  # Квантиль нормального распределения для 95% интервала
+SLOT_SYMBOLS = 8  # Число символов на барабане в play_slot (первый — 🍌)
+
+def _numpy():
+    """Импорт numpy с понятной ошибкой"""
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError("Для симулятора нужен numpy: pip install numpy") from None
+    return numpy
+
+# === ВЕКТОРИЗОВАННЫЕ ИГРЫ ===
+# Каждая функция возвращает массив выплат (в STAR) для n раундов со ставкой bet
+# и повторяет ветвления соответствующего GameEngine.play_*.
+
+def _flip(np, rng, n: int, bet: float, config: Dict, **_) -> "np.ndarray":
+    special = rng.random(n) < config['special_event_chance']
+    win = rng.random(n) < config['win_chance']
+    return np.where(~special & win, bet * config['multiplier'], 0.0)
+
+def _crash(np, rng, n: int, bet: float, config: Dict, **_) -> "np.ndarray":
+    instant = rng.random(n) < config['instant_crash_chance']
+    high = rng.random(n) < config['high_multiplier_chance']
+    
+    low_min, low_max = config['low_multiplier_range']
+    high_min = config['min_high_multiplier']
+    u = rng.random(n)  # random.uniform(a, b) = a + (b - a) * random()
+    multiplier = np.round(np.where(high, high_min + (5.0 - high_min) * u, low_min + (low_max - low_min) * u), 2)
+    
+    # Низкий множитель забирается в 80% случаев, если он > 1.0
+    cash_out = high | ((multiplier > 1.0) & (rng.random(n) < 0.8))
+    return np.where(~instant & cash_out, bet * multiplier, 0.0)
+
+def _slot(np, rng, n: int, bet: float, config: Dict, **_) -> "np.ndarray":
+    reels = rng.integers(0, SLOT_SYMBOLS, size=(3, n), dtype=np.int8)
+    first, second, third = reels
+    three = (first == second) & (second == third)
+    two = ~three & ((first == second) | (second == third) | (first == third))
+    
+    payout = np.where(first == 0, config['jackpot_multiplier'], config['win_multiplier'])
+    return bet * np.select([three, two], [payout, 1.5], 0.0)
+
+def _dice(np, rng, n: int, bet: float, config: Dict, number: int = 1, **_) -> "np.ndarray":
+    roll = rng.integers(1, 7, size=n, dtype=np.int8)
+    return np.where(roll == number, bet * config['multiplier'], 0.0)
+
+def _jackpot(np, rng, n: int, bet: float, config: Dict, **_) -> "np.ndarray":
+    # Хотя бы один из tickets билетов выигрывает с вероятностью 1 - (1 - p)^tickets
+    tickets = int(bet / config['ticket_price'])
+    chance = -math.expm1(tickets * math.log1p(-config['win_chance']))
+    win = rng.random(n) < chance
+    return np.where(win, config['ticket_price'] * config['multiplier'], 0.0)
+
+SIMULATORS: Dict[str, Callable] = {
+    'flip': _flip,
+    'crash': _crash,
+    'slot': _slot,
+    'dice': _dice,
+    'jackpot': _jackpot,
+}
+
+# Скалярные версии для сверки: выигрыш из GameEngine
+SCALAR_GAMES: Dict[str, Callable] = {
+    'flip': lambda bet, number, config: GameEngine.play_flip(bet, 'heads', config=config)[1],
+    'crash': lambda bet, number, config: GameEngine.play_crash(bet, config=config)[1],
+    'slot': lambda bet, number, config: GameEngine.play_slot(bet, config=config)[1],
+    'dice': lambda bet, number, config: GameEngine.play_dice(bet, number, config=config)[1],
+    'jackpot': lambda bet, number, config: GameEngine.play_jackpot(bet, config=config)[1],
+}
+
+def _engine(game: str, config: Dict) -> str:
+    """Движок игры из Config.GAMES (ключ 'engine', по умолчанию — имя игры)"""
+    return config.get('engine', game)
+
+# === СТАТИСТИКА ===
+def _summary(game: str, bet: float, rounds: int, total: float, total_sq: float, hits: int,
+             max_payout: float, elapsed: float) -> Dict:
+    """RTP, дисперсия, частота выигрышей и 95% доверительный интервал"""
+    rtp = total / rounds / bet
+    variance = max(total_sq / rounds / bet ** 2 - rtp ** 2, 0.0)  # Дисперсия выплаты на 1 STAR ставки
+    half_width = Z_95 * math.sqrt(variance / rounds)
+    return {
+        "game": game,
+        "bet": bet,
+        "rounds": rounds,
+        "rtp": rtp,
+        "house_edge": 1.0 - rtp,
+        "variance": variance,
+        "std": math.sqrt(variance),
+        "hit_frequency": hits / rounds,
+        "ci_low": rtp - half_width,
+        "ci_high": rtp + half_width,
+        "max_multiplier": max_payout / bet,
+        "seconds": elapsed
+    }
+
+def simulate(game: str, rounds: int = 10 ** 8, bet: float = 1.0, seed: Optional[int] = None,
+             config: Dict = None, chunk_size: int = 10 ** 7, number: int = 1) -> Dict:
+    """Смоделировать rounds раундов игры.
+    
+    config — параметры игры (по умолчанию Config.GAMES[game]), так можно
+    проверить новые настройки до выката. Раунды считаются порциями по
+    chunk_size, чтобы память не росла с числом раундов.
+    """
+    np = _numpy()
+    rng = np.random.default_rng(seed)
+    config = config or Config.GAMES[game]
+    play = SIMULATORS[_engine(game, config)]
+    
+    started = time.perf_counter()
+    total = total_sq = max_payout = 0.0
+    hits = 0
+    done = 0
+    while done < rounds:
+        n = min(chunk_size, rounds - done)
+        payout = play(np, rng, n, bet, config, number=number)
+        total += float(payout.sum())
+        total_sq += float(np.dot(payout, payout))
+        hits += int(np.count_nonzero(payout))
+        max_payout = max(max_payout, float(payout.max()))
+        done += n
+    
+    return _summary(game, bet, rounds, total, total_sq, hits, max_payout, time.perf_counter() - started)
+
+def simulate_scalar(game: str, rounds: int, bet: float = 1.0, number: int = 1) -> Dict:
+    """То же самое через GameEngine в цикле (медленно, для сверки)"""
+    config = Config.GAMES[game]
+    play = SCALAR_GAMES[_engine(game, config)]
+    started = time.perf_counter()
+    total = total_sq = max_payout = 0.0
+    hits = 0
+    for _ in range(rounds):
+        payout = play(bet, number, config)
+        total += payout
+        total_sq += payout * payout
+        hits += payout > 0
+        max_payout = max(max_payout, payout)
+    return _summary(game, bet, rounds, total, total_sq, hits, max_payout, time.perf_counter() - started)
+
+def histogram_check(game: str, rounds: int = 200_000, bet: float = 1.0, seed: Optional[int] = None,
+                    number: int = 1, min_count: int = 20) -> Dict:
+    """Хи-квадрат однородности гистограмм выплат векторного и скалярного движков.
+    
+    Выплаты округляются до копеек, соседние редкие значения объединяются,
+    пока в корзине не наберется min_count раундов. Возвращает статистику,
+    число степеней свободы и z (аппроксимация Уилсона–Хилферти).
+    """
+    np = _numpy()
+    rng = np.random.default_rng(seed)
+    config = Config.GAMES[game]
+    engine = _engine(game, config)
+    payout = SIMULATORS[engine](np, rng, rounds, bet, config, number=number)
+    values, counts = np.unique(np.round(payout, 2), return_counts=True)
+    vector = dict(zip(values.tolist(), counts.tolist()))
+    
+    play = SCALAR_GAMES[engine]
+    scalar = Counter(round(play(bet, number, config), 2) for _ in range(rounds))
+    
+    bins = []  # [(векторных, скалярных)]
+    a = b = 0
+    for value in sorted(set(vector) | set(scalar)):
+        a += vector.get(value, 0)
+        b += scalar.get(value, 0)
+        if a + b >= min_count:
+            bins.append((a, b))
+            a = b = 0
+    if a + b and bins:
+        last_a, last_b = bins.pop()
+        bins.append((last_a + a, last_b + b))
+    
+    # Выборки одного размера: ожидаемое в каждой — половина суммы
+    chi2 = sum((x - y) ** 2 / (x + y) for x, y in bins)
+    df = max(len(bins) - 1, 1)
+    z = ((chi2 / df) ** (1 / 3) - (1 - 2 / (9 * df))) / math.sqrt(2 / (9 * df))
+    return {"chi2": chi2, "df": df, "z": z}
+
+def parity_check(game: str, rounds: int = 200_000, bet: float = 1.0, seed: Optional[int] = None,
+                 max_z: float = 4.0) -> Dict:
+    """Сверить распределения векторного и скалярного движков.
+    
+    Сравниваются RTP и частота выигрышей (z-статистика разности двух
+    выборок) и гистограммы выплат целиком (хи-квадрат). Расхождение
+    больше max_z сигм означает, что симулятор и GameEngine разошлись.
+    """
+    vector = simulate(game, rounds, bet, seed)
+    scalar = simulate_scalar(game, rounds, bet)
+    histogram = histogram_check(game, rounds, bet, None if seed is None else seed + 1)
+    
+    rtp_se = math.sqrt((vector["variance"] + scalar["variance"]) / rounds)
+    p = (vector["hit_frequency"] + scalar["hit_frequency"]) / 2
+    hit_se = math.sqrt(2 * p * (1 - p) / rounds)
+    
+    z_rtp = (vector["rtp"] - scalar["rtp"]) / rtp_se if rtp_se else 0.0
+    z_hit = (vector["hit_frequency"] - scalar["hit_frequency"]) / hit_se if hit_se else 0.0
+    return {
+        "game": game,
+        "vector_rtp": vector["rtp"],
+        "scalar_rtp": scalar["rtp"],
+        "z_rtp": z_rtp,
+        "vector_hit_frequency": vector["hit_frequency"],
+        "scalar_hit_frequency": scalar["hit_frequency"],
+        "z_hit_frequency": z_hit,
+        "chi2": histogram["chi2"],
+        "chi2_df": histogram["df"],
+        "z_chi2": histogram["z"],
+        "ok": abs(z_rtp) < max_z and abs(z_hit) < max_z and histogram["z"] < max_z
+    }
+
+def format_report(result: Dict) -> str:
+    """Строка отчета по игре"""
+    return (
+        f"{Config.GAMES[result['game']]['name']}: RTP {result['rtp'] * 100:.3f}% "
+        f"[{result['ci_low'] * 100:.3f}; {result['ci_high'] * 100:.3f}], "
+        f"преимущество казино {result['house_edge'] * 100:.3f}%, "
+        f"дисперсия {result['variance']:.4f}, выигрыши {result['hit_frequency'] * 100:.2f}%, "
+        f"max x{result['max_multiplier']:.2f} "
+        f"({result['rounds']:,} раундов за {result['seconds']:.1f} сек)"
+    )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Монте-Карло RTP для игр Monkey Stars")
+    parser.add_argument("games", nargs="*", help=f"Игры из {', '.join(Config.GAMES)} (по умолчанию все)")
+    parser.add_argument("-n", "--rounds", type=float, default=1e8)
+    parser.add_argument("--bet", type=float, default=1.0)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--parity", action="store_true", help="Сверка со скалярным GameEngine")
+    args = parser.parse_args()
+    unknown = set(args.games) - set(Config.GAMES)
+    if unknown:
+        parser.error(f"неизвестные игры: {', '.join(sorted(unknown))}")
+    
+    for game in args.games or Config.GAMES:
+        if args.parity:
+            check = parity_check(game, min(int(args.rounds), 200_000), args.bet, args.seed)
+            status = "✅" if check["ok"] else "❌"
+            print(
+                f"{status} {game}: RTP {check['vector_rtp']:.4f} / {check['scalar_rtp']:.4f} "
+                f"(z={check['z_rtp']:+.2f}), выигрыши {check['vector_hit_frequency']:.4f} / "
+                f"{check['scalar_hit_frequency']:.4f} (z={check['z_hit_frequency']:+.2f}), "
+                f"хи-квадрат {check['chi2']:.1f} на {check['chi2_df']} ст. св. (z={check['z_chi2']:+.2f})"
+            )
+        else:
+            print(format_report(simulate(game, int(args.rounds), args.bet, args.seed)))
@@ -0,0 +1,23 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+from sharding import ShardedDatabase
+
+@pytest.fixture
+def db(tmp_path):
+    """Мигрированная база во временном файле"""
+    database = Database(str(tmp_path / "test.db"))
+    yield database
+    database.close()
+
+@pytest.fixture
+def sharded_db(tmp_path):
+    """Шардированная база на 4 файла"""
+    database = ShardedDatabase(str(tmp_path / "test.db"), shards=4)
+    yield database
+    database.close()
@@ -0,0 +1,50 @@
+import asyncio
+import time
+
+from async_database import AsyncDatabase
+
+OLD = int(time.time()) - 200 * 86400
+
+def _fill(db, rows: int):
+    db.create_user(1, "a")
+    with db.get_connection() as conn:
+        conn.executemany(
+            "INSERT INTO transactions (user_id, amount, type, description, created_at) VALUES (?, ?, ?, ?, ?)",
+            [(1, 1.0, "click", "x" * 200, OLD + i * 1000) for i in range(rows)]
+        )
+
+def test_archive_returns_space_incrementally(db, tmp_path):
+    _fill(db, 5000)
+    conn = db.get_connection()
+    assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+    pages = conn.execute("PRAGMA page_count").fetchone()[0]
+    
+    moved = db.archive_transactions(90, str(tmp_path / "archive"), batch_size=1000, vacuum_pages=50)
+    assert sum(moved.values()) == 5000
+    assert len(moved) >= 2  # Строки за несколько месяцев — несколько архивов
+    assert conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0] == 0
+    assert conn.execute("PRAGMA freelist_count").fetchone()[0] == 0
+    assert conn.execute("PRAGMA page_count").fetchone()[0] < pages / 2
+    assert conn.execute("SELECT archived_count FROM balance_checkpoints WHERE user_id = 1").fetchone()[0] == 5000
+
+def test_archive_steps_interleave_with_queries(db, tmp_path):
+    _fill(db, 5000)
+    
+    async def main():
+        adb = AsyncDatabase(db)
+        served = 0
+        async def reader():
+            nonlocal served
+            while not archive.done():
+                await adb.get_user(1)
+                served += 1
+        archive = asyncio.ensure_future(adb.run_steps(
+            db.archive_steps(90, str(tmp_path / "archive"), batch_size=500, vacuum_pages=20)
+        ))
+        await asyncio.gather(archive, reader())
+        return archive.result(), served
+    
+    moved, served = asyncio.run(main())
+    assert sum(moved.values()) == 5000
+    # Запросы выполнялись между шагами, а не после всей архивации
+    assert served > 5
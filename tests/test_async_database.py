@@ -0,0 +1,87 @@
+import asyncio
+import threading
+import time
+
+from async_database import AsyncDatabase
+from sharding import ShardedDatabase
+
+def test_user_calls_are_pinned_to_shard_threads(tmp_path, monkeypatch):
+    sharded = ShardedDatabase(str(tmp_path / "test.db"), shards=4)
+    threads = {}
+    real_get_user = sharded.shards[0].get_user.__func__
+    def get_user(self, user_id):
+        threads.setdefault(user_id, set()).add(threading.current_thread().name.split("_")[0])
+        return real_get_user(self, user_id)
+    monkeypatch.setattr(type(sharded.shards[0]), "get_user", get_user)
+    
+    async def main():
+        db = AsyncDatabase(sharded, workers=4)
+        await asyncio.gather(*(db.get_user(user_id) for user_id in range(1, 50) for _ in range(3)))
+        await db.close()
+    asyncio.run(main())
+    
+    for user_id, names in threads.items():
+        assert names == {f"db{sharded.shard_index(user_id)}"}
+
+def _measure_lag(bets, play) -> float:
+    """Наибольшее опоздание таймера 5 мс, пока идут bets ставок из 50 задач"""
+    async def main():
+        lag = 0.0
+        done = asyncio.Event()
+        
+        async def monitor():
+            nonlocal lag
+            loop = asyncio.get_running_loop()
+            while not done.is_set():
+                started = loop.time()
+                await asyncio.sleep(0.005)
+                lag = max(lag, loop.time() - started - 0.005)
+        
+        async def player(offset: int):
+            for user_id in range(offset, bets, 50):
+                await play(user_id % 100 + 1)
+        
+        task = asyncio.create_task(monitor())
+        await asyncio.sleep(0)
+        await asyncio.gather(*(player(offset) for offset in range(50)))
+        done.set()
+        await task
+        return lag
+    return asyncio.run(main())
+
+def test_event_loop_keeps_running_under_concurrent_bets(db):
+    for user_id in range(1, 101):
+        db.create_user(user_id, f"u{user_id}")
+        db.update_balance(user_id, 10_000)
+    adb = AsyncDatabase(db, max_pending=100)
+    
+    async def play_sync(user_id):
+        db.settle_bet(user_id, "dice", 1.0, 0.0)
+    
+    async def play_async(user_id):
+        await adb.settle_bet(user_id, "dice", 1.0, 0.0)
+    
+    blocking_lag = _measure_lag(2000, play_sync)
+    async_lag = _measure_lag(2000, play_async)
+    # Синхронные вызовы держат цикл все время ставок, через поток БД — нет
+    assert async_lag < 0.05
+    assert async_lag < blocking_lag / 5
+
+def test_close_waits_for_queries_on_shard_threads(sharded_db, monkeypatch):
+    user_id = next(user_id for user_id in range(1, 100) if sharded_db.shard_index(user_id))
+    sharded_db.create_user(user_id, "slow")
+    
+    def slow_get_user(self, user_id):
+        conn = self.get_connection()
+        time.sleep(0.2)  # Запрос в потоке шарда еще идет, когда вызван close
+        return dict(conn.execute("SELECT * FROM users WHERE user_id = ?", (user_id,)).fetchone())
+    monkeypatch.setattr(type(sharded_db.shards[0]), "get_user", slow_get_user)
+    
+    async def main():
+        db = AsyncDatabase(sharded_db, workers=4)
+        task = asyncio.create_task(db.get_user(user_id))
+        await asyncio.sleep(0.05)
+        await db.close()
+        return await task
+    
+    assert asyncio.run(main())["username"] == "slow"
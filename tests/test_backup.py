@@ -0,0 +1,53 @@
+import os
+import sqlite3
+import time
+
+import pytest
+
+import backup
+from backup import backup_database, restore_backup
+
+OLD = int(time.time()) - 200 * 86400
+
+def _fill(db, rows: int):
+    db.create_user(1, "a")
+    with db.get_connection() as conn:
+        conn.executemany(
+            "INSERT INTO transactions (user_id, amount, type, description, created_at) VALUES (?, ?, ?, ?, ?)",
+            [(1, 1.0, "click", "", OLD + i * 3000) for i in range(rows)]
+        )
+
+def test_backup_includes_ledger_archives(db, tmp_path):
+    _fill(db, 3000)
+    archive_dir = str(tmp_path / "archive")
+    moved = db.archive_transactions(90, archive_dir)
+    backup_dir = str(tmp_path / "backups")
+    
+    paths = backup_database(db, backup_dir, archive_dir=archive_dir)
+    archives = [path for path in paths if "_archive_" in path]
+    assert len(archives) == len(moved)
+    
+    # Неизменившиеся архивы второй раз не копируются
+    assert not [path for path in backup_database(db, backup_dir, archive_dir=archive_dir) if "_archive_" in path]
+    
+    restored = str(tmp_path / "restored.db")
+    assert restore_backup(archives[0], restored)
+    conn = sqlite3.connect(restored)
+    try:
+        rows = conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+    finally:
+        conn.close()
+    month = os.path.basename(archives[0]).split("_archive_")[1].split(".")[0]
+    assert rows == moved[month]
+
+def test_failed_copy_leaves_no_tmp_files(db, tmp_path, monkeypatch):
+    def broken_backup_file(db_path, dest_path, pages, pause):
+        with open(dest_path, "wb") as f:
+            f.write(b"partial")
+        raise OSError("No space left on device")
+    monkeypatch.setattr(backup, "backup_file", broken_backup_file)
+    backup_dir = tmp_path / "backups"
+    
+    with pytest.raises(OSError):
+        backup_database(db, str(backup_dir))
+    assert os.listdir(backup_dir) == []
@@ -0,0 +1,83 @@
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+USERS = range(1, 9)
+START_BALANCE = 20.0
+
+def _seed(db):
+    for user_id in USERS:
+        # Нечетные — рефералы четных: клик начисляет бонус рефереру
+        db.create_user(user_id, f"u{user_id}", user_id + 1 if user_id % 2 else None)
+    for user_id in USERS:
+        db.credit_balance(user_id, START_BALANCE, "admin", "Начальный баланс")
+
+def _hammer(db, seed: int, ops: int = 300):
+    rng = random.Random(seed)
+    for _ in range(ops):
+        user_id = rng.choice(USERS)
+        action = rng.randrange(4)
+        if action == 0:
+            amount = rng.choice((1.0, 5.0, 15.0))
+            if db.update_balance(user_id, -amount):
+                db.add_transaction(user_id, -amount, "debit", "Списание")
+        elif action == 1:
+            db.claim_click(user_id, 0.5, 0, 0.05, "Бонус клика")
+        elif action == 2:
+            db.create_withdrawal(user_id, rng.choice((5.0, 10.0)))
+        else:
+            db.settle_bet(user_id, "dice", 2.0, rng.choice((0.0, 4.0)))
+
+@pytest.fixture(params=["single", "sharded"])
+def any_db(request):
+    return request.getfixturevalue("db" if request.param == "single" else "sharded_db")
+
+def test_concurrent_debits_keep_ledger_and_balances(any_db):
+    _seed(any_db)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda seed: _hammer(any_db, seed), range(8)))
+    
+    for user_id in USERS:
+        balance = any_db.get_user(user_id)['balance']
+        ledger = sum(tx['amount'] for tx in any_db.get_user_transactions(user_id, 100_000))
+        assert balance >= 0
+        assert balance == pytest.approx(ledger, abs=1e-6)
+
+def test_settle_bet_writes_one_net_row(any_db):
+    any_db.create_user(1, "u1")
+    any_db.credit_balance(1, START_BALANCE, "admin", "Начальный баланс")
+    
+    assert any_db.settle_bet(1, "dice", 5.0, 30.0) == pytest.approx(45.0)
+    assert any_db.settle_bet(1, "dice", 5.0, 0.0) == pytest.approx(40.0)
+    user = any_db.get_user(1)
+    assert (user['total_wagered'], user['games_played'], user['games_won']) == (10.0, 2, 1)
+    bets = [(tx['amount'], tx['type']) for tx in any_db.get_user_transactions(1, 10) if tx['type'] != "admin"]
+    assert bets == [(-5.0, "game_lose"), (25.0, "game_win")]
+
+def test_settle_bet_debit_is_conditional(any_db):
+    any_db.create_user(1, "u1")
+    any_db.credit_balance(1, 25.0, "admin", "Начальный баланс")
+    
+    # Не хватает баланса: ни списания, ни строки журнала, ни статистики
+    assert any_db.settle_bet(1, "dice", 25.01, 100.0) is None
+    assert any_db.get_user(1)['games_played'] == 0
+    
+    # Гонка: хватает только на две ставки по 10 — проходят ровно две
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda _: any_db.settle_bet(1, "dice", 10.0, 0.0), range(16)))
+    assert sorted(result for result in results if result is not None) == [5.0, 15.0]
+    assert any_db.get_user(1)['balance'] == pytest.approx(5.0)
+    assert len(any_db.get_user_transactions(1, 100)) == 3  # Пополнение и две ставки
+
+def test_settle_batch_uses_required_balance(any_db):
+    any_db.create_user(1, "u1")
+    any_db.credit_balance(1, 10.0, "admin", "Начальный баланс")
+    
+    # Серия ушла бы в минус при балансе 10 — отказ без изменений
+    assert any_db.settle_batch(1, "crash", 30.0, 25.0, 15, 4, 12.0) is None
+    assert any_db.settle_batch(1, "crash", 30.0, 25.0, 15, 4, 10.0) == pytest.approx(5.0)
+    user = any_db.get_user(1)
+    assert (user['total_wagered'], user['games_played'], user['games_won']) == (30.0, 15, 4)
+    rows = [(tx['amount'], tx['type']) for tx in any_db.get_user_transactions(1, 10)]
+    assert rows == [(-5.0, "game_lose"), (10.0, "admin")]
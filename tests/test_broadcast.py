@@ -0,0 +1,88 @@
+import asyncio
+import time
+
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+from async_database import AsyncDatabase
+from broadcast import Broadcaster
+
+class FakeBot:
+    """Записывает вызовы send_message и отвечает ошибками Telegram по сценарию"""
+    
+    def __init__(self, flood=None, blocked=(), hang_at=None, on_hang=None):
+        self.flood = dict(flood or {})  # chat_id -> retry_after (один раз)
+        self.blocked = set(blocked)
+        self.hang_at = hang_at
+        self.on_hang = on_hang
+        self.calls = []  # (chat_id, время, исход)
+        self.delivered = []
+    
+    async def send_message(self, chat_id: int, text: str):
+        method = SendMessage(chat_id=chat_id, text=text)
+        now = time.monotonic()
+        if chat_id in self.flood:
+            self.calls.append((chat_id, now, "flood"))
+            raise TelegramRetryAfter(method, "Flood control exceeded", self.flood.pop(chat_id))
+        if chat_id in self.blocked:
+            self.calls.append((chat_id, now, "blocked"))
+            raise TelegramForbiddenError(method, "bot was blocked by the user")
+        if chat_id == self.hang_at:
+            # Сообщение в полете в момент остановки бота
+            self.on_hang()
+            await asyncio.sleep(3600)
+        self.calls.append((chat_id, now, "sent"))
+        self.delivered.append(chat_id)
+
+def _broadcaster(bot, db, **kwargs) -> Broadcaster:
+    broadcaster = Broadcaster(bot, db, rate=1000, **kwargs)
+    broadcaster.PER_CHAT_INTERVAL = 0
+    return broadcaster
+
+async def _finish(broadcaster: Broadcaster):
+    await asyncio.gather(*list(broadcaster._tasks.values()), return_exceptions=True)
+
+def _users(db, count: int) -> AsyncDatabase:
+    for user_id in range(1, count + 1):
+        db.create_user(user_id, f"user{user_id}")
+    return AsyncDatabase(db)
+
+def test_flood_pauses_everything_and_blocked_are_counted(db):
+    async def main():
+        adb = _users(db, 6)
+        bot = FakeBot(flood={3: 1}, blocked={5})
+        broadcaster = _broadcaster(bot, adb, concurrency=3)
+        broadcast_id = await broadcaster.start("hello")
+        await _finish(broadcaster)
+        return bot, await adb.get_broadcast(broadcast_id)
+    
+    bot, broadcast = asyncio.run(main())
+    flood_index = next(i for i, call in enumerate(bot.calls) if call[2] == "flood")
+    flood_at = bot.calls[flood_index][1]
+    # После 429 никто не получает сообщений раньше retry_after, чат 3 — повторно
+    assert all(at >= flood_at + 0.95 for _, at, _ in bot.calls[flood_index + 1:])
+    assert [chat_id for chat_id, _, _ in bot.calls].count(3) == 2
+    assert sorted(bot.delivered) == [1, 2, 3, 4, 6]
+    assert (broadcast['status'], broadcast['sent'], broadcast['blocked'], broadcast['failed']) == ("done", 5, 1, 0)
+
+def test_stopped_broadcast_resumes_without_duplicates(db):
+    async def main():
+        adb = _users(db, 25)
+        first = FakeBot(hang_at=14)
+        broadcaster = _broadcaster(first, adb, chunk_size=10, concurrency=1)
+        first.on_hang = lambda: asyncio.get_running_loop().create_task(broadcaster.shutdown())
+        broadcast_id = await broadcaster.start("hello")
+        await _finish(broadcaster)
+        stopped = await adb.get_broadcast(broadcast_id)
+        
+        second = FakeBot()
+        resumed = _broadcaster(second, adb, chunk_size=10, concurrency=1)
+        assert await resumed.resume_all() == 1
+        await _finish(resumed)
+        return first, second, stopped, await adb.get_broadcast(broadcast_id)
+    
+    first, second, stopped, broadcast = asyncio.run(main())
+    assert first.delivered == list(range(1, 14))
+    assert (stopped['status'], stopped['last_user_id'], stopped['sent']) == ("running", 13, 13)
+    assert second.delivered == list(range(14, 26))
+    assert (broadcast['status'], broadcast['sent']) == ("done", 25)
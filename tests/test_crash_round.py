@@ -0,0 +1,91 @@
+import asyncio
+import random
+import time
+
+import pytest
+
+from async_database import AsyncDatabase
+from crash_round import CrashRoundScheduler
+from fair_rng import hash_seed
+
+class FakeBot:
+    async def edit_message_text(self, *args, **kwargs):
+        pass
+
+def test_crash_point_is_reproducible_and_fair():
+    scheduler = CrashRoundScheduler(None, None, house_edge=0.04)
+    rng = random.Random(7)
+    points = []
+    for round_id in range(20000):
+        seed = "%064x" % rng.getrandbits(256)
+        point = scheduler.round_crash_point(seed, round_id)
+        assert point == scheduler.round_crash_point(seed, round_id)
+        points.append(point)
+    # P(краш >= m) = (1 - house_edge) / m
+    for multiplier in (2.0, 5.0):
+        share = sum(point >= multiplier for point in points) / len(points)
+        assert share == pytest.approx(0.96 / multiplier, abs=0.015)
+
+def test_round_uses_committed_seed(db):
+    for user_id in (1, 2):
+        db.create_user(user_id, f"u{user_id}")
+        db.update_balance(user_id, 10)
+    
+    async def main():
+        scheduler = CrashRoundScheduler(FakeBot(), AsyncDatabase(db), betting_time=0.2,
+                                        growth=5.0, tick=0.05, pause=10)
+        await scheduler.start()
+        while not scheduler.accepting_bets:
+            await asyncio.sleep(0.01)
+        round_ = scheduler.round
+        await scheduler.join(1, 1.0, 1, 1)
+        while round_.phase != "crashed":
+            await asyncio.sleep(0.01)
+        await scheduler.shutdown()
+        return scheduler, round_
+    
+    scheduler, round_ = asyncio.run(main())
+    assert round_.server_hash == hash_seed(round_.server_seed)
+    assert round_.crash_point == scheduler.round_crash_point(round_.server_seed, round_.id)
+
+def test_failed_settlement_is_retried_before_results(db, monkeypatch):
+    for user_id in (1, 2):
+        db.create_user(user_id, f"u{user_id}")
+        db.update_balance(user_id, 10)
+    events = []
+    real_settle = db.settle_round
+    def flaky_settle(round_id, cashouts):
+        events.append("settle")
+        return 0 if events.count("settle") < 3 else real_settle(round_id, cashouts)
+    monkeypatch.setattr(db, "settle_round", flaky_settle)
+    
+    class RecordingBot:
+        async def edit_message_text(self, text, **kwargs):
+            if "Краш на" in text:
+                events.append("result")
+    
+    async def main():
+        scheduler = CrashRoundScheduler(RecordingBot(), AsyncDatabase(db), betting_time=0.1,
+                                        growth=5.0, tick=0.02, pause=10)
+        scheduler.SETTLE_RETRY_DELAY = 0.01
+        scheduler.round_crash_point = lambda server_seed, round_id: 3.0
+        await scheduler.start()
+        while not scheduler.accepting_bets:
+            await asyncio.sleep(0.01)
+        round_ = scheduler.round
+        await scheduler.join(1, 2.0, 1, 1)
+        await scheduler.join(2, 2.0, 2, 2)
+        while round_.started_at is None or scheduler.multiplier_at(round_, time.monotonic()) < 1.5:
+            await asyncio.sleep(0.01)
+        assert scheduler.cash_out(1)
+        while events.count("result") < 2:
+            await asyncio.sleep(0.01)
+        await scheduler.shutdown()
+        return round_
+    
+    round_ = asyncio.run(main())
+    # Итоги — только после третьей, успешной попытки
+    assert events == ["settle"] * 3 + ["result"] * 2
+    assert db.get_user(1)['balance'] == pytest.approx(8 + 2 * round_.cashouts[1])
+    assert db.get_user(2)['balance'] == pytest.approx(8)
+    assert db.refund_open_bets() == 0
@@ -0,0 +1,53 @@
+import asyncio
+
+import pytest
+
+from async_database import AsyncDatabase
+from fair_rng import FairRandom, ProvablyFair, SeedChainPool, verify
+from game_registry import GAMES
+from games import GameEngine
+
+SERVER_SEED, CLIENT_SEED = "a" * 64, "client"
+
+@pytest.mark.parametrize("key", sorted(GAMES))
+def test_verify_replays_registry_game(key):
+    game = GAMES[key]
+    choice = next(iter(game.choices), None)
+    for nonce in range(50):
+        expected = game.play(5.0, FairRandom(SERVER_SEED, CLIENT_SEED, nonce), choice)
+        result = verify(key, SERVER_SEED, CLIENT_SEED, nonce, 5.0, choice=choice)
+        assert (result["win"], result["amount"], result["result"]) == expected
+
+def test_verify_rejects_unknown_choice():
+    with pytest.raises(ValueError):
+        verify("dice", SERVER_SEED, CLIENT_SEED, 0, 1.0, choice="7")
+
+def test_autoplay_rounds_have_own_nonces(db):
+    db.create_user(1, "a")
+    
+    async def main():
+        pool = SeedChainPool(chain_length=10)
+        fair = ProvablyFair(AsyncDatabase(db), pool, nonce_block=8)
+        try:
+            first = await fair.rng(1)
+            batch = await fair.rngs(1, 20)
+            after = await fair.rng(1)
+        finally:
+            pool.close()
+        return first, batch, after
+    
+    first, batch, after = asyncio.run(main())
+    nonces = [rng.nonce for rng in batch]
+    assert nonces == list(range(nonces[0], nonces[0] + 20))
+    assert first.nonce < nonces[0] and after.nonce > nonces[-1]
+    assert db.get_fair_seed(1)['nonce'] >= after.nonce + 1  # Граница в базе не отстает
+    
+    # Каждый раунд серии проверяется отдельно по своему nonce
+    game = GAMES["crash"]
+    result = GameEngine.play_batch(game.engine, 1.0, 20, 1000.0, rngs=batch, config=game.config)
+    seed = batch[0]
+    payout = sum(
+        verify("crash", seed.server_seed, seed.client_seed, rng.nonce, 1.0)["amount"]
+        for rng in batch[:result["rounds"]]
+    )
+    assert payout == pytest.approx(result["payout"])
@@ -0,0 +1,43 @@
+import asyncio
+
+from aiogram.fsm.storage.base import StorageKey
+
+from async_database import AsyncDatabase
+from database import Database
+from fsm_storage import SQLiteStorage
+
+def _key(user_id: int) -> StorageKey:
+    return StorageKey(bot_id=1, chat_id=user_id, user_id=user_id)
+
+def test_close_flushes_dirty_states(tmp_path):
+    path = str(tmp_path / "fsm.db")
+    
+    async def write():
+        db = AsyncDatabase(Database(path))
+        # Фоновая запись не успеет сработать: все изменения остаются в _dirty
+        storage = SQLiteStorage(db, flush_interval=3600)
+        await storage.set_state(_key(1), "BetStates:amount")
+        await storage.set_data(_key(1), {"game": "dice", "bet": 10.5})
+        await storage.set_state(_key(2), "AdminStates:broadcast")
+        await storage.set_state(_key(2), None)  # В пачку попадает последнее значение
+        assert len(storage._dirty) == 2
+        assert storage.stats["flushes"] == 0
+        
+        await storage.close()
+        assert not storage._dirty
+        await db.close()
+        return storage.stats
+    
+    async def read():
+        db = AsyncDatabase(Database(path))
+        storage = SQLiteStorage(db)
+        try:
+            return [(await storage.get_state(_key(i)), await storage.get_data(_key(i))) for i in (1, 2)]
+        finally:
+            await storage.close()
+            await db.close()
+    
+    stats = asyncio.run(write())
+    assert stats["flushes"] == 1
+    assert stats["flushed_rows"] == 2
+    assert asyncio.run(read()) == [("BetStates:amount", {"game": "dice", "bet": 10.5}), (None, {})]
@@ -0,0 +1,60 @@
+import random
+
+import pytest
+
+from config import Config
+from game_registry import GAMES
+from games import GameEngine
+
+def test_sampler_cache_follows_name_and_weights():
+    crash = dict(Config.GAMES['crash'])
+    sampler = GameEngine._sampler(crash, GameEngine._build_crash, GameEngine.CRASH_PARAMS)
+    
+    # Та же игра и те же веса в новом объекте настроек — та же таблица
+    assert GameEngine._sampler(dict(crash), GameEngine._build_crash, GameEngine.CRASH_PARAMS) is sampler
+    
+    # Другая игра на том же движке и измененные веса — своя таблица
+    other = {**crash, 'name': "🚀 Crash Pro"}
+    assert GameEngine._sampler(other, GameEngine._build_crash, GameEngine.CRASH_PARAMS) is not sampler
+    changed = {**crash, 'instant_crash_chance': 0.1}
+    rebuilt = GameEngine._sampler(changed, GameEngine._build_crash, GameEngine.CRASH_PARAMS)
+    assert rebuilt is not sampler
+    assert rebuilt.probabilities[0] == pytest.approx(0.1)
+
+def test_menus_do_not_show_rtp():
+    for game in GAMES.values():
+        assert "RTP" not in game.menu("10")
+
+def _rngs(count: int):
+    return [random.Random(index) for index in range(count)]
+
+def test_batch_required_balance_is_exact():
+    result = GameEngine.play_batch('crash', 2.0, 200, 1_000.0, rngs=_rngs(200), config=Config.GAMES['crash'])
+    assert result['stop_reason'] == "rounds"
+    assert result['wagered'] == 400.0
+    assert result['net'] == pytest.approx(result['payout'] - result['wagered'])
+    
+    # С ровно required_balance серия та же, на копейку меньше — обрывается раньше
+    required = result['required_balance']
+    same = GameEngine.play_batch('crash', 2.0, 200, required, rngs=_rngs(200), config=Config.GAMES['crash'])
+    assert same == result
+    short = GameEngine.play_batch('crash', 2.0, 200, required - 0.01, rngs=_rngs(200), config=Config.GAMES['crash'])
+    assert short['stop_reason'] == "balance"
+    assert short['rounds'] < result['rounds']
+
+def test_batch_stops_on_balance_loss_and_win():
+    always_lose = {**Config.GAMES['crash'], 'instant_crash_chance': 1.0}
+    result = GameEngine.play_batch('crash', 5.0, 10, 12.0, config=always_lose)
+    assert (result['rounds'], result['stop_reason'], result['required_balance']) == (2, "balance", 10.0)
+    
+    result = GameEngine.play_batch('crash', 5.0, 10, 100.0, stop_loss=12.0, config=always_lose)
+    assert (result['rounds'], result['net'], result['stop_reason']) == (3, -15.0, "stop_loss")
+    
+    always_win = {**Config.GAMES['crash'], 'instant_crash_chance': 0.0, 'high_multiplier_chance': 1.0}
+    result = GameEngine.play_batch('crash', 1.0, 100, 1.0, stop_win=2.0, rng=random.Random(1), config=always_win)
+    assert result['stop_reason'] == "stop_win"
+    assert result['net'] >= 2.0 and result['wins'] == result['rounds']
+    # Раундом раньше цель еще не достигнута
+    before = GameEngine.play_batch('crash', 1.0, result['rounds'] - 1, 1.0, stop_win=2.0,
+                                   rng=random.Random(1), config=always_win)
+    assert before['stop_reason'] == "rounds" and before['net'] < 2.0
@@ -0,0 +1,74 @@
+from database import Database
+from sharding import ShardedDatabase
+
+def _jackpot_wins(db, user_id):
+    return [tx for tx in db.get_user_transactions(user_id, 100) if tx['type'] == 'jackpot_win']
+
+def _settle(db, payouts):
+    round_id = db.get_open_jackpot_round()['id']
+    return round_id, db.settle_jackpot(round_id, payouts, tickets=10, pool=100.0, carryover=0.0)
+
+def test_settle_twice_pays_once(db):
+    db.create_user(1, "a")
+    round_id, next_round_id = _settle(db, {1: 50.0})
+    assert next_round_id is not None
+    
+    # Повтор с другими победителями ничего не выплачивает
+    db.create_user(2, "b")
+    assert db.settle_jackpot(round_id, {2: 50.0}, 10, 100.0, 0.0) is None
+    assert db.get_user(1)['balance'] == 50.0
+    assert db.get_user(2)['balance'] == 0.0
+    assert len(_jackpot_wins(db, 1)) == 1
+    assert db.get_jackpot_winners(round_id) == {1: 50.0}
+    assert db.get_pending_jackpot_rounds() == []
+
+def _users_on_every_shard(db: ShardedDatabase):
+    users = {}
+    user_id = 1
+    while len(users) < len(db.shards):
+        users.setdefault(db.shard_index(user_id), user_id)
+        user_id += 1
+    for user_id in users.values():
+        db.create_user(user_id, f"u{user_id}")
+    return {user_id: 10.0 * (index + 1) for index, user_id in users.items()}
+
+def test_sharded_retry_pays_once(sharded_db, monkeypatch):
+    payouts = _users_on_every_shard(sharded_db)
+    round_id = sharded_db.get_open_jackpot_round()['id']
+    
+    # Сбой после закрытия розыгрыша в каталоге: шарды не выплачены
+    calls = []
+    real_pay = Database.pay_jackpot
+    def failing_pay(self, *args):
+        calls.append(self)
+        if len(calls) == 2:
+            raise RuntimeError("shard down")
+        return real_pay(self, *args)
+    monkeypatch.setattr(Database, "pay_jackpot", failing_pay)
+    try:
+        sharded_db.settle_jackpot(round_id, payouts, 10, 100.0, 0.0)
+    except RuntimeError:
+        pass
+    monkeypatch.setattr(Database, "pay_jackpot", real_pay)
+    assert sharded_db.catalog.get_pending_jackpot_rounds() == [round_id]
+    
+    # Повтор розыгрыша с новыми победителями доплачивает сохраненных
+    assert sharded_db.settle_jackpot(round_id, {next(iter(payouts)): 100.0}, 10, 100.0, 0.0) is None
+    assert sharded_db.finish_jackpot_payouts() == 0
+    for user_id, payout in payouts.items():
+        assert sharded_db.get_user(user_id)['balance'] == payout
+        assert len(_jackpot_wins(sharded_db, user_id)) == 1
+    assert sharded_db.catalog.get_pending_jackpot_rounds() == []
+
+def test_sharded_finish_after_crash(sharded_db, monkeypatch):
+    payouts = _users_on_every_shard(sharded_db)
+    round_id = sharded_db.get_open_jackpot_round()['id']
+    monkeypatch.setattr(ShardedDatabase, "_pay_jackpot_shards", lambda self, *args: 0)
+    assert sharded_db.settle_jackpot(round_id, payouts, 10, 100.0, 0.0) is not None
+    monkeypatch.undo()
+    
+    # Перезапуск: розыгрыш закрыт, выплаты на шардах 1..n дозавершаются
+    assert sharded_db.finish_jackpot_payouts() == len(payouts) - 1
+    assert sharded_db.finish_jackpot_payouts() == 0
+    for user_id, payout in payouts.items():
+        assert sharded_db.get_user(user_id)['balance'] == payout
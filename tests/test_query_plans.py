@@ -0,0 +1,21 @@
+import migrations
+
+HOT_TABLES = ("users", "transactions", "withdrawals", "user_sponsors", "fsm_states")
+
+def test_no_full_scans(db):
+    assert db.check_query_plans() == {}
+
+def test_hot_tables_are_never_scanned(db):
+    conn = db.get_connection()
+    for name, (sql, params) in migrations.HOT_QUERIES.items():
+        for step in migrations.explain(conn, sql, params):
+            assert not step.startswith("SCAN"), f"{name}: {step}"
+            assert "TEMP B-TREE" not in step, f"{name}: {step}"
+    # Каждая горячая таблица покрыта хотя бы одним запросом
+    assert all(any(table in sql for sql, _ in migrations.HOT_QUERIES.values()) for table in HOT_TABLES)
+
+def test_plans_after_analyze(db):
+    for user_id in range(1, 200):
+        db.create_user(user_id, f"u{user_id}", 1 if user_id > 1 else None)
+    db.get_connection().execute("ANALYZE")
+    assert db.check_query_plans() == {}
@@ -0,0 +1,102 @@
+import math
+import random
+from collections import Counter
+
+import pytest
+
+from config import Config
+from games import GameEngine
+from sampling import AliasSampler
+
+ROUNDS = 100_000
+MAX_Z = 4.0
+
+def _z_two_samples(a: Counter, b: Counter, min_count: int = 20) -> float:
+    """z хи-квадрата однородности двух выборок одного размера (как в simulator.histogram_check)"""
+    bins = []
+    x = y = 0
+    for value in sorted(set(a) | set(b)):
+        x += a.get(value, 0)
+        y += b.get(value, 0)
+        if x + y >= min_count:
+            bins.append((x, y))
+            x = y = 0
+    if x + y and bins:
+        last_x, last_y = bins.pop()
+        bins.append((last_x + x, last_y + y))
+    chi2 = sum((x - y) ** 2 / (x + y) for x, y in bins)
+    df = max(len(bins) - 1, 1)
+    return ((chi2 / df) ** (1 / 3) - (1 - 2 / (9 * df))) / math.sqrt(2 / (9 * df))
+
+# Прежние реализации: одно случайное число на барабан, билет или проверку
+def _crash_per_unit(bet: float, rng: random.Random, config: dict) -> float:
+    if rng.random() < config['instant_crash_chance']:
+        return 0.0
+    if rng.random() < config['high_multiplier_chance']:
+        return bet * round(rng.uniform(config['min_high_multiplier'], 5.0), 2)
+    multiplier = round(rng.uniform(*config['low_multiplier_range']), 2)
+    if multiplier > 1.0 and rng.random() < 0.8:
+        return bet * multiplier
+    return 0.0
+
+def _slot_per_reel(bet: float, rng: random.Random, config: dict) -> float:
+    reels = [rng.choice(GameEngine.SLOT_SYMBOLS) for _ in range(3)]
+    if reels[0] == reels[1] == reels[2]:
+        if reels[0] == GameEngine.SLOT_SYMBOLS[0]:
+            return bet * config['jackpot_multiplier']
+        return bet * config['win_multiplier']
+    if reels[0] == reels[1] or reels[1] == reels[2] or reels[0] == reels[2]:
+        return bet * 1.5
+    return 0.0
+
+def _jackpot_per_ticket(bet: float, rng: random.Random, config: dict) -> float:
+    tickets = int(bet / config['ticket_price'])
+    if any(rng.random() < config['win_chance'] for _ in range(tickets)):
+        return config['ticket_price'] * config['multiplier']
+    return 0.0
+
+def test_alias_sampler_follows_weights():
+    weights = [5, 1, 0, 3, 0.5]
+    sampler = AliasSampler(weights, "abcde")
+    rng = random.Random(7)
+    counts = Counter(sampler.sample(rng) for _ in range(ROUNDS))
+    
+    assert counts["c"] == 0
+    for outcome, weight in zip("abcde", weights):
+        p = weight / sum(weights)
+        if p:
+            assert abs(counts[outcome] - ROUNDS * p) < MAX_Z * math.sqrt(ROUNDS * p * (1 - p))
+
+def test_alias_sampler_rejects_bad_weights():
+    with pytest.raises(ValueError):
+        AliasSampler([0, 0])
+    with pytest.raises(ValueError):
+        AliasSampler([1, -1])
+
+ENGINE = {
+    'crash': lambda bet, rng, config: GameEngine.play_crash(bet, rng, config)[1],
+    'slot': lambda bet, rng, config: GameEngine.play_slot(bet, rng, config)[1],
+}
+
+@pytest.mark.parametrize("game, reference", [("crash", _crash_per_unit), ("slot", _slot_per_reel)])
+def test_alias_games_keep_distribution(game, reference):
+    config = Config.GAMES[game]
+    rng = random.Random(11)
+    engine = Counter(round(ENGINE[game](1.0, rng, config), 2) for _ in range(ROUNDS))
+    before = Counter(round(reference(1.0, rng, config), 2) for _ in range(ROUNDS))
+    assert _z_two_samples(engine, before) < MAX_Z
+
+@pytest.mark.parametrize("bet", [1.0, 10.0, 250.0])
+def test_jackpot_closed_form_keeps_win_rate(bet):
+    config = Config.GAMES['jackpot']
+    rng = random.Random(13)
+    rounds = ROUNDS // 10 if bet > 100 else ROUNDS
+    engine = sum(GameEngine.play_jackpot(bet, rng, config)[0] for _ in range(rounds))
+    before = sum(_jackpot_per_ticket(bet, rng, config) > 0 for _ in range(rounds))
+    
+    p = (engine + before) / (2 * rounds)
+    se = math.sqrt(2 * p * (1 - p) / rounds)
+    assert abs(engine - before) / rounds < MAX_Z * se
+    # И с точной формулой 1 - (1 - p)^билетов
+    exact = 1 - (1 - config['win_chance']) ** int(bet / config['ticket_price'])
+    assert abs(engine / rounds - exact) < MAX_Z * math.sqrt(exact * (1 - exact) / rounds)
@@ -0,0 +1,15 @@
+import random
+
+import pytest
+
+import simulator
+from config import Config
+
+pytest.importorskip("numpy")
+
+@pytest.mark.parametrize("game", list(Config.GAMES))
+def test_vector_simulator_matches_game_engine(game):
+    # GameEngine берет числа из модуля random — фиксируем оба генератора
+    random.seed(1)
+    result = simulator.parity_check(game, rounds=50_000, seed=1)
+    assert result["ok"], result
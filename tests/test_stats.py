@@ -0,0 +1,35 @@
+import pytest
+
+@pytest.mark.parametrize("database", ["db", "sharded_db"])
+def test_trigger_stats_match_rebuild(database, request, tmp_path):
+    db = request.getfixturevalue(database)
+    for user_id in range(1, 21):
+        db.create_user(user_id, f"u{user_id}", 1 if user_id > 1 else None)
+        db.update_balance(user_id, 100)
+    
+    for user_id in range(1, 21):
+        db.settle_bet(user_id, "dice", 5.0, 30.0 if user_id % 3 == 0 else 0.0)
+        db.settle_batch(user_id, "crash", 10.0, 7.5, 10, 3, 4.0)
+    assert db.settle_bet(1, "dice", 10_000.0, 0.0) is None  # Не хватает баланса — без изменений
+    
+    withdrawals = [db.create_withdrawal(user_id, 20.0) for user_id in range(1, 11)]
+    db.update_withdrawal_status(withdrawals[0]['id'], "completed")
+    db.update_withdrawal_status(withdrawals[1]['id'], "rejected")
+    
+    for user_id in range(1, 11):
+        db.place_round_bet(user_id, 1, 2.0)
+    db.settle_round(1, {2: 1.5, 4: 3.0})
+    
+    round_id = db.get_open_jackpot_round()['id']
+    for user_id in range(1, 21):
+        db.buy_jackpot_tickets(user_id, round_id, user_id % 4 + 1, 1.0)
+    db.settle_jackpot(round_id, {5: 30.0, 6: 12.5}, tickets=50, pool=50.0, carryover=7.5)
+    db.add_transaction(3, -1.0, "fee", "комиссия")
+    # Архивация переносит доход из журнала в balance_checkpoints
+    assert sum(db.archive_transactions(-1, str(tmp_path / "archive")).values()) > 0
+    
+    stats = db.get_stats()
+    assert db.rebuild_stats() == {}
+    assert db.get_stats() == pytest.approx(stats)
+    assert stats["total_users"] == 20
+    assert stats["pending_withdrawals"] == 8
@@ -0,0 +1,43 @@
+import asyncio
+from datetime import datetime
+
+from aiogram.types import Chat, Message, User
+
+from async_database import AsyncDatabase
+from user_context import UserContextMiddleware
+
+def _update(user_id: int, text: str = "/balance"):
+    user = User(id=user_id, is_bot=False, first_name=f"u{user_id}")
+    message = Message(message_id=1, date=datetime.now(), chat=Chat(id=user_id, type="private"),
+                      from_user=user, text=text)
+    return message, {"event_from_user": user}
+
+def test_context_query_counts(db):
+    db.create_user(1, "u1")
+    adb = AsyncDatabase(db)
+    
+    async def on_unsubscribed(event, user):
+        raise AssertionError("спонсоров нет — все подписаны")
+    
+    async def handler(event, data):
+        # Два одинаковых запроса — два запроса
+        await adb.update_balance(data["user"]["user_id"], 1)
+        await adb.update_balance(data["user"]["user_id"], 1)
+    
+    async def main():
+        middleware = UserContextMiddleware(adb, on_unsubscribed)
+        counts = []
+        for _ in range(2):
+            db._invalidate_user(1)
+            db._invalidate_sponsors()
+            await middleware(handler, *_update(1))  # Холодный: пользователь и подписка из базы
+            counts.append(middleware.stats["context_queries"])
+            await middleware(handler, *_update(1))  # Оба в кэше
+            counts.append(middleware.stats["context_queries"])
+        return middleware.get_stats(), counts
+    
+    stats, counts = asyncio.run(main())
+    assert counts == [2, 2, 4, 4]
+    assert stats["updates"] == 4
+    assert stats["queries"] == 4 + 4 * 2
+    assert stats["max_queries"] == 4
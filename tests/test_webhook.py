@@ -0,0 +1,29 @@
+import asyncio
+
+from aiohttp.test_utils import TestClient, TestServer
+
+from webhook import SECRET_HEADER, WebhookServer
+
+def test_full_queue_answers_503():
+    async def scenario():
+        # Воркеры не запущены: очередь только наполняется
+        server = WebhookServer(bot=None, dp=None, secret="s3cret", queue_size=2)
+        async with TestClient(TestServer(server.app)) as client:
+            statuses = []
+            for update_id in range(4):
+                response = await client.post("/webhook", json={"update_id": update_id},
+                                             headers={SECRET_HEADER: "s3cret"})
+                statuses.append(response.status)
+            wrong = await client.post("/webhook", json={"update_id": 9}, headers={SECRET_HEADER: "nope"})
+        return server, statuses, wrong.status
+    
+    server, statuses, wrong = asyncio.run(scenario())
+    assert statuses == [200, 200, 503, 503]
+    assert wrong == 401
+    stats = server.get_stats()
+    assert stats["received"] == 2
+    assert stats["overflow"] == 2
+    assert stats["rejected"] == 1
+    assert stats["queue_depth"] == stats["max_queue_depth"] == 2
+    # Отклоненные апдейты не попали в очередь — Telegram доставит их повторно
+    assert [server.queue.get_nowait()["update_id"] for _ in range(2)] == [0, 1]
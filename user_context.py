@@ -0,0 +1,101 @@
+import logging
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, Message, TelegramObject
+
+from database import count_queries
+
+logger = logging.getLogger(__name__)
+
+class UserContextMiddleware(BaseMiddleware):
+    """Загрузить пользователя и статус подписок один раз на апдейт.
+    
+    Обработчики получают аргументы `user` (строка users) и `subscribed`
+    и не ходят в базу сами. Пользователь, которого еще нет, создается
+    здесь же (реферер — из `/start <id>`). Неподписанным вместо обработчика
+    вызывается on_unsubscribed(event, user); исключения — команды
+    public_commands, кнопки public_callbacks и администратор.
+    
+    Считает SQL-запросы каждого апдейта (count_queries): загрузка контекста —
+    не больше двух запросов, при попадании в кэши — ни одного.
+    """
+    
+    def __init__(self, db, on_unsubscribed: Callable[[TelegramObject, Dict], Awaitable],
+                 public_commands: Iterable[str] = ("help",),
+                 public_callbacks: Iterable[str] = ("check_subscriptions",),
+                 admin_id: Optional[int] = None):
+        self.db = db
+        self.on_unsubscribed = on_unsubscribed
+        self.public_commands = frozenset(public_commands)
+        self.public_callbacks = frozenset(public_callbacks)
+        self.admin_id = admin_id
+        self.stats = {"updates": 0, "context_queries": 0, "queries": 0, "max_queries": 0, "created": 0}
+    
+    @staticmethod
+    def _command(event: TelegramObject) -> Optional[str]:
+        """Имя команды сообщения (/start@bot arg -> start)"""
+        if isinstance(event, Message) and event.text and event.text.startswith("/"):
+            return event.text.split()[0][1:].split("@")[0]
+        return None
+    
+    def _is_public(self, event: TelegramObject, user_id: int) -> bool:
+        if user_id == self.admin_id:
+            return True
+        if isinstance(event, CallbackQuery):
+            return event.data in self.public_callbacks
+        return self._command(event) in self.public_commands
+    
+    async def _load_user(self, event: TelegramObject, from_user) -> Optional[Dict]:
+        user = await self.db.get_user(from_user.id)
+        if user is not None:
+            return user
+        
+        # Первый апдейт пользователя: реферер приходит в /start <id>
+        referrer_id = None
+        if self._command(event) == "start":
+            parts = event.text.split()
+            if len(parts) > 1 and parts[1].isdigit() and int(parts[1]) != from_user.id:
+                referrer_id = int(parts[1])
+        await self.db.create_user(from_user.id, from_user.username or from_user.first_name, referrer_id)
+        self.stats["created"] += 1
+        return await self.db.get_user(from_user.id)
+    
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        from_user = data.get("event_from_user")
+        if from_user is None:
+            return await handler(event, data)
+        
+        with count_queries() as counter:
+            try:
+                user = await self._load_user(event, from_user)
+                subscribed = await self.db.is_subscribed_to_all(from_user.id)
+                self.stats["context_queries"] += counter[0]
+                
+                if user is None:
+                    logger.error(f"❌ Не удалось загрузить пользователя {from_user.id}")
+                    return None
+                if not subscribed and not self._is_public(event, from_user.id):
+                    return await self.on_unsubscribed(event, user)
+                
+                data["user"] = user
+                data["subscribed"] = subscribed
+                return await handler(event, data)
+            finally:
+                self.stats["updates"] += 1
+                self.stats["queries"] += counter[0]
+                self.stats["max_queries"] = max(self.stats["max_queries"], counter[0])
+                logger.debug(f"Апдейт {from_user.id}: {counter[0]} SQL-запросов")
+    
+    def get_stats(self) -> Dict:
+        updates = self.stats["updates"] or 1
+        return {
+            **self.stats,
+            "context_per_update": self.stats["context_queries"] / updates,
+            "queries_per_update": self.stats["queries"] / updates
+        }
@@ -0,0 +1,61 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, List
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+class UserLocks:
+    """Асинхронные блокировки по user_id.
+    
+    Апдейты одного пользователя обрабатываются по очереди, разных —
+    параллельно. Блокировка живет, пока ее кто-то держит или ждет,
+    поэтому словарь не растет с числом пользователей.
+    """
+    
+    def __init__(self):
+        self._locks: Dict[int, List] = {}  # user_id -> [блокировка, сколько держат и ждут]
+    
+    @asynccontextmanager
+    async def hold(self, user_id: int):
+        entry = self._locks.get(user_id)
+        if entry is None:
+            entry = self._locks[user_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[user_id]
+    
+    def locked(self, user_id: int) -> bool:
+        entry = self._locks.get(user_id)
+        return entry is not None and entry[0].locked()
+    
+    def __len__(self) -> int:
+        return len(self._locks)
+
+class UserLockMiddleware(BaseMiddleware):
+    """Обрабатывать апдейты одного пользователя последовательно.
+    
+    Два быстрых нажатия на одну кнопку не проверяют баланс одновременно:
+    второе видит результат первого. Списания при этом все равно условные
+    в базе (WHERE balance >= ?) — блокировка работает только в процессе.
+    """
+    
+    def __init__(self, locks: UserLocks):
+        self.locks = locks
+    
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user is None:
+            return await handler(event, data)
+        async with self.locks.hold(user.id):
+            return await handler(event, data)
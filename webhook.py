@@ -0,0 +1,120 @@
+import asyncio
+import hmac
+import logging
+from typing import Dict, List, Optional
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+class WebhookServer:
+    """Прием апдейтов по вебхуку вместо long polling.
+    
+    aiohttp-сервер проверяет секретный заголовок, кладет апдейт в
+    ограниченную очередь и сразу отвечает Telegram 200. Апдейты
+    обрабатывают workers фоновых задач через dp.feed_raw_update. Если очередь
+    заполнена, сервер отвечает 503 и Telegram повторит доставку позже —
+    память не растет под нагрузкой.
+    
+    url — публичный адрес (https://example.com); если задан, при запуске
+    вебхук регистрируется в Telegram, max_connections — сколько запросов
+    Telegram шлет одновременно (1-100). Несколько реплик за балансировщиком
+    используют один url и секрет.
+    """
+    
+    def __init__(self, bot: Bot, dp: Dispatcher, secret: str, path: str = "/webhook",
+                 host: str = "0.0.0.0", port: int = 8080, url: str = "",
+                 queue_size: int = 1000, workers: int = 16, max_connections: int = 40):
+        self.bot = bot
+        self.dp = dp
+        self.secret = secret.encode()
+        self.path = path
+        self.host = host
+        self.port = port
+        self.url = url
+        self.workers = workers
+        self.max_connections = max_connections
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.app = web.Application()
+        self.app.router.add_post(path, self._handle)
+        self._runner: Optional[web.AppRunner] = None
+        self._tasks: List[asyncio.Task] = []
+        self.stats = {"received": 0, "rejected": 0, "overflow": 0, "processed": 0,
+                      "failed": 0, "max_queue_depth": 0}
+    
+    async def _handle(self, request: web.Request) -> web.Response:
+        if not hmac.compare_digest(request.headers.get(SECRET_HEADER, "").encode(), self.secret):
+            self.stats["rejected"] += 1
+            return web.Response(status=401)
+        
+        # Разбор в модель — в воркере, ответ Telegram не ждет pydantic
+        try:
+            update = await request.json()
+        except ValueError:
+            return web.Response(status=400)
+        
+        try:
+            self.queue.put_nowait(update)
+        except asyncio.QueueFull:
+            self.stats["overflow"] += 1
+            return web.Response(status=503)
+        
+        self.stats["received"] += 1
+        self.stats["max_queue_depth"] = max(self.stats["max_queue_depth"], self.queue.qsize())
+        return web.Response()
+    
+    async def _worker(self):
+        while True:
+            update = await self.queue.get()
+            try:
+                await self.dp.feed_raw_update(self.bot, update)
+                self.stats["processed"] += 1
+            except Exception as e:
+                self.stats["failed"] += 1
+                logger.error(f"❌ Ошибка обработки апдейта {update.get('update_id')}: {e}")
+            finally:
+                self.queue.task_done()
+    
+    async def start(self):
+        """Запустить воркеры и HTTP-сервер, зарегистрировать вебхук"""
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        
+        if self.url:
+            await self.bot.set_webhook(
+                self.url.rstrip("/") + self.path,
+                secret_token=self.secret.decode(),
+                allowed_updates=self.dp.resolve_used_update_types(),
+                max_connections=self.max_connections
+            )
+        logger.info(f"🌐 Вебхук слушает {self.host}:{self.port}{self.path}, воркеров: {self.workers}")
+    
+    async def serve(self):
+        """Запустить и работать до отмены (замена dp.start_polling)"""
+        await self.start()
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await self.shutdown()
+    
+    async def shutdown(self, timeout: float = 10.0):
+        """Перестать принимать апдейты и дообработать очередь"""
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"⚠️ Вебхук остановлен, необработанных апдейтов: {self.queue.qsize()}")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+    
+    def get_stats(self) -> Dict:
+        return {**self.stats, "queue_depth": self.queue.qsize()}